@@ -12,6 +12,7 @@ from django.core.asgi import get_asgi_application
 from channels.routing import ProtocolTypeRouter, URLRouter
 from channels.auth import AuthMiddlewareStack
 from core.routing import websocket_urlpatterns
+from core.chat import lifespan
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
 
@@ -24,4 +25,5 @@ application = ProtocolTypeRouter({
             websocket_urlpatterns
         )
     ),
+    "lifespan": lifespan,
 })
\ No newline at end of file
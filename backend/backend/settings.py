@@ -12,7 +12,7 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 
 from pathlib import Path
 import cloudinary
-from datetime import timedelta
+from datetime import datetime, timedelta, timezone
 
 #import django
 #django.setup()
@@ -45,6 +45,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'corsheaders', 
     'rest_framework', 
     'rest_framework_simplejwt',
@@ -80,6 +81,7 @@ CORS_ALLOW_HEADERS = [
 ]
 
 CORS_ALLOW_ALL_ORIGINS=True #
+CORS_EXPOSE_HEADERS = ['Link']
 
 ROOT_URLCONF = 'backend.urls'
 
@@ -244,6 +246,63 @@ CHANNEL_LAYERS = {
     },
 }
 
+#Cache
+SHARED_CACHE = bool(os.getenv('CACHE_REDIS_URL'))
+if SHARED_CACHE:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('CACHE_REDIS_URL'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+# Cache odpowiedzi tylko ze współdzielonym Redisem: w LocMem podbicie wersji w jednym procesie
+# nie unieważnia kopii w pozostałych workerach (timeout 0 = bez cache)
+RESTAURANT_LIST_CACHE_TIMEOUT = 10 * 60 if SHARED_CACHE else 0
+CITY_LIST_CACHE_TIMEOUT = 60 * 60 if SHARED_CACHE else 0
+MENU_CACHE_TIMEOUT = 24 * 60 * 60 if SHARED_CACHE else 0
+MENU_VERSION_CACHE_TIMEOUT = 60 if SHARED_CACHE else 0
+
+#Cart
+CART_BACKEND = os.getenv('CART_BACKEND', 'core.carts.DatabaseCartBackend')
+CART_REDIS_URL = os.getenv('CART_REDIS_URL', 'redis://redis:6379/1')
+
+#Background jobs
+CART_MAX_AGE = timedelta(hours=24)
+CART_REAPER_BATCH_SIZE = 500
+ORDER_ARCHIVE_AFTER = timedelta(hours=24)
+ORDER_CHANGES_LAG = timedelta(seconds=2)
+OUTBOX_BATCH_SIZE = 100
+OUTBOX_MAX_ATTEMPTS = 10
+OUTBOX_MAX_BACKOFF = 300
+POPULARITY_EPOCH = datetime(2025, 1, 1, tzinfo=timezone.utc)
+POPULARITY_HALF_LIFE = timedelta(days=7)
+POPULARITY_WINDOW = 20 * POPULARITY_HALF_LIFE
+
+# Uruchamiane przez `manage.py run_periodic_jobs` (osobna usługa), wysyłkę outboxu obsługuje `dispatch_outbox --loop`
+PERIODIC_JOBS = {
+    'core.jobs.reap_stale_carts': 15 * 60,
+    'core.jobs.archive_orders': 5 * 60,
+    'core.jobs.rollup_popularity': 60 * 60,
+}
+
+#Chat
+CHAT_BUFFER_BATCH_SIZE = 100
+CHAT_BUFFER_FLUSH_INTERVAL = 0.2  # sekundy
+CHAT_BUFFER_MAX_SIZE = 1000
+CHAT_BUFFER_MAX_ATTEMPTS = 3
+CHAT_BUFFER_RETRY_DELAY = 1  # sekundy
+CHAT_NODE_ID = int(os.getenv('CHAT_NODE_ID', '0'))  # 0-1023, osobny dla każdego procesu tworzącego wiadomości czatu
+CHAT_REPLAY_SIZE = 50
+CHAT_REPLAY_LIMIT = 200
+CHAT_REPLAY_TIMEOUT = 24 * 60 * 60
+CHAT_PRESENCE_TIMEOUT = 60  # sekundy, klient wysyła ping częściej
+
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
@@ -47,6 +47,10 @@ urlpatterns = [
     path('api/restaurant/<int:restaurant_id>/add-delivery-city/', AddDeliveryCityView.as_view(), name='add-delivery-city'),
     path('api/restaurant/<int:restaurant_id>/remove-delivery-city/', RemoveDeliveryCityView.as_view(), name='remove-delivery-city'),
     
+    #DeliveryZone
+    path('api/restaurant/<int:restaurant_id>/delivery-zones/', DeliveryZoneListCreateView.as_view(), name='delivery-zone-list'),
+    path('api/restaurant/<int:restaurant_id>/delivery-zones/<int:pk>/', DeliveryZoneDeleteView.as_view(), name='delivery-zone-delete'),
+    
     #Cloudinary
     path('api/generate-signature/', generateUploadSignature, name='generate_upload_signature'),
     path('api/restaurant/<int:pk>/delete-image/', DeleteRestaurantImageView.as_view(), name='delete-restaurant-image'),
@@ -57,8 +61,13 @@ urlpatterns = [
     path('api/tag/add/', TagCreateView.as_view(), name='tag-add'),
     path('api/restaurant/<int:pk>/tags/list', RestaurantTagListView.as_view(), name='restaurant-tag-list'),
     path('api/restaurants/filter-by-tags/', FilterRestaurantsByTagsView.as_view(), name='filter-restaurants-by-tags'),
+    path('api/restaurants/browse/', RestaurantBrowseView.as_view(), name='restaurant-browse'),
     path('api/restaurant/<int:pk>/tags/update', RestaurantTagUpdateView.as_view(), name='restaurant-tag-update'),
     
+    #Search
+    path('api/search/', SearchView.as_view(), name='search'),
+    path('api/autocomplete/', AutocompleteView.as_view(), name='autocomplete'),
+    
     #Product
     path('api/restaurant/add-product/', ProductCreateView.as_view(), name='add-product'),
     path('api/restaurant/<int:restaurant_id>/products/', ProductListView.as_view(), name='product-list'),
@@ -70,6 +79,7 @@ urlpatterns = [
     #Cart
     path('api/cart/<str:session_id>/', CartListCreateView.as_view(), name='cart-detail'),
     path('api/cart/<str:session_id>/items/', CartItemListCreateView.as_view(), name='cartitem-list-create'),
+    path('api/cart/<str:session_id>/items/bulk/', CartItemBulkCreateView.as_view(), name='cartitem-bulk-create'),
     path('api/cart/<str:session_id>/items/<int:pk>/', CartItemRetrieveUpdateDestroyView.as_view(), name='cartitem-detail'),
     path('api/cart/<str:session_id>/clear/<int:restaurant_id>/', ClearCartItemsFromOtherRestaurantsView.as_view(), name='clear-cart-items'),
     path('api/cart/<int:cart_id>/restaurant-info/', CartRestaurantInfoView.as_view(), name='cart-restaurant-info'),
@@ -79,6 +89,7 @@ urlpatterns = [
     path('api/orders/<int:pk>/', OrderDetailView.as_view(), name='order-detail'),
     path('api/user/orders/', UserOrderListView.as_view(), name='user-order-list'),
     path('api/restaurant/<int:restaurant_id>/orders/', RestaurantOrdersView.as_view(), name='restaurant-orders'),
+    path('api/restaurant/<int:restaurant_id>/orders/changes/', RestaurantOrderChangesView.as_view(), name='restaurant-order-changes'),
     path('api/user/orders/<int:pk>/', UserOrderDetailView.as_view(), name='user-order-detail'),
     
     #ArchivedOrder
@@ -1,5 +1,6 @@
-from django.contrib import admin
-from .models import AppUser, Restaurant, Tag, City, Order, Address, Cart, CartItem, OrderHistory, ChatMessage
+from django import forms
+from django.contrib import admin, messages
+from .models import AppUser, Restaurant, DeliveryZone, Tag, City, Order, Address, Cart, CartItem, OrderHistory, ChatMessage, OutboxMessage, InvalidStatusTransition, StatusConflict
 from django.urls import reverse
 from django.utils.html import format_html
 
@@ -11,10 +12,15 @@ class TagAdmin(admin.ModelAdmin):
     
 admin.site.register(City)
 
+class DeliveryZoneInline(admin.TabularInline):
+    model = DeliveryZone
+    extra = 1
+
 @admin.register(Restaurant)
 class RestaurantAdmin(admin.ModelAdmin):
     list_display = ['name', 'owner', 'phone_number']
     filter_horizontal = ['tags']  
+    inlines = [DeliveryZoneInline]
     
 @admin.register(Address)
 class AddressAdmin(admin.ModelAdmin):
@@ -42,11 +48,29 @@ class ChatMessageInline(admin.TabularInline):
     def get_queryset(self, request):
         qs = super().get_queryset(request)
         if hasattr(self, 'parent_object') and self.parent_object:
-            return qs.filter(room=self.parent_object.order_id)
+            return qs.filter(order=self.parent_object)
         return qs.none()
 
+class OrderAdminForm(forms.ModelForm):
+    class Meta:
+        model = Order
+        fields = '__all__'
+
+    def clean_status(self):
+        status = self.cleaned_data['status']
+        initial_status = self.initial.get('status')
+        if self.instance.pk and status != initial_status:
+            # Widok zmiany w adminie działa w transakcji - blokada wiersza trwa do zapisu w save_model
+            try:
+                self.instance.check_transition(status, is_admin=True, expected_status=initial_status)
+                self.instance.lock_status(initial_status)
+            except (InvalidStatusTransition, StatusConflict) as e:
+                raise forms.ValidationError(str(e))
+        return status
+
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
+    form = OrderAdminForm
     list_display = ['order_id', 'user', 'restaurant', 'status', 'created_at', 'updated_at', 'archived', 'restaurant']
     list_filter = ['status', 'created_at', 'updated_at', 'archived', 'restaurant'] 
     search_fields = ['order_id', 'user__email', 'restaurant__name']
@@ -65,22 +89,30 @@ class OrderAdmin(admin.ModelAdmin):
         return inline_instances
     
     def save_model(self, request, obj, form, change):
-        if change and 'status' in form.changed_data and obj.status == 'suspended':
-            default_description = "Zamówienie zostało wstrzymane przez administratora"
+        status_changed = change and 'status' in form.changed_data
+        if status_changed:
+            # Każda zmiana statusu przez update_status: historia, powiadomienia i zdarzenie czatu
+            default_description = {
+                'suspended': "Zamówienie zostało wstrzymane przez administratora",
+                'resumed': "Zamówienie zostało wznowione przez administratora",
+                'cancelled': "Zamówienie zostało anulowane przez administratora",
+            }.get(obj.status, "Status zamówienia został zmieniony przez administratora")
             additional_description = form.cleaned_data.get('description', '')
             full_description = f"{default_description}. {additional_description}" if additional_description else default_description
-            obj.update_status('suspended', description=full_description, is_admin=request.user.is_superuser)
-        elif obj.status == 'resumed':
-            default_description = "Zamówienie zostało wznowione przez administratora"
-            additional_description = form.cleaned_data.get('description', '')
-            full_description = f"{default_description}. {additional_description}" if additional_description else default_description
-            obj.update_status('resumed', description=full_description, is_admin=request.user.is_superuser)
-        elif change and 'status' in form.changed_data and obj.status == 'cancelled':
-            default_description = "Zamówienie zostało anulowane przez administratora"
-            additional_description = form.cleaned_data.get('description', '')
-            full_description = f"{default_description}. {additional_description}" if additional_description else default_description
-            obj.update_status('cancelled', description=full_description, is_admin=request.user.is_superuser)
-            obj.archived = True  
-            obj.save()
+            try:
+                obj.update_status(obj.status, description=full_description, is_admin=True, expected_status=form.initial['status'])
+            except (InvalidStatusTransition, StatusConflict) as e:
+                self.message_user(request, str(e), level=messages.ERROR)
+                return
+            if obj.status == 'cancelled':
+                obj.archived = True
+            if obj.archived or set(form.changed_data) - {'status', 'description'}:
+                super().save_model(request, obj, form, change)
         else:
-            super().save_model(request, obj, form, change)
\ No newline at end of file
+            super().save_model(request, obj, form, change)
+
+@admin.register(OutboxMessage)
+class OutboxMessageAdmin(admin.ModelAdmin):
+    list_display = ['id', 'group', 'created_at', 'available_at', 'attempts', 'last_error']
+    list_filter = ['attempts']
+    readonly_fields = ['group', 'payload', 'created_at']
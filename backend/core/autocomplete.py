@@ -0,0 +1,77 @@
+import threading
+import unicodedata
+from bisect import bisect_left
+from .cache import shared_version
+from .models import Address, City, Restaurant, Tag
+
+AUTOCOMPLETE_CACHE = 'autocomplete'
+
+# Litery, których NFKD nie rozkłada na literę bazową i znak diakrytyczny
+FOLD_TABLE = str.maketrans({'ł': 'l', 'Ł': 'L', 'ø': 'o', 'Ø': 'O', 'đ': 'd', 'Đ': 'D'})
+
+def fold(text):
+    """Normalizacja do wyszukiwania prefiksowego: bez znaków diakrytycznych, małe litery, pojedyncze spacje."""
+    text = unicodedata.normalize('NFKD', (text or '').translate(FOLD_TABLE))
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    return ' '.join(text.casefold().split())
+
+class AutocompleteIndex:
+    """
+    Posortowane tablice kluczy (po znormalizowaniu) dla miast, tagów i nazw restauracji,
+    przeszukiwane binarnie. Każde słowo nazwy jest osobnym kluczem, więc "mle" znajduje
+    "Bar Mleczny". Przebudowywane przy pierwszym użyciu po zmianie wersji w cache,
+    którą podbijają sygnały (core/signals.py); bez wspólnego cache przy każdym użyciu.
+    """
+    kinds = ('cities', 'tags', 'restaurants')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.version = None
+        self.index = {kind: ([], []) for kind in self.kinds}
+
+    def ensure_current(self):
+        version = shared_version(AUTOCOMPLETE_CACHE)
+        if version is None or version != self.version:
+            with self._lock:
+                if version is None or version != self.version:
+                    self.rebuild(version)
+
+    def rebuild(self, version):
+        city_names = set(City.objects.values_list('name', flat=True))
+        city_names.update(Address.objects.filter(owner_role='restaurateur').values_list('city', flat=True).distinct())
+        sources = {
+            'cities': [(name, name) for name in city_names],
+            'tags': [(tag_id, {'id': tag_id, 'name': name}) for tag_id, name in Tag.objects.values_list('id', 'name')],
+            'restaurants': [(restaurant_id, {'id': restaurant_id, 'name': name}) for restaurant_id, name in Restaurant.objects.values_list('id', 'name')],
+        }
+        index = {}
+        for kind, items in sources.items():
+            entries = []
+            for identity, value in items:
+                words = fold(value if kind == 'cities' else value['name']).split(' ')
+                for i in range(len(words)):
+                    entries.append((' '.join(words[i:]), i, identity, value))
+            entries.sort(key=lambda entry: entry[:3])
+            index[kind] = ([entry[0] for entry in entries], [(entry[2], entry[3]) for entry in entries])
+        self.index = index
+        self.version = version
+
+    def search(self, text, kinds, limit):
+        """Wyniki dla każdego z `kinds`; jedno sprawdzenie wersji (lub przebudowa) na zapytanie."""
+        self.ensure_current()
+        index, prefix = self.index, fold(text)
+        return {kind: self._search(index[kind], prefix, limit) for kind in kinds}
+
+    def _search(self, entries, prefix, limit):
+        keys, values = entries
+        results, seen = [], set()
+        index = bisect_left(keys, prefix)
+        while index < len(keys) and keys[index].startswith(prefix) and len(results) < limit:
+            identity, value = values[index]
+            if identity not in seen:
+                seen.add(identity)
+                results.append(value)
+            index += 1
+        return results
+
+autocomplete_index = AutocompleteIndex()
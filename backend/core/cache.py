@@ -0,0 +1,40 @@
+import time
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+def _version_key(namespace):
+    return f'version:{namespace}'
+
+def get_version(namespace):
+    key = _version_key(namespace)
+    version = cache.get(key)
+    if version is None:
+        # Start od znacznika czasu, żeby po utracie klucza nie wrócić do starej wersji
+        cache.add(key, int(time.time() * 1000), None)
+        version = cache.get(key)
+    return version
+
+def shared_version(namespace):
+    """
+    Wersja dla indeksów w pamięci procesu. Bez wspólnego cache (SHARED_CACHE) zwraca None:
+    podbicie wersji w innym workerze byłoby niewidoczne, więc indeks czyta bazę przy każdym użyciu.
+    """
+    return get_version(namespace) if settings.SHARED_CACHE else None
+
+def bump_version(namespace):
+    try:
+        return cache.incr(_version_key(namespace))
+    except ValueError:
+        return get_version(namespace)
+
+def invalidate(namespace):
+    """
+    Unieważnia od razu i ponownie po commicie, żeby równoległy odczyt nie zapisał
+    w cache danych sprzed zatwierdzenia transakcji.
+    """
+    bump_version(namespace)
+    transaction.on_commit(lambda: bump_version(namespace))
+
+def versioned_key(namespace, *parts):
+    return ':'.join([namespace, str(get_version(namespace)), *[str(part) for part in parts]])
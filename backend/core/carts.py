@@ -0,0 +1,333 @@
+import threading
+import time
+from datetime import datetime, timezone as dt_timezone
+from decimal import Decimal
+from functools import lru_cache
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import transaction
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+from .models import Cart, CartItem, Product
+
+#Backend
+@lru_cache(maxsize=None)
+def get_cart_backend():
+    return import_string(settings.CART_BACKEND)()
+
+@receiver(setting_changed)
+def reset_cart_backend(setting, **kwargs):
+    if setting in ('CART_BACKEND', 'CART_REDIS_URL'):
+        get_cart_backend.cache_clear()
+
+class DatabaseCartBackend:
+    """
+    Koszyki trzymane w tabelach Cart/CartItem od pierwszego dodanego produktu.
+    """
+    def _carts(self):
+        return Cart.objects.with_items()
+
+    def get_cart(self, session_id):
+        cart = self._carts().filter(session_id=session_id).first()
+        if cart is None:
+            return None
+
+        unavailable = [item.id for item in cart.items.all() if not item.product.is_available]
+        if unavailable:
+            CartItem.objects.filter(id__in=unavailable).delete()
+            cart.update_total_price()
+            cart = self._carts().get(pk=cart.pk)
+        return cart
+
+    def create_cart(self, session_id):
+        Cart.objects.get_or_create(session_id=session_id)
+        return self._carts().get(session_id=session_id)
+
+    def get_item(self, session_id, item_id):
+        return CartItem.objects.select_related('product').filter(cart__session_id=session_id, pk=item_id).first()
+
+    def add_items(self, session_id, products, quantities):
+        with transaction.atomic():
+            cart, created = Cart.objects.get_or_create(session_id=session_id)
+            existing_items = CartItem.objects.select_for_update().filter(cart=cart, product_id__in=list(quantities))
+            existing_items = {item.product_id: item for item in existing_items}
+
+            for product_id, item in existing_items.items():
+                item.quantity += quantities[product_id]
+            CartItem.objects.bulk_update(existing_items.values(), ['quantity'])
+            CartItem.objects.bulk_create([
+                CartItem(cart=cart, product=products[product_id], quantity=quantity, price=products[product_id].price)
+                for product_id, quantity in quantities.items() if product_id not in existing_items
+            ])
+            cart.update_total_price()
+        return self._carts().get(pk=cart.pk)
+
+    def update_item(self, session_id, item_id, quantity):
+        item = self.get_item(session_id, item_id)
+        if item is None:
+            return None
+        item.quantity = quantity
+        item.save()
+        return item
+
+    def remove_item(self, session_id, item_id):
+        item = self.get_item(session_id, item_id)
+        if item is None:
+            return False
+        item.delete()
+        return True
+
+    def remove_other_restaurants(self, session_id, restaurant_id):
+        cart = Cart.objects.filter(session_id=session_id).first()
+        if cart is None:
+            return None
+        deleted, _ = CartItem.objects.filter(cart=cart).exclude(product__restaurant_id=restaurant_id).delete()
+        if deleted:
+            cart.update_total_price()
+        return deleted
+
+    def checkout(self, session_id):
+        return Cart.objects.filter(session_id=session_id).first()
+
+#Redis
+class SessionCartItems(list):
+    def all(self):
+        return self
+
+    def first(self):
+        return self[0] if self else None
+
+class SessionCartItem:
+    def __init__(self, product, quantity, created_at):
+        self.id = product.id
+        self.product = product
+        self.product_id = product.id
+        self.quantity = quantity
+        self.price = product.price
+        self.created_at = created_at
+
+    @property
+    def line_total(self):
+        return self.price * self.quantity
+
+class SessionCart:
+    id = None
+
+    def __init__(self, session_id, created_at, items):
+        self.session_id = session_id
+        self.created_at = created_at
+        self.items = SessionCartItems(sorted(items, key=lambda item: item.created_at))
+        self.total_price = sum((item.line_total for item in self.items), Decimal('0.00'))
+
+def _timestamp_to_datetime(value):
+    return datetime.fromtimestamp(float(value), tz=dt_timezone.utc)
+
+class RedisCartBackend:
+    """
+    Koszyki anonimowych sesji trzymane w hashu Redis z natywnym TTL.
+    Do tabel Cart/CartItem trafiają dopiero przy składaniu zamówienia.
+
+    Układ hasha cart:<session_id>:
+        created_at  - znacznik czasu utworzenia koszyka
+        q:<product> - ilość produktu
+        t:<product> - znacznik czasu dodania produktu
+    """
+    def __init__(self, client=None):
+        self.client = client or redis_client(settings.CART_REDIS_URL)
+        self.ttl = int(settings.CART_MAX_AGE.total_seconds())
+
+    def _key(self, session_id):
+        return f'cart:{session_id}'
+
+    def _touch(self, pipe, session_id):
+        key = self._key(session_id)
+        pipe.hsetnx(key, 'created_at', time.time())
+        pipe.expire(key, self.ttl)
+
+    def _load(self, session_id):
+        data = self.client.hgetall(self._key(session_id))
+        if not data:
+            return None, {}, {}
+        quantities, added = {}, {}
+        for field, value in data.items():
+            if field.startswith('q:'):
+                quantities[int(field[2:])] = int(value)
+            elif field.startswith('t:'):
+                added[int(field[2:])] = _timestamp_to_datetime(value)
+        created_at = _timestamp_to_datetime(data.get('created_at', time.time()))
+        return created_at, quantities, added
+
+    def get_cart(self, session_id):
+        created_at, quantities, added = self._load(session_id)
+        if created_at is None:
+            return None
+
+        products = Product.objects.select_related('restaurant').prefetch_related(
+            'restaurant__tags', 'restaurant__delivery_cities'
+        ).in_bulk(list(quantities))
+        unavailable = [product_id for product_id in quantities if product_id not in products or not products[product_id].is_available]
+        if unavailable:
+            self.client.hdel(self._key(session_id), *[f'{prefix}:{product_id}' for product_id in unavailable for prefix in ('q', 't')])
+
+        items = [
+            SessionCartItem(products[product_id], quantity, added.get(product_id, created_at))
+            for product_id, quantity in quantities.items() if product_id not in unavailable
+        ]
+        return SessionCart(session_id, created_at, items)
+
+    def create_cart(self, session_id):
+        pipe = self.client.pipeline()
+        self._touch(pipe, session_id)
+        pipe.execute()
+        return self.get_cart(session_id)
+
+    def get_item(self, session_id, item_id):
+        cart = self.get_cart(session_id)
+        if cart is None:
+            return None
+        return next((item for item in cart.items if item.id == item_id), None)
+
+    def add_items(self, session_id, products, quantities):
+        key = self._key(session_id)
+        now = time.time()
+        pipe = self.client.pipeline()
+        for product_id, quantity in quantities.items():
+            pipe.hincrby(key, f'q:{product_id}', quantity)
+            pipe.hsetnx(key, f't:{product_id}', now)
+        self._touch(pipe, session_id)
+        pipe.execute()
+        return self.get_cart(session_id)
+
+    def update_item(self, session_id, item_id, quantity):
+        key = self._key(session_id)
+        if not self.client.hexists(key, f'q:{item_id}'):
+            return None
+        pipe = self.client.pipeline()
+        pipe.hset(key, f'q:{item_id}', quantity)
+        self._touch(pipe, session_id)
+        pipe.execute()
+        return self.get_item(session_id, item_id)
+
+    def remove_item(self, session_id, item_id):
+        return bool(self.client.hdel(self._key(session_id), f'q:{item_id}', f't:{item_id}'))
+
+    def remove_other_restaurants(self, session_id, restaurant_id):
+        cart = self.get_cart(session_id)
+        if cart is None:
+            return None
+        other_items = [item.id for item in cart.items if item.product.restaurant_id != restaurant_id]
+        if other_items:
+            self.client.hdel(self._key(session_id), *[f'{prefix}:{item_id}' for item_id in other_items for prefix in ('q', 't')])
+        return len(other_items)
+
+    def checkout(self, session_id):
+        session_cart = self.get_cart(session_id)
+        if session_cart is None or not session_cart.items:
+            return None
+
+        cart = Cart.objects.create(session_id=None)
+        CartItem.objects.bulk_create([
+            CartItem(cart=cart, product=item.product, quantity=item.quantity, price=item.price)
+            for item in session_cart.items
+        ])
+        cart.update_total_price()
+        key = self._key(session_id)
+        transaction.on_commit(lambda: self.client.delete(key))
+        return cart
+
+def redis_client(url):
+    if url.startswith('memory://'):
+        return InMemoryRedis()
+    import redis
+    return redis.Redis.from_url(url, decode_responses=True)
+
+class InMemoryRedis:
+    """
+    Zamiennik klienta Redis na potrzeby testów i developmentu (tylko komendy używane przez koszyk).
+    """
+    def __init__(self):
+        self._hashes = {}
+        self._expires = {}
+        self._lock = threading.RLock()
+
+    def _hash(self, key, create=False):
+        expires = self._expires.get(key)
+        if expires is not None and expires <= time.monotonic():
+            self._hashes.pop(key, None)
+            self._expires.pop(key, None)
+        if create:
+            return self._hashes.setdefault(key, {})
+        return self._hashes.get(key, {})
+
+    def hgetall(self, key):
+        with self._lock:
+            return dict(self._hash(key))
+
+    def hexists(self, key, field):
+        with self._lock:
+            return field in self._hash(key)
+
+    def hset(self, key, field, value):
+        with self._lock:
+            data = self._hash(key, create=True)
+            created = field not in data
+            data[field] = str(value)
+            return int(created)
+
+    def hsetnx(self, key, field, value):
+        with self._lock:
+            data = self._hash(key, create=True)
+            if field in data:
+                return 0
+            data[field] = str(value)
+            return 1
+
+    def hincrby(self, key, field, amount=1):
+        with self._lock:
+            data = self._hash(key, create=True)
+            data[field] = str(int(data.get(field, 0)) + amount)
+            return int(data[field])
+
+    def hdel(self, key, *fields):
+        with self._lock:
+            data = self._hash(key)
+            removed = sum(1 for field in fields if data.pop(field, None) is not None)
+            if not data:
+                self.delete(key)
+            return removed
+
+    def expire(self, key, seconds):
+        with self._lock:
+            self._hash(key)
+            if key not in self._hashes:
+                return False
+            self._expires[key] = time.monotonic() + seconds
+            return True
+
+    def delete(self, *keys):
+        with self._lock:
+            removed = 0
+            for key in keys:
+                removed += int(self._hashes.pop(key, None) is not None)
+                self._expires.pop(key, None)
+            return removed
+
+    def pipeline(self, transaction=True):
+        return InMemoryPipeline(self)
+
+class InMemoryPipeline:
+    def __init__(self, client):
+        self.client = client
+        self.commands = []
+
+    def __getattr__(self, name):
+        def queue(*args, **kwargs):
+            self.commands.append((name, args, kwargs))
+            return self
+        return queue
+
+    def execute(self):
+        with self.client._lock:
+            results = [getattr(self.client, name)(*args, **kwargs) for name, args, kwargs in self.commands]
+        self.commands = []
+        return results
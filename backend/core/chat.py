@@ -0,0 +1,226 @@
+import asyncio
+import logging
+from channels.db import database_sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from .models import ChatMessage, Notification
+
+logger = logging.getLogger(__name__)
+
+#Replay
+def replay_keys(room, sequence):
+    return f'chat_replay_seq:{room}', f'chat_replay:{room}:{sequence % settings.CHAT_REPLAY_SIZE}'
+
+def remember_message(room, payload):
+    """Dopisuje rozesłaną wiadomość do pierścienia ostatnich CHAT_REPLAY_SIZE wiadomości pokoju w cache."""
+    sequence_key, _ = replay_keys(room, 0)
+    cache.add(sequence_key, 0, settings.CHAT_REPLAY_TIMEOUT)
+    try:
+        sequence = cache.incr(sequence_key)
+    except ValueError:
+        return
+    _, slot_key = replay_keys(room, sequence)
+    cache.set(slot_key, (sequence, payload), settings.CHAT_REPLAY_TIMEOUT)
+
+def recent_messages(room):
+    sequence_key, _ = replay_keys(room, 0)
+    last = cache.get(sequence_key)
+    if not last:
+        return [], False
+    first = max(last - settings.CHAT_REPLAY_SIZE + 1, 1)
+    slots = cache.get_many([replay_keys(room, sequence)[1] for sequence in range(first, last + 1)])
+    entries = [entry for entry in slots.values() if first <= entry[0] <= last]
+    complete = len(entries) == last - first + 1
+    return [payload for _, payload in sorted(entries, key=lambda entry: entry[0])], complete
+
+def missed_messages(room, order_id, last_id):
+    """
+    Wiadomości pokoju nowsze od last_id (najwyżej CHAT_REPLAY_LIMIT) i informacja, czy to wszystkie.
+    Najpierw z pierścienia w cache; gdy nie sięga last_id, z bazy po indeksie (order, id)
+    uzupełnionej pierścieniem o wiadomości jeszcze czekające w buforze zapisu.
+    Bez wspólnego cache (SHARED_CACHE) pierścień zna tylko wiadomości z tego procesu,
+    więc baza jest odpytywana zawsze.
+    """
+    recent, complete = recent_messages(room)
+    if not (settings.SHARED_CACHE and complete and recent and int(recent[0]['id']) <= last_id):
+        stored = ChatMessage.objects.filter(order_id=order_id, id__gt=last_id).order_by('id')
+        known = {payload['id'] for payload in recent}
+        recent += [
+            chat_message_payload(chat_message)
+            for chat_message in stored[:settings.CHAT_REPLAY_LIMIT + 1]
+            if str(chat_message.id) not in known
+        ]
+    missed = sorted((payload for payload in recent if int(payload['id']) > last_id), key=lambda payload: int(payload['id']))
+    return missed[:settings.CHAT_REPLAY_LIMIT], len(missed) <= settings.CHAT_REPLAY_LIMIT
+
+def chat_message_payload(chat_message):
+    # Id jako napis: przekracza 2**53 i JSON.parse w przeglądarce by je zaokrąglił
+    return {
+        'id': str(chat_message.id),
+        'user': chat_message.user_id,
+        'message': chat_message.message,
+        'timestamp': chat_message.timestamp.isoformat(),
+    }
+
+#Presence
+def presence_key(room, user_id):
+    return f'chat_presence:{room}:{user_id}'
+
+def join_room(room, user_id):
+    """Liczba połączeń użytkownika z pokojem; klucz wygasa po CHAT_PRESENCE_TIMEOUT bez pingów."""
+    key = presence_key(room, user_id)
+    cache.add(key, 0, settings.CHAT_PRESENCE_TIMEOUT)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, settings.CHAT_PRESENCE_TIMEOUT)
+        return 1
+
+def leave_room(room, user_id):
+    """
+    Zwraca True, gdy było to ostatnie połączenie użytkownika z pokojem. Po wygaśnięciu klucza
+    liczba połączeń jest nieznana (mogą być inne otwarte), więc bez rozgłaszania zwraca False.
+    """
+    key = presence_key(room, user_id)
+    try:
+        connections = cache.decr(key)
+    except ValueError:
+        return False
+    if connections <= 0:
+        cache.delete(key)
+        return True
+    return False
+
+def refresh_presence(room, user_id):
+    if not cache.touch(presence_key(room, user_id), settings.CHAT_PRESENCE_TIMEOUT):
+        cache.add(presence_key(room, user_id), 1, settings.CHAT_PRESENCE_TIMEOUT)
+
+def is_online(room, user_id):
+    return (cache.get(presence_key(room, user_id)) or 0) > 0
+
+#Write-behind
+
+class ChatWriteBuffer:
+    """
+    Bufor zapisu wiadomości czatu (write-behind). ChatConsumer rozsyła wiadomość od razu
+    i odkłada ją tutaj; worker zapisuje wiadomości i powiadomienia przez bulk_create co
+    CHAT_BUFFER_FLUSH_INTERVAL sekund albo po CHAT_BUFFER_BATCH_SIZE wiadomościach.
+    Kolejka ma limit CHAT_BUFFER_MAX_SIZE: gdy baza nie nadąża, put() czeka (backpressure).
+    put() zwraca future rozwiązywaną po zapisie partii, więc połączenie przy rozłączeniu
+    czeka tylko na własne wiadomości. Jeden worker na pętlę zdarzeń procesu.
+
+    Zamknięcie serwera: lifespan() poniżej czeka na zapis całej kolejki (uvicorn, hypercorn).
+    Daphne nie wysyła zdarzeń lifespan, ale przy zamykaniu rozłącza wszystkie WebSockety,
+    a każde rozłączenie czeka na zapis wiadomości swojego połączenia.
+    """
+    def __init__(self):
+        self.loop = None
+        self.queue = None
+        self.worker = None
+        self.writing = None
+
+    def _start(self):
+        loop = asyncio.get_running_loop()
+        if self.loop is not loop or self.worker.done():
+            self.loop = loop
+            self.queue = asyncio.Queue(maxsize=settings.CHAT_BUFFER_MAX_SIZE)
+            self.worker = loop.create_task(self._run())
+            self.writing = None
+
+    async def put(self, chat_message, notification):
+        self._start()
+        written = self.loop.create_future()
+        await self.queue.put((chat_message, notification, written))
+        return written
+
+    async def flush(self):
+        """Czeka, aż wszystkie odłożone wiadomości zostaną zapisane (zamknięcie serwera)."""
+        if self.loop is asyncio.get_running_loop() and not self.worker.done():
+            await self.queue.join()
+
+    async def _run(self):
+        batch = []
+        try:
+            while True:
+                batch.append(await self.queue.get())
+                deadline = self.loop.time() + settings.CHAT_BUFFER_FLUSH_INTERVAL
+                while len(batch) < settings.CHAT_BUFFER_BATCH_SIZE:
+                    # asyncio.timeout zamiast wait_for: wait_for gubi anulowanie, gdy element przyjdzie w tej samej chwili
+                    try:
+                        async with asyncio.timeout_at(deadline):
+                            batch.append(await self.queue.get())
+                    except TimeoutError:
+                        break
+                # Zapis osłonięty przed anulowaniem: przy zamknięciu dokończy się, zamiast trafić do bazy drugi raz
+                self.writing = asyncio.ensure_future(self._write(batch))
+                written, batch = len(batch), []
+                await asyncio.shield(self.writing)
+                for _ in range(written):
+                    self.queue.task_done()
+        except asyncio.CancelledError:
+            # Zamknięcie pętli: dokończenie bieżącego zapisu i zapis tego, co zostało w kolejce
+            if self.writing is not None and not self.writing.done():
+                await self.writing
+            while not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+            if batch:
+                await self._write(batch, attempts=1)
+            raise
+
+    async def _write(self, batch, attempts=None):
+        try:
+            await self._save([(chat_message, notification) for chat_message, notification, _ in batch], attempts)
+        finally:
+            for _, _, written in batch:
+                if not written.done():
+                    written.set_result(None)
+
+    async def _save(self, batch, attempts=None):
+        """Zapis partii z ponowieniami; gdy się nie uda, wiersz po wierszu, żeby jeden błędny nie zabrał reszty."""
+        attempts = attempts or settings.CHAT_BUFFER_MAX_ATTEMPTS
+        for attempt in range(1, attempts + 1):
+            try:
+                await database_sync_to_async(write_batch)(batch)
+                return
+            except Exception:
+                logger.exception(f"Saving {len(batch)} chat messages failed (attempt {attempt})")
+                if attempt < attempts:
+                    await asyncio.sleep(settings.CHAT_BUFFER_RETRY_DELAY)
+        try:
+            dropped = await database_sync_to_async(write_rows)(batch)
+        except Exception:
+            logger.exception("Saving chat messages one by one failed")
+            dropped = len(batch)
+        if dropped:
+            logger.error(f"Dropped {dropped} of {len(batch)} chat messages")
+
+def write_batch(batch):
+    with transaction.atomic():
+        ChatMessage.objects.bulk_create([chat_message for chat_message, _ in batch])
+        Notification.send_many([notification for _, notification in batch if notification is not None])
+    logger.debug(f"Saved {len(batch)} chat messages")
+
+def write_rows(batch):
+    """Zapis każdej wiadomości (z powiadomieniem) osobno; zwraca liczbę odrzuconych."""
+    dropped = 0
+    for chat_message, notification in batch:
+        try:
+            write_batch([(chat_message, notification)])
+        except Exception:
+            logger.exception(f"Dropped chat message {chat_message.id} in room {chat_message.room}")
+            dropped += 1
+    return dropped
+
+chat_buffer = ChatWriteBuffer()
+
+async def lifespan(scope, receive, send):
+    """Aplikacja ASGI lifespan: przy zamykaniu serwera zapis wiadomości czekających w buforze."""
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await chat_buffer.flush()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
@@ -1,6 +1,7 @@
 import django
 django.setup()
 
+import asyncio
 import json
 import logging
 from channels.generic.websocket import AsyncWebsocketConsumer
@@ -10,6 +11,9 @@ from rest_framework_simplejwt.tokens import AccessToken
 from core.models import ChatMessage, AppUser, Notification, Order  
 from django.contrib.auth import get_user_model
 from channels.layers import get_channel_layer
+from django.utils import timezone
+from core.chat import chat_buffer, chat_message_payload, missed_messages, remember_message, join_room, leave_room, refresh_presence, is_online
+from urllib.parse import parse_qs
 
 logger = logging.getLogger(__name__)
 
@@ -17,10 +21,11 @@ class ChatConsumer(AsyncWebsocketConsumer):
     async def connect(self):
         self.room_name = self.scope['url_route']['kwargs']['room_name']
         self.room_group_name = f'chat_{self.room_name}'
+        self.pending = set()
 
-        token = self.scope['query_string'].decode().split('=')[1]
+        query = parse_qs(self.scope['query_string'].decode())
         try:
-            access_token = AccessToken(token)
+            access_token = AccessToken(query['token'][0])
             self.user = await sync_to_async(AppUser.objects.get)(id=access_token['user_id'])
             
             user_role = self.user.role 
@@ -35,6 +40,11 @@ class ChatConsumer(AsyncWebsocketConsumer):
             await self.close()
             return
 
+        if not await self.load_order():
+            logger.info(f"User {self.user.email} is not a participant of order {self.room_name}.")
+            await self.close()
+            return
+
         await self.channel_layer.group_add(
             self.room_group_name,
             self.channel_name
@@ -42,83 +52,136 @@ class ChatConsumer(AsyncWebsocketConsumer):
 
         await self.accept()
 
+        # Obecność tylko w cache i channel layer, bez zapisów do bazy. Ramki obecności, pisania
+        # i odczytu dostaje tylko klient, który o nie poprosi (?events=1); starszy klient
+        # traktuje każdą ramkę jak wiadomość.
+        self.events = query.get('events', [''])[0] == '1'
+        self.present = True
+        if await sync_to_async(join_room)(self.room_name, self.user.id) == 1:
+            await self.send_event('chat_presence', online=True)
+        if self.events:
+            await self.send(text_data=json.dumps({
+                'type': 'presence',
+                'user': self.recipient.id,
+                'online': await sync_to_async(is_online)(self.room_name, self.recipient.id),
+            }))
+
+        # Po ponownym połączeniu tylko wiadomości nowsze od last_id. Dołączenie do grupy
+        # przed odczytem oznacza, że wiadomość może przyjść dwa razy (to samo id), ale nie zginie.
+        last_id = query.get('last_id', [''])[0]
+        if last_id.isdecimal():
+            await self.replay(int(last_id))
+
+    async def replay(self, last_id):
+        messages, complete = await database_sync_to_async(missed_messages)(self.room_name, self.order.order_id, last_id)
+        if not complete:
+            await self.send(text_data=json.dumps({'type': 'replay_truncated'}))
+        for message in messages:
+            await self.send(text_data=json.dumps(message))
+
     async def disconnect(self, close_code):
         await self.channel_layer.group_discard(
             self.room_group_name,
             self.channel_name
         )
+        if getattr(self, 'present', False) and await sync_to_async(leave_room)(self.room_name, self.user.id):
+            await self.send_event('chat_presence', online=False)
+        # Tylko wiadomości tego połączenia, nie cała kolejka procesu
+        if self.pending:
+            await asyncio.wait(self.pending)
+
+    async def send_event(self, type, **data):
+        await self.channel_layer.group_send(self.room_group_name, {'type': type, 'user': self.user.id, **data})
 
     async def receive(self, text_data):
         try:
             text_data_json = json.loads(text_data)
+            event_type = text_data_json.get('type', 'message')
+
+            # Zdarzenia ulotne: ping (obecność), pisanie, potwierdzenie odczytu
+            if event_type == 'ping':
+                await sync_to_async(refresh_presence)(self.room_name, self.user.id)
+                return
+            if event_type == 'typing':
+                if not self.order.is_archived:
+                    await self.send_event('chat_typing')
+                return
+            if event_type == 'read':
+                last_id = str(text_data_json.get('last_id'))
+                if last_id.isdecimal():
+                    await self.send_event('chat_read', last_id=last_id)
+                return
+
             message = text_data_json['message']
-            user = await self.get_user(id=self.user.id) 
 
-            order_id = self.room_group_name.split('_')[1]  
-            order = await self.get_order(order_id)
-            
-            if order.archived:
+            if self.order.is_archived:
                 await self.send(text_data=json.dumps({'error': 'Nie można dodawać wiadomości do zarchiwizowanego zamówienia.'}))
                 return
             
-            chat_message = await self.save_message(message, user, order)
-            
-            logger.info(f"chat_message: {chat_message}") 
+            # Rozsyłka od razu, zapis w tle przez bufor (core/chat.py)
+            chat_message = ChatMessage(
+                room=self.room_name,
+                user=self.user,
+                message=message,
+                order=self.order,
+                timestamp=timezone.now(),
+            )
+            notification = Notification(
+                user=self.recipient,
+                order=self.order,
+                message=f"Nowa wiadomość w zamówieniu nr.{self.order.order_id}",
+                timestamp=chat_message.timestamp,
+            )
+            payload = chat_message_payload(chat_message)
 
             await self.channel_layer.group_send(
                 self.room_group_name,
                 {
                     'type': 'chat_message',
-                    'message': {
-                        #'user': user.email,
-                        'user': chat_message.user.id,
-                        'message': chat_message.message,
-                        'timestamp': chat_message.timestamp.isoformat()
-                    }
+                    'message': payload,
                 }
             )
+            await sync_to_async(remember_message)(self.room_name, payload)
+            written = await chat_buffer.put(chat_message, notification)
+            self.pending.add(written)
+            written.add_done_callback(self.pending.discard)
         except json.JSONDecodeError:
             logger.error("Received invalid JSON")
-            
-    @database_sync_to_async
-    def get_user(self, id):
-        return AppUser.objects.get(id=id)
-    
-    @database_sync_to_async
-    def get_order(self, order_id):
-        return Order.objects.get(order_id=order_id)
 
     @database_sync_to_async
-    def save_message(self, message, user, order):
-        chat_message = ChatMessage.objects.create(room=self.room_name, user=user, message=message, order=order)
-        
-        if user.role == 'client':
-            recipient = order.restaurant.owner
+    def load_order(self):
+        """
+        Zamówienie, uczestnicy i odbiorca powiadomień ładowane raz na połączenie.
+        Odświeżane po zdarzeniu chat_order_changed (Order.notify_chat).
+        """
+        try:
+            order = Order.objects.select_related('user', 'restaurant__owner').get(order_id=self.room_name)
+        except (Order.DoesNotExist, ValueError):
+            return False
+        if self.user.id == order.user_id:
+            self.recipient = order.restaurant.owner
+        elif self.user.id == order.restaurant.owner_id:
+            self.recipient = order.user
         else:
-            recipient = order.user
-        
-        notification = Notification.objects.create(
-            user=recipient,
-            order=order,
-            message=f"Nowa wiadomość w zamówieniu nr.{order.order_id}",
-        )
-        
-        channel_layer = get_channel_layer()
-        async_to_sync(channel_layer.group_send)(
-            f'notifications_{recipient.id}',
-            {
-                'type': 'send_notification',
-                'message': notification.message,
-                'timestamp': notification.timestamp.isoformat(),
-                'order': order.order_id
-            }
-        )
-        
-        return chat_message
+            return False
+        self.order = order
+        return True
 
     async def chat_message(self, event):
         message = event['message']
         await self.send(text_data=json.dumps(message))
+
+    async def chat_presence(self, event):
+        if self.events and event['user'] != self.user.id:
+            await self.send(text_data=json.dumps({'type': 'presence', 'user': event['user'], 'online': event['online']}))
+
+    async def chat_typing(self, event):
+        if self.events and event['user'] != self.user.id:
+            await self.send(text_data=json.dumps({'type': 'typing', 'user': event['user']}))
+
+    async def chat_read(self, event):
+        if self.events and event['user'] != self.user.id:
+            await self.send(text_data=json.dumps({'type': 'read', 'user': event['user'], 'last_id': event['last_id']}))
     
     async def send_notification(self, event):
         await self.send(text_data=json.dumps({
@@ -127,6 +190,10 @@ class ChatConsumer(AsyncWebsocketConsumer):
             'timestamp': event['timestamp'],
             'order': event['order'],
         }))
+
+    async def chat_order_changed(self, event):
+        if not await self.load_order():
+            await self.close()
         
 class NotificationConsumer(AsyncWebsocketConsumer):
     async def connect(self):
@@ -0,0 +1,78 @@
+import logging
+import math
+from decimal import Decimal
+from django.conf import settings
+from django.utils import timezone
+from collections import defaultdict
+from .models import Cart, Order, OutboxMessage, Restaurant, add_popularity, popularity_exponent
+
+logger = logging.getLogger(__name__)
+
+#Cart
+def reap_stale_carts(max_age=None, batch_size=None):
+    max_age = max_age or settings.CART_MAX_AGE
+    batch_size = batch_size or settings.CART_REAPER_BATCH_SIZE
+    cutoff = timezone.now() - max_age
+
+    stale_carts = Cart.objects.filter(order_id__isnull=True, created_at__lt=cutoff).order_by('created_at')
+    deleted = 0
+    while True:
+        cart_ids = list(stale_carts.values_list('id', flat=True)[:batch_size])
+        if not cart_ids:
+            break
+        _, per_model = stale_carts.filter(id__in=cart_ids).delete()
+        deleted += per_model.get(Cart._meta.label, 0)
+
+    if deleted:
+        logger.info(f"Reaped {deleted} stale carts older than {cutoff.isoformat()}")
+    return deleted
+
+def find_drifted_carts():
+    cent = Decimal('0.01')
+    drifted = []
+    carts = Cart.objects.annotate(computed_total=Cart.items_total()).values_list('id', 'total_price', 'computed_total')
+    for cart_id, total_price, computed_total in carts.iterator():
+        if Decimal(total_price).quantize(cent) != Decimal(computed_total).quantize(cent):
+            drifted.append((cart_id, total_price, computed_total))
+    return drifted
+
+def repair_cart_totals(cart_ids):
+    if not cart_ids:
+        return 0
+    return Cart.objects.filter(id__in=cart_ids).update(total_price=Cart.items_total())
+
+#Order
+def archive_orders():
+    archived = Order.objects.due_for_archive().update(archived=True, updated_at=timezone.now())
+    if archived:
+        logger.info(f"Archived {archived} finished orders")
+    return archived
+
+def rollup_popularity(batch_size=500):
+    """
+    Przelicza popularność restauracji od nowa z zamówień z ostatniego POPULARITY_WINDOW,
+    korygując przyrosty z Order.save (np. usunięte zamówienia). Starsze zamówienia
+    mają pomijalną wagę.
+    """
+    since = timezone.now() - settings.POPULARITY_WINDOW
+    scores = defaultdict(float)
+    orders = Order.objects.filter(created_at__gte=since).values_list('restaurant_id', 'created_at')
+    for restaurant_id, created_at in orders.iterator():
+        scores[restaurant_id] = add_popularity(scores[restaurant_id], popularity_exponent(created_at))
+
+    changed = [
+        Restaurant(pk=restaurant_id, popularity=scores.get(restaurant_id, 0))
+        for restaurant_id, popularity in Restaurant.objects.values_list('id', 'popularity')
+        if not math.isclose(popularity, scores.get(restaurant_id, 0), abs_tol=1e-9)
+    ]
+    Restaurant.objects.bulk_update(changed, ['popularity'], batch_size=batch_size)
+    if changed:
+        logger.info(f"Updated popularity of {len(changed)} restaurants")
+    return len(changed)
+
+#Outbox
+def dispatch_outbox(batch_size=None):
+    dispatched = OutboxMessage.dispatch_pending(batch_size=batch_size)
+    if dispatched:
+        logger.debug(f"Dispatched {dispatched} outbox messages")
+    return dispatched
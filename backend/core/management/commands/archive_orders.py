@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from core.jobs import archive_orders
+
+
+class Command(BaseCommand):
+    help = "Archives cancelled, delivered and picked up orders older than ORDER_ARCHIVE_AFTER."
+
+    def handle(self, *args, **options):
+        archived = archive_orders()
+        self.stdout.write(self.style.SUCCESS(f"Archived {archived} orders."))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from core.jobs import find_drifted_carts, repair_cart_totals
+
+
+class Command(BaseCommand):
+    help = "Finds carts whose total_price does not match the sum of their items and optionally repairs them."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fix', action='store_true', help="Recalculate the drifted totals.")
+
+    def handle(self, *args, **options):
+        drifted = find_drifted_carts()
+        for cart_id, total_price, computed_total in drifted:
+            self.stdout.write(f"Cart {cart_id}: stored {total_price}, items sum to {computed_total}")
+
+        if not drifted:
+            self.stdout.write(self.style.SUCCESS("All cart totals are consistent."))
+        elif options['fix']:
+            repaired = repair_cart_totals([cart_id for cart_id, _, _ in drifted])
+            self.stdout.write(self.style.SUCCESS(f"Repaired {repaired} cart totals."))
+        else:
+            self.stdout.write(self.style.WARNING(f"Found {len(drifted)} drifted cart totals. Run with --fix to repair them."))
@@ -0,0 +1,25 @@
+import time
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from core.jobs import dispatch_outbox
+
+
+class Command(BaseCommand):
+    help = "Sends pending outbox messages to the channel layer."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=None)
+        parser.add_argument('--loop', action='store_true', help="Keep polling the outbox instead of exiting after one pass.")
+        parser.add_argument('--interval', type=float, default=1.0)
+
+    def handle(self, *args, **options):
+        if not options['loop']:
+            dispatched = dispatch_outbox(batch_size=options['batch_size'])
+            self.stdout.write(self.style.SUCCESS(f"Dispatched {dispatched} messages."))
+            return
+
+        self.stdout.write(f"Dispatching outbox messages every {options['interval']}s.")
+        while True:
+            close_old_connections()
+            if not dispatch_outbox(batch_size=options['batch_size']):
+                time.sleep(options['interval'])
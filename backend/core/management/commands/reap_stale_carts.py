@@ -0,0 +1,16 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from core.jobs import reap_stale_carts
+
+
+class Command(BaseCommand):
+    help = "Deletes anonymous carts that were not turned into an order within CART_MAX_AGE."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--max-age-hours', type=float, default=None)
+        parser.add_argument('--batch-size', type=int, default=None)
+
+    def handle(self, *args, **options):
+        max_age = timedelta(hours=options['max_age_hours']) if options['max_age_hours'] else None
+        deleted = reap_stale_carts(max_age=max_age, batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} stale carts."))
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand, CommandError
+from core.models import Product, Restaurant
+from core.search import search_enabled, update_product_vectors, update_restaurant_vectors
+
+
+class Command(BaseCommand):
+    help = "Recomputes the full-text search vectors of restaurants and products (e.g. after bulk updates that skip signals)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        if not search_enabled():
+            raise CommandError("Full-text search requires PostgreSQL.")
+        batch_size = options['batch_size']
+        for model, update in ((Restaurant, update_restaurant_vectors), (Product, update_product_vectors)):
+            ids = list(model.objects.order_by('pk').values_list('pk', flat=True))
+            for start in range(0, len(ids), batch_size):
+                update(ids[start:start + batch_size])
+            self.stdout.write(self.style.SUCCESS(f"Reindexed {len(ids)} {model._meta.verbose_name_plural}."))
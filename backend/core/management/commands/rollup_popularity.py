@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from core.jobs import rollup_popularity
+
+
+class Command(BaseCommand):
+    help = "Recomputes restaurant popularity scores from orders placed within POPULARITY_WINDOW."
+
+    def handle(self, *args, **options):
+        updated = rollup_popularity()
+        self.stdout.write(self.style.SUCCESS(f"Updated popularity of {updated} restaurants."))
@@ -0,0 +1,15 @@
+import signal
+from django.core.management.base import BaseCommand
+from core import scheduler
+
+
+class Command(BaseCommand):
+    help = "Runs the jobs from PERIODIC_JOBS at their intervals until stopped. Run exactly one instance."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tick', type=float, default=1.0)
+
+    def handle(self, *args, **options):
+        signal.signal(signal.SIGTERM, scheduler.stop)
+        signal.signal(signal.SIGINT, scheduler.stop)
+        scheduler.run_forever(tick=options['tick'])
@@ -0,0 +1,17 @@
+# Generated by Django 5.1.3 on 2026-10-18 20:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0027_alter_order_status'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='cart',
+            index=models.Index(condition=models.Q(('order_id__isnull', True)), fields=['created_at'], name='cart_stale_idx'),
+        ),
+    ]
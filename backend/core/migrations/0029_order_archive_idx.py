@@ -0,0 +1,17 @@
+# Generated by Django 5.1.3 on 2026-10-18 20:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0028_cart_stale_idx'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(condition=models.Q(('archived', False)), fields=['status', 'updated_at'], name='order_archive_idx'),
+        ),
+    ]
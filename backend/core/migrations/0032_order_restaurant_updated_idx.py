@@ -0,0 +1,17 @@
+# Generated by Django 5.1.3 on 2026-10-18 21:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0031_outboxmessage'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['restaurant', 'updated_at', 'order_id'], name='order_restaurant_updated_idx'),
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.1.3 on 2026-10-18 21:06
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def normalize_city(name):
+    return ' '.join((name or '').split()).casefold()
+
+
+def populate_restaurant_cities(apps, schema_editor):
+    Address = apps.get_model('core', 'Address')
+    Restaurant = apps.get_model('core', 'Restaurant')
+    RestaurantCity = apps.get_model('core', 'RestaurantCity')
+
+    rows = set()
+    for restaurant_id, city in Address.objects.filter(restaurant__isnull=False).values_list('restaurant_id', 'city'):
+        rows.add((restaurant_id, normalize_city(city), 'address'))
+    for restaurant_id, city in Restaurant.delivery_cities.through.objects.values_list('restaurant_id', 'city__name'):
+        rows.add((restaurant_id, normalize_city(city), 'delivery'))
+    RestaurantCity.objects.bulk_create([
+        RestaurantCity(restaurant_id=restaurant_id, city=city, source=source)
+        for restaurant_id, city, source in rows if city
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0032_order_restaurant_updated_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RestaurantCity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('city', models.CharField(max_length=100)),
+                ('source', models.CharField(choices=[('address', 'Address'), ('delivery', 'Delivery')], max_length=10)),
+                ('restaurant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='served_cities', to='core.restaurant')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('city', 'restaurant', 'source'), name='restaurant_city_unique')],
+            },
+        ),
+        migrations.RunPython(populate_restaurant_cities, migrations.RunPython.noop),
+    ]
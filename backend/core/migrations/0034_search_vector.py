@@ -0,0 +1,82 @@
+# Generated by Django 5.1.3 on 2026-10-18 21:09
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+# Rozszerzenia, konfiguracja wyszukiwania i indeksy GIN istnieją tylko w PostgreSQL.
+CREATE_SEARCH_SQL = [
+    "CREATE EXTENSION IF NOT EXISTS unaccent",
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    """
+    DO $$
+    BEGIN
+        IF NOT EXISTS (SELECT 1 FROM pg_ts_config WHERE cfgname = 'polish_unaccent') THEN
+            CREATE TEXT SEARCH CONFIGURATION polish_unaccent (COPY = simple);
+            ALTER TEXT SEARCH CONFIGURATION polish_unaccent
+                ALTER MAPPING FOR hword, hword_part, word WITH unaccent, simple;
+        END IF;
+    END
+    $$
+    """,
+    "CREATE INDEX IF NOT EXISTS restaurant_search_idx ON core_restaurant USING gin (search_vector)",
+    "CREATE INDEX IF NOT EXISTS product_search_idx ON core_product USING gin (search_vector)",
+    "CREATE INDEX IF NOT EXISTS restaurant_name_trgm_idx ON core_restaurant USING gin (name gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS product_name_trgm_idx ON core_product USING gin (name gin_trgm_ops)",
+    """
+    UPDATE core_restaurant r SET search_vector =
+        setweight(to_tsvector('polish_unaccent', coalesce(r.name, '')), 'A')
+        || setweight(to_tsvector('polish_unaccent', coalesce((
+            SELECT string_agg(t.name, ' ') FROM core_restaurant_tags rt
+            JOIN core_tag t ON t.id = rt.tag_id WHERE rt.restaurant_id = r.id
+        ), '')), 'B')
+        || setweight(to_tsvector('polish_unaccent', coalesce(r.description, '')), 'C')
+    """,
+    """
+    UPDATE core_product SET search_vector =
+        setweight(to_tsvector('polish_unaccent', coalesce(name, '')), 'A')
+        || setweight(to_tsvector('polish_unaccent', coalesce(description, '')), 'B')
+    """,
+]
+
+DROP_SEARCH_SQL = [
+    "DROP INDEX IF EXISTS restaurant_search_idx",
+    "DROP INDEX IF EXISTS product_search_idx",
+    "DROP INDEX IF EXISTS restaurant_name_trgm_idx",
+    "DROP INDEX IF EXISTS product_name_trgm_idx",
+    "DROP TEXT SEARCH CONFIGURATION IF EXISTS polish_unaccent",
+]
+
+
+def create_search(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for sql in CREATE_SEARCH_SQL:
+        schema_editor.execute(sql)
+
+
+def drop_search(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for sql in DROP_SEARCH_SQL:
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0033_restaurantcity'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='restaurant',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(create_search, drop_search),
+    ]
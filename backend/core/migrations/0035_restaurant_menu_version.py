@@ -0,0 +1,18 @@
+# Generated by Django 5.1.3 on 2026-10-18 21:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0034_search_vector'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='restaurant',
+            name='menu_version',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.1.3 on 2026-10-18 21:23
+
+from collections import defaultdict
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def populate_popularity(apps, schema_editor):
+    Order = apps.get_model('core', 'Order')
+    Restaurant = apps.get_model('core', 'Restaurant')
+
+    scores = defaultdict(float)
+    since = timezone.now() - settings.POPULARITY_WINDOW
+    for restaurant_id, created_at in Order.objects.filter(created_at__gte=since).values_list('restaurant_id', 'created_at').iterator():
+        scores[restaurant_id] += 2 ** ((created_at - settings.POPULARITY_EPOCH) / settings.POPULARITY_HALF_LIFE)
+    Restaurant.objects.bulk_update(
+        [Restaurant(pk=restaurant_id, popularity=score) for restaurant_id, score in scores.items()],
+        ['popularity'], batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0035_restaurant_menu_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='restaurant',
+            name='popularity',
+            field=models.FloatField(default=0, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='restaurant',
+            index=models.Index(fields=['-popularity', 'id'], name='restaurant_popularity_idx'),
+        ),
+        migrations.RunPython(populate_popularity, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.1.3 on 2026-10-18 21:30
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0036_restaurant_popularity'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeliveryZone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('start', models.PositiveIntegerField()),
+                ('end', models.PositiveIntegerField()),
+                ('restaurant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='delivery_zones', to='core.restaurant')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['start', 'end'], name='delivery_zone_range_idx')],
+                'constraints': [models.CheckConstraint(condition=models.Q(('end__gte', models.F('start'))), name='delivery_zone_valid_range')],
+            },
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.1.3 on 2026-10-18 21:41
+
+from django.db import migrations, models
+
+
+def populate_order(apps, schema_editor):
+    # Pokoje czatu to id zamówień; starsze wiadomości mają tylko pole room
+    ChatMessage = apps.get_model('core', 'ChatMessage')
+    Order = apps.get_model('core', 'Order')
+
+    rooms = ChatMessage.objects.filter(order__isnull=True).values_list('room', flat=True).distinct()
+    order_ids = {str(order_id) for order_id in Order.objects.filter(
+        order_id__in=[int(room) for room in rooms if room.isdecimal()]
+    ).values_list('order_id', flat=True)}
+    for room in order_ids:
+        ChatMessage.objects.filter(order__isnull=True, room=room).update(order_id=int(room))
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0038_chatmessage_timestamp_default'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='chatmessage',
+            index=models.Index(fields=['order', 'timestamp', 'id'], name='chatmessage_order_idx'),
+        ),
+        migrations.RunPython(populate_order, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.1.3 on 2026-10-18 22:30
+
+import math
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone as dt_timezone
+from django.db import migrations
+from django.utils import timezone
+
+# Stałe z chwili utworzenia migracji, niezależne od późniejszych zmian w settings
+POPULARITY_EPOCH = datetime(2025, 1, 1, tzinfo=dt_timezone.utc)
+POPULARITY_HALF_LIFE = timedelta(days=7)
+POPULARITY_WINDOW = 20 * POPULARITY_HALF_LIFE
+
+
+def populate_popularity(apps, schema_editor):
+    Order = apps.get_model('core', 'Order')
+    Restaurant = apps.get_model('core', 'Restaurant')
+
+    # Przeliczenie wartości z 0036 (liniowa suma wag) do skali log2(1 + suma wag)
+    scores = defaultdict(float)
+    since = timezone.now() - POPULARITY_WINDOW
+    for restaurant_id, created_at in Order.objects.filter(created_at__gte=since).values_list('restaurant_id', 'created_at').iterator():
+        exponent = (created_at - POPULARITY_EPOCH) / POPULARITY_HALF_LIFE
+        high, low = max(scores[restaurant_id], exponent), min(scores[restaurant_id], exponent)
+        scores[restaurant_id] = high + math.log2(1 + 2 ** max(low - high, -60.0))
+    Restaurant.objects.update(popularity=0)
+    Restaurant.objects.bulk_update(
+        [Restaurant(pk=restaurant_id, popularity=score) for restaurant_id, score in scores.items()],
+        ['popularity'], batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0039_chatmessage_order_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(populate_popularity, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.1.3 on 2026-10-18 22:20
+
+import core.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0040_restaurant_popularity_log2'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='chatmessage',
+            name='id',
+            field=models.BigIntegerField(default=core.models.next_chat_message_id, editable=False, primary_key=True, serialize=False),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.1.3 on 2026-10-18 22:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0041_chatmessage_time_ordered_id'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='chatmessage',
+            index=models.Index(fields=['order', 'id'], name='chatmessage_order_id_idx'),
+        ),
+    ]
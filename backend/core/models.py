@@ -1,14 +1,27 @@
-from django.db import models
+import asyncio
+import logging
+import math
+import threading
+import time
+from decimal import Decimal
+from django.db import models, transaction
+from django.db.models import F, Value
+from django.core.cache import cache
+from django.db.models.functions import Coalesce, Greatest, Least, Log, Power
 from django.conf import settings
 from django.utils import timezone
 from datetime import timedelta
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, PermissionsMixin
 from django.contrib.contenttypes.fields import GenericForeignKey
 from django.contrib.contenttypes.models import ContentType
+from django.contrib.postgres.search import SearchVectorField
 from cloudinary.models import CloudinaryField
+from django.core.exceptions import ImproperlyConfigured
 from django.utils.crypto import get_random_string
 from cloudinary.uploader import destroy
 
+logger = logging.getLogger(__name__)
+
 class UserManager(BaseUserManager):
     def create_user(self, email, password=None, **extra_fields):
         if not email:
@@ -85,10 +98,44 @@ class Restaurant(models.Model):
     allows_pickup = models.BooleanField(default=True)
     minimum_order_amount = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
     delivery_cities = models.ManyToManyField('City', blank=True)
+    search_vector = SearchVectorField(null=True, editable=False)
+    menu_version = models.PositiveIntegerField(default=0, editable=False)
+    popularity = models.FloatField(default=0, editable=False)
     #created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['-popularity', 'id'], name='restaurant_popularity_idx'),
+        ]
+
     def __str__(self):
         return self.name
+
+    @staticmethod
+    def _menu_version_key(restaurant_id):
+        return f'menu_version:{restaurant_id}'
+
+    @classmethod
+    def get_menu_version(cls, restaurant_id):
+        """
+        Wersja menu z kopii w cache; przy braku odczytywana z bazy.
+        Rzuca Restaurant.DoesNotExist, jeśli restauracja nie istnieje.
+        """
+        key = cls._menu_version_key(restaurant_id)
+        version = cache.get(key)
+        if version is None:
+            version = cls.objects.filter(pk=restaurant_id).values_list('menu_version', flat=True).first()
+            if version is None:
+                raise cls.DoesNotExist
+            cache.add(key, version, settings.MENU_VERSION_CACHE_TIMEOUT)
+        return version
+
+    @classmethod
+    def bump_menu_version(cls, restaurant_id):
+        cls.objects.filter(pk=restaurant_id).update(menu_version=F('menu_version') + 1)
+        key = cls._menu_version_key(restaurant_id)
+        cache.delete(key)
+        transaction.on_commit(lambda: cache.delete(key))
     
     def delete_image(self):
         if self.image:
@@ -96,6 +143,110 @@ class Restaurant(models.Model):
             self.image = None
             self.save()
 
+# Popularność trzymana w skali log2, bo wagi 2^x rosną bez ograniczeń (2^x przekracza zakres float około 2045 r.)
+POPULARITY_MIN_EXPONENT = -60.0
+
+def popularity_exponent(timestamp):
+    """
+    log2 wagi zamówienia w rankingu popularności: (t - POPULARITY_EPOCH) / POPULARITY_HALF_LIFE.
+    Nowsze zamówienia ważą wykładniczo więcej, więc suma wag jest licznikiem z zanikiem,
+    którego nie trzeba przeliczać z upływem czasu (kolejność restauracji się nie zmienia).
+    Restaurant.popularity to log2(1 + suma wag).
+    """
+    return (timestamp - settings.POPULARITY_EPOCH) / settings.POPULARITY_HALF_LIFE
+
+def add_popularity(score, exponent):
+    """log2(2^score + 2^exponent) liczone bez przepełnienia."""
+    high, low = max(score, exponent), min(score, exponent)
+    return high + math.log2(1 + 2 ** max(low - high, POPULARITY_MIN_EXPONENT))
+
+def added_popularity(exponent):
+    """Wyrażenie SQL dla add_popularity(F('popularity'), exponent), do atomowego UPDATE."""
+    exponent = Value(exponent, output_field=models.FloatField())
+    high = Greatest(F('popularity'), exponent)
+    low = Least(F('popularity'), exponent)
+    return high + Log(
+        Value(2.0),
+        Value(1.0) + Power(Value(2.0), Greatest(low - high, Value(POPULARITY_MIN_EXPONENT))),
+        output_field=models.FloatField(),
+    )
+
+def normalize_city(name):
+    return ' '.join((name or '').split()).casefold()
+
+class RestaurantCity(models.Model):
+    """
+    Zdenormalizowany indeks miast obsługiwanych przez restauracje (adres lub miasto dostawy),
+    utrzymywany przez sygnały w core/signals.py.
+    """
+    SOURCE_CHOICES = [
+        ('address', 'Address'),
+        ('delivery', 'Delivery'),
+    ]
+
+    restaurant = models.ForeignKey(Restaurant, on_delete=models.CASCADE, related_name='served_cities')
+    city = models.CharField(max_length=100)
+    source = models.CharField(max_length=10, choices=SOURCE_CHOICES)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['city', 'restaurant', 'source'], name='restaurant_city_unique'),
+        ]
+
+    def __str__(self):
+        return f"{self.restaurant} - {self.city} ({self.source})"
+
+    @classmethod
+    def rebuild(cls, restaurant_ids):
+        restaurant_ids = [restaurant_id for restaurant_id in set(restaurant_ids) if restaurant_id]
+        if not restaurant_ids:
+            return
+        rows = set()
+        for restaurant_id, city in Address.objects.filter(restaurant_id__in=restaurant_ids).values_list('restaurant_id', 'city'):
+            rows.add((restaurant_id, normalize_city(city), 'address'))
+        delivery_cities = Restaurant.delivery_cities.through.objects.filter(restaurant_id__in=restaurant_ids)
+        for restaurant_id, city in delivery_cities.values_list('restaurant_id', 'city__name'):
+            rows.add((restaurant_id, normalize_city(city), 'delivery'))
+
+        with transaction.atomic():
+            cls.objects.filter(restaurant_id__in=restaurant_ids).delete()
+            cls.objects.bulk_create([
+                cls(restaurant_id=restaurant_id, city=city, source=source)
+                for restaurant_id, city, source in rows if city
+            ])
+
+def normalize_postal_code(postal_code):
+    """Kod pocztowy ("31-123" lub "31123") jako liczba 31123; None, jeśli nie ma 5 cyfr."""
+    digits = ''.join(char for char in (postal_code or '') if char.isdigit())
+    return int(digits) if len(digits) == 5 else None
+
+def format_postal_code(value):
+    return f"{value // 1000:02d}-{value % 1000:03d}"
+
+class DeliveryZone(models.Model):
+    """
+    Strefa dostawy restauracji jako zakres kodów pocztowych [start, end] (np. prefiks "31"
+    to 31-000 – 31-999). Strefy są kompilowane do indeksu przedziałów w core/zones.py.
+    """
+    restaurant = models.ForeignKey(Restaurant, on_delete=models.CASCADE, related_name='delivery_zones')
+    start = models.PositiveIntegerField()
+    end = models.PositiveIntegerField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['start', 'end'], name='delivery_zone_range_idx'),
+        ]
+        constraints = [
+            models.CheckConstraint(condition=models.Q(end__gte=models.F('start')), name='delivery_zone_valid_range'),
+        ]
+
+    def __str__(self):
+        return f"{self.restaurant} - {format_postal_code(self.start)} – {format_postal_code(self.end)}"
+
+    @staticmethod
+    def prefix_range(prefix):
+        return int(prefix.ljust(5, '0')), int(prefix.ljust(5, '9'))
+
 class Address(models.Model):
     ROLE_CHOICES = [
         ('client', 'Client'),
@@ -153,10 +304,26 @@ class Product(models.Model):
     is_available = models.BooleanField(default=True)
     image = CloudinaryField('image', null=True, blank=True)
     archived = models.BooleanField(default=False)  
+    search_vector = SearchVectorField(null=True, editable=False)
 
     def __str__(self):
         return f"{self.name} - {self.restaurant.name}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if 'price' in field_names:
+            instance._saved_price = instance.price
+        return instance
+
+    def save(self, *args, **kwargs):
+        price_changed = self.price != getattr(self, '_saved_price', self.price)
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if price_changed:
+                CartItem.refresh_prices(self)
+        self._saved_price = self.price
+
     def archive(self):
         self.archived = True
         self.is_available = False
@@ -169,22 +336,50 @@ class Product(models.Model):
             self.save()
     
 #Cart
+class CartQuerySet(models.QuerySet):
+    def with_items(self):
+        return self.prefetch_related(
+            models.Prefetch('items', queryset=CartItem.objects.select_related('product__restaurant').prefetch_related(
+                'product__restaurant__tags', 'product__restaurant__delivery_cities'
+            ))
+        )
+
 class Cart(models.Model):
     session_id = models.CharField(max_length=100, unique=True, null=True ,default=get_random_string)
     created_at = models.DateTimeField(auto_now=True)
     order_id = models.PositiveIntegerField(unique=True, null=True, default=None) 
     total_price = models.DecimalField(max_digits=10, decimal_places=2, default=0.00) 
 
+    objects = CartQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at'], condition=models.Q(order_id__isnull=True), name='cart_stale_idx'),
+        ]
+
     def __str__(self):
         return self.session_id if self.session_id else f"Order {self.order_id}" if self.order_id else "Cart"
     
     def update_timestamp(self):
         self.created_at = timezone.now()
-        self.save()
+        self.save(update_fields=['created_at'])
     
+    @staticmethod
+    def items_total():
+        totals = CartItem.objects.filter(cart=models.OuterRef('pk')).values('cart').annotate(
+            total=models.Sum(models.F('price') * models.F('quantity'))
+        ).values('total')
+        return Coalesce(
+            models.Subquery(totals, output_field=models.DecimalField(max_digits=10, decimal_places=2)),
+            Decimal('0.00'),
+        )
+
+    @staticmethod
+    def add_to_total_price(cart_id, delta):
+        Cart.objects.filter(pk=cart_id).update(total_price=models.F('total_price') + delta, created_at=timezone.now())
+
     def update_total_price(self):
-        self.total_price = sum(item.price * item.quantity for item in self.items.all())
-        self.save()
+        Cart.objects.filter(pk=self.pk).update(total_price=Cart.items_total(), created_at=timezone.now())
 
 class CartItem(models.Model):
     cart = models.ForeignKey(Cart, related_name='items', on_delete=models.CASCADE)
@@ -196,9 +391,46 @@ class CartItem(models.Model):
     class Meta:
         ordering = ['created_at']
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if 'price' in field_names and 'quantity' in field_names:
+            instance._saved_line_total = instance.line_total
+        return instance
+
+    @property
+    def line_total(self):
+        if self.price is None:
+            return Decimal('0.00')
+        return Decimal(str(self.price)) * self.quantity
+
+    @staticmethod
+    def refresh_prices(product):
+        # Otwarte koszyki liczone po aktualnej cenie produktu, tak jak koszyki w Redis (core/carts.py);
+        # koszyki złożonych zamówień zachowują cenę z chwili zamówienia
+        items = CartItem.objects.filter(product=product, cart__order_id__isnull=True)
+        cart_ids = list(items.values_list('cart_id', flat=True).distinct())
+        if cart_ids:
+            items.update(price=product.price)
+            Cart.objects.filter(pk__in=cart_ids).update(total_price=Cart.items_total())
+
     def save(self, *args, **kwargs):
-        self.price = self.product.price 
-        super().save(*args, **kwargs)
+        if self.price is None:
+            self.price = self.product.price 
+        delta = self.line_total - getattr(self, '_saved_line_total', Decimal('0.00'))
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if delta:
+                Cart.add_to_total_price(self.cart_id, delta)
+        self._saved_line_total = self.line_total
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            result = super().delete(*args, **kwargs)
+            saved_line_total = getattr(self, '_saved_line_total', Decimal('0.00'))
+            if saved_line_total:
+                Cart.add_to_total_price(self.cart_id, -saved_line_total)
+        return result
 
     def __str__(self):
         return f"{self.quantity} x {self.product.name}"
@@ -206,6 +438,35 @@ class CartItem(models.Model):
 from channels.layers import get_channel_layer
 from asgiref.sync import async_to_sync
 #Order
+class InvalidStatusTransition(Exception):
+    pass
+
+class StatusConflict(Exception):
+    pass
+
+class OrderQuerySet(models.QuerySet):
+    def _archived_q(self):
+        cutoff = timezone.now() - settings.ORDER_ARCHIVE_AFTER
+        return models.Q(archived=True) | models.Q(status__in=Order.ARCHIVE_STATUSES, updated_at__lte=cutoff)
+
+    def active(self):
+        return self.exclude(self._archived_q())
+
+    def archived(self):
+        return self.filter(self._archived_q())
+
+    def due_for_archive(self):
+        cutoff = timezone.now() - settings.ORDER_ARCHIVE_AFTER
+        return self.filter(archived=False, status__in=Order.ARCHIVE_STATUSES, updated_at__lte=cutoff)
+
+    def with_details(self):
+        return self.select_related('cart', 'address__user', 'restaurant').prefetch_related(
+            'history',
+            'restaurant__tags',
+            'restaurant__delivery_cities',
+            models.Prefetch('cart__items', queryset=CartItem.objects.select_related('product')),
+        )
+
 class Order(models.Model):
     PAYMENT_CHOICES = [
         ('card', 'Card'),
@@ -229,6 +490,28 @@ class Order(models.Model):
         ('suspended', 'Suspended'),  # Only Admin
         ('resumed', 'Resumed'),  # Only Admin
     ]
+
+    ARCHIVE_STATUSES = ['cancelled', 'delivered', 'picked_up']
+
+    STATUS_TRANSITIONS = {
+        'pending': ['confirmed', 'cancelled'],
+        'confirmed': ['shipped', 'ready_for_pickup', 'cancelled'],
+        'shipped': ['delivered'],
+        'ready_for_pickup': ['picked_up'],
+        'resumed': ['confirmed', 'shipped', 'ready_for_pickup', 'delivered', 'picked_up', 'cancelled'],
+    }
+    ADMIN_STATUS_TRANSITIONS = {
+        'pending': ['suspended'],
+        'confirmed': ['suspended'],
+        'shipped': ['suspended', 'cancelled'],
+        'ready_for_pickup': ['suspended', 'cancelled'],
+        'resumed': ['suspended'],
+        'suspended': ['resumed', 'cancelled'],
+    }
+    DELIVERY_TYPE_STATUSES = {
+        'delivery': ['shipped', 'delivered'],
+        'pickup': ['ready_for_pickup', 'picked_up'],
+    }
     
     order_id = models.AutoField(primary_key=True)
     cart = models.ForeignKey(Cart, on_delete=models.CASCADE)
@@ -244,83 +527,109 @@ class Order(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     archived = models.BooleanField(default=False)
 
+    objects = OrderQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'updated_at'], condition=models.Q(archived=False), name='order_archive_idx'),
+            models.Index(fields=['restaurant', '-created_at', '-order_id'], name='order_restaurant_created_idx'),
+            models.Index(fields=['user', '-created_at', '-order_id'], name='order_user_created_idx'),
+            models.Index(fields=['restaurant', 'updated_at', 'order_id'], name='order_restaurant_updated_idx'),
+        ]
+
     #def __str__(self):
     #    return f"Order {self.order_id} - {self.status}"
     
     def __str__(self):
         return f"Order {self.order_id} - {self.status}" if self.order_id and self.status else "Order"
     
+    # Pola zapamiętywane przez połączenia czatu (uczestnicy, archiwizacja)
+    CHAT_FIELDS = ('status', 'user_id', 'restaurant_id', 'archived')
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._chat_state = instance.chat_state()
+        return instance
+
+    def chat_state(self):
+        # __dict__ zamiast getattr: pola odroczone (only/defer) nie są doczytywane z bazy
+        return tuple(self.__dict__.get(field) for field in self.CHAT_FIELDS)
+
     def save(self, *args, **kwargs):
         is_new = self.pk is None
-        super().save(*args, **kwargs)
-        if is_new:
-            OrderHistory.objects.create(order=self, status=self.status, description="Złożono zamówienie")
-            
-            notification = Notification.objects.create(
-                user=self.restaurant.owner,
-                order=self,
-                message=f"Nowe zamówienie nr.{self.order_id}.",
-            )
-            
-            channel_layer = get_channel_layer()
-            async_to_sync(channel_layer.group_send)(
-                f'notifications_{self.restaurant.owner.id}',
-                {
-                    'type': 'send_notification',
-                    'message': notification.message,
-                    'timestamp': notification.timestamp.isoformat(),
-                    'order': self.order_id,
-                }
-            )
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if is_new:
+                OrderHistory.objects.create(order=self, status=self.status, description="Złożono zamówienie")
+                Restaurant.objects.filter(pk=self.restaurant_id).update(
+                    popularity=added_popularity(popularity_exponent(self.created_at))
+                )
+                Notification.send(
+                    user=self.restaurant.owner,
+                    order=self,
+                    message=f"Nowe zamówienie nr.{self.order_id}.",
+                )
+            elif self.chat_state() != getattr(self, '_chat_state', None):
+                self.notify_chat()
+        self._chat_state = self.chat_state()
     
-    def update_status(self, new_status, description="", is_admin=False):
-        self.status = new_status
-        OrderHistory.objects.create(order=self, status=new_status, description=description)
-        self.save()
-        
+    def can_transition(self, new_status, is_admin=False, from_status=None):
+        from_status = from_status or self.status
+        allowed = list(self.STATUS_TRANSITIONS.get(from_status, []))
         if is_admin:
-            notification_message = f"Administrator zmienił status zamówienia nr.{self.order_id} na {new_status}."
-        else:
-            notification_message = f"Status zamówienia nr.{self.order_id} został zmieniony na {new_status}."
-        
-        notification = Notification.objects.create(
-            user=self.user,
-            order=self,
-            message=notification_message,
-        )
-        
-        channel_layer = get_channel_layer()
-        async_to_sync(channel_layer.group_send)(
-            f'notifications_{self.user.id}',
-            {
-                'type': 'send_notification',
-                'message': notification.message,
-                'timestamp': notification.timestamp.isoformat(),
-                'order': self.order_id,
-            }
-        )
-        
-        if is_admin:
-            Notification.objects.create(
-                user=self.restaurant.owner,
-                order=self,
-                message=notification_message,
-            )
+            allowed += self.ADMIN_STATUS_TRANSITIONS.get(from_status, [])
+        for delivery_type, statuses in self.DELIVERY_TYPE_STATUSES.items():
+            if delivery_type != self.delivery_type:
+                allowed = [status for status in allowed if status not in statuses]
+        return new_status in allowed
+
+    def check_transition(self, new_status, is_admin=False, expected_status=None):
+        expected_status = expected_status or self.status
+        if not self.can_transition(new_status, is_admin=is_admin, from_status=expected_status):
+            raise InvalidStatusTransition(f"Niedozwolona zmiana statusu z {expected_status} na {new_status}.")
+
+    def lock_status(self, expected_status):
+        """Blokuje wiersz zamówienia do końca bieżącej transakcji; StatusConflict, jeśli status jest już inny."""
+        status = Order.objects.select_for_update().filter(pk=self.pk).values_list('status', flat=True).first()
+        if status != expected_status:
+            raise StatusConflict(f"Status zamówienia nr.{self.order_id} został w międzyczasie zmieniony.")
+
+    def update_status(self, new_status, description="", is_admin=False, expected_status=None):
+        expected_status = expected_status or self.status
+        self.check_transition(new_status, is_admin=is_admin, expected_status=expected_status)
+
+        with transaction.atomic():
+            updated_at = timezone.now()
+            updated = Order.objects.filter(pk=self.pk, status=expected_status).update(status=new_status, updated_at=updated_at)
+            if not updated:
+                raise StatusConflict(f"Status zamówienia nr.{self.order_id} został w międzyczasie zmieniony.")
+            OrderHistory.objects.create(order=self, status=new_status, description=description)
+            self.status = new_status
+            self.updated_at = updated_at
             
-            async_to_sync(channel_layer.group_send)(
-                f'notifications_{self.restaurant.owner.id}',
-                {
-                    'type': 'send_notification',
-                    'message': notification.message,
-                    'timestamp': timezone.now().isoformat(),
-                    'order': self.order_id,
-                }
-            )
+            if is_admin:
+                notification_message = f"Administrator zmienił status zamówienia nr.{self.order_id} na {new_status}."
+            else:
+                notification_message = f"Status zamówienia nr.{self.order_id} został zmieniony na {new_status}."
+            
+            notifications = [Notification(user_id=self.user_id, order=self, message=notification_message)]
+            if is_admin:
+                notifications.append(Notification(user_id=self.restaurant.owner_id, order=self, message=notification_message))
+            Notification.send_many(notifications, outbox=[self.chat_changed_message()])
+
+    def chat_changed_message(self):
+        """Zdarzenie, po którym połączenia czatu (ChatConsumer) przeładowują zapamiętany stan zamówienia."""
+        return OutboxMessage(group=f'chat_{self.order_id}', payload={'type': 'chat_order_changed'})
+
+    def notify_chat(self):
+        self.chat_changed_message().save()
     
-    def archive_if_needed(self):
-        if self.status in ['cancelled', 'delivered', 'picked_up'] and self.updated_at <= timezone.now() - timedelta(hours=24):
-            self.archived = True
-            self.save()
+    @property
+    def is_archived(self):
+        if self.archived:
+            return True
+        return self.status in self.ARCHIVE_STATUSES and self.updated_at <= timezone.now() - settings.ORDER_ARCHIVE_AFTER
     
 class OrderHistory(models.Model):
     order = models.ForeignKey('Order', related_name='history', on_delete=models.CASCADE)
@@ -331,12 +640,56 @@ class OrderHistory(models.Model):
     def __str__(self):
         return f"Order {self.order.order_id} - {self.status} at {self.timestamp}"
 
+CHAT_ID_EPOCH_MS = 1735689600000  # 2025-01-01 UTC
+
+class MessageIdGenerator:
+    """
+    Id wiadomości czatu nadawane przed zapisem (bufor zapisuje je po rozsyłce):
+    milisekundy od CHAT_ID_EPOCH_MS, 10 bitów węzła i 12 bitów licznika.
+    Id rosną z czasem, więc klient może wznowić czat od ostatniego widzianego id.
+    Węzeł pochodzi z CHAT_NODE_ID i musi być inny w każdym procesie tworzącym wiadomości.
+    Id przekraczają 2**53, dlatego w JSON są przesyłane jako napisy.
+    """
+    def __init__(self, node):
+        if not 0 <= node < 1024:
+            raise ImproperlyConfigured("CHAT_NODE_ID must be between 0 and 1023")
+        self._lock = threading.Lock()
+        self.node = node
+        self.last_ms = 0
+        self.sequence = 0
+
+    def next_id(self):
+        with self._lock:
+            ms = max(int(time.time() * 1000) - CHAT_ID_EPOCH_MS, self.last_ms)
+            if ms == self.last_ms:
+                self.sequence = (self.sequence + 1) & 0xfff
+                if self.sequence == 0:
+                    ms += 1
+            else:
+                self.sequence = 0
+            self.last_ms = ms
+            return (ms << 22) | (self.node << 12) | self.sequence
+
+message_ids = MessageIdGenerator(settings.CHAT_NODE_ID)
+
+def next_chat_message_id():
+    return message_ids.next_id()
+
 class ChatMessage(models.Model):
+    # Id z generatora także przy zapisie przez ORM, żeby kolejność id zgadzała się z czasem
+    id = models.BigIntegerField(primary_key=True, default=next_chat_message_id, editable=False)
     order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name='chat_messages', null=True, blank=True)
     room = models.CharField(max_length=255)
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     message = models.TextField()
-    timestamp = models.DateTimeField(auto_now_add=True)
+    timestamp = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['room', '-timestamp', '-id'], name='chatmessage_room_idx'),
+            models.Index(fields=['order', 'timestamp', 'id'], name='chatmessage_order_idx'),
+            models.Index(fields=['order', 'id'], name='chatmessage_order_id_idx'),
+        ]
     
     def save(self, *args, **kwargs):
         #if self.room:
@@ -353,5 +706,100 @@ class Notification(models.Model):
     is_read = models.BooleanField(default=False)
     timestamp = models.DateTimeField(default=timezone.now)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'is_read', '-timestamp', '-id'], name='notification_user_unread_idx'),
+        ]
+
+    @classmethod
+    def send(cls, user, order, message):
+        notification = cls.objects.create(user=user, order=order, message=message)
+        notification.outbox_message().save()
+        return notification
+
+    @classmethod
+    def send_many(cls, notifications, outbox=()):
+        """Zapis wielu powiadomień i ich zdarzeń (wraz z dodatkowymi `outbox`) w dwóch zapytaniach."""
+        notifications = cls.objects.bulk_create(notifications)
+        OutboxMessage.objects.bulk_create([notification.outbox_message() for notification in notifications] + list(outbox))
+        return notifications
+
+    def outbox_message(self):
+        return OutboxMessage(
+            group=f'notifications_{self.user_id}',
+            payload={
+                'type': 'send_notification',
+                'message': self.message,
+                'timestamp': self.timestamp.isoformat(),
+                'order': self.order_id,
+            }
+        )
+
+    def __str__(self):
+        return f"Notification for {self.user.email} - {self.message}"
+
+#Outbox
+class OutboxMessage(models.Model):
+    """
+    Zdarzenie dla channel layer zapisane w tej samej transakcji co zmiana zamówienia.
+    Wysyłane przez dispatch_pending() poza ścieżką requestu, z ponowieniami przy błędach.
+    """
+    group = models.CharField(max_length=255)
+    payload = models.JSONField()
+    created_at = models.DateTimeField(default=timezone.now)
+    available_at = models.DateTimeField(default=timezone.now)
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True, default='')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['available_at', 'id'], name='outbox_available_idx'),
+        ]
+
     def __str__(self):
-        return f"Notification for {self.user.email} - {self.message}"
\ No newline at end of file
+        return f"Outbox {self.id} -> {self.group}"
+
+    @classmethod
+    def dispatch_pending(cls, batch_size=None):
+        batch_size = batch_size or settings.OUTBOX_BATCH_SIZE
+        channel_layer = get_channel_layer()
+        dispatched = 0
+        while True:
+            with transaction.atomic():
+                messages = list(
+                    cls.objects.select_for_update(skip_locked=True)
+                    .filter(available_at__lte=timezone.now(), attempts__lt=settings.OUTBOX_MAX_ATTEMPTS)
+                    .order_by('id')[:batch_size]
+                )
+                if not messages:
+                    break
+
+                results = async_to_sync(cls._send_batch)(channel_layer, messages)
+                now = timezone.now()
+                sent, failed = [], []
+                for message, error in zip(messages, results):
+                    if error is None:
+                        sent.append(message.id)
+                        continue
+                    message.attempts += 1
+                    message.last_error = repr(error)
+                    message.available_at = now + timedelta(seconds=min(2 ** message.attempts, settings.OUTBOX_MAX_BACKOFF))
+                    failed.append(message)
+                    logger.warning(f"Outbox message {message.id} to {message.group} failed (attempt {message.attempts}): {error!r}")
+
+                cls.objects.filter(id__in=sent).delete()
+                cls.objects.bulk_update(failed, ['attempts', 'last_error', 'available_at'])
+            dispatched += len(sent)
+            if len(messages) < batch_size:
+                break
+        return dispatched
+
+    @staticmethod
+    async def _send_batch(channel_layer, messages):
+        async def send(message):
+            try:
+                await channel_layer.group_send(message.group, message.payload)
+            except Exception as e:
+                return e
+            return None
+        return await asyncio.gather(*(send(message) for message in messages))
\ No newline at end of file
@@ -0,0 +1,226 @@
+import base64
+import json
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.utils import timezone
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+from .tagindex import bitset_ids
+
+class KeysetPagination(BasePagination):
+    """
+    Stronicowanie po kluczu złożonym (np. created_at, order_id) z nieprzezroczystym kursorem.
+    Odpowiedź pozostaje zwykłą listą, a kursory sąsiednich stron trafiają do nagłówka Link.
+    Stronicowanie włącza dopiero cursor lub page_size w zapytaniu; bez nich pełna, posortowana
+    lista jak dotychczas (frontend nie obsługuje nagłówka Link).
+    """
+    ordering = ('-created_at', '-pk')
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+    paginate_by_default = False
+
+    def is_requested(self, request):
+        return any(param in request.query_params for param in self.get_query_params())
+
+    def get_query_params(self):
+        return [self.cursor_query_param, self.page_size_query_param]
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        if not self.paginate_by_default and not self.is_requested(request):
+            self.position = None
+            self.has_more = False
+            self.next_position = self.previous_position = None
+            return list(queryset.order_by(*self.ordering))
+        page_size = self.get_page_size(request)
+        position, reverse = self.decode_cursor(request)
+
+        ordering = self._reversed(self.ordering) if reverse else self.ordering
+        queryset = queryset.order_by(*ordering)
+        if position is not None:
+            try:
+                queryset = queryset.filter(self._after(ordering, self.parse_position(queryset.model, position)))
+            except (ValidationError, ValueError, TypeError):
+                raise NotFound(self.invalid_cursor_message)
+
+        results = list(queryset[:page_size + 1])
+        has_more = len(results) > page_size
+        results = results[:page_size]
+        if reverse:
+            results.reverse()
+
+        self.position = position
+        self.has_more = has_more
+        self.next_position = self._position(results[-1]) if results and (has_more or reverse) else None
+        self.previous_position = self._position(results[0]) if results and (position is not None and (not reverse or has_more)) else None
+        return results
+
+    def get_paginated_response(self, data):
+        links = []
+        if self.next_position is not None:
+            links.append(f'<{self.encode_cursor(self.next_position, reverse=False)}>; rel="next"')
+        if self.previous_position is not None:
+            links.append(f'<{self.encode_cursor(self.previous_position, reverse=True)}>; rel="prev"')
+        headers = {'Link': ', '.join(links)} if links else None
+        return Response(data, headers=headers)
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(page_size, 1), self.max_page_size)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            cursor = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')).decode('utf-8'))
+            position, reverse = cursor['p'], bool(cursor.get('r'))
+        except (TypeError, ValueError, KeyError, UnicodeDecodeError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(position, list) or len(position) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        return position, reverse
+
+    def parse_position(self, model, position):
+        # Wartości z kursora pochodzą od klienta: każda musi dać się sparsować jak pole, po którym sortujemy
+        parsed = []
+        for field_name, value in zip(self.ordering, position):
+            field_name = field_name.lstrip('-')
+            field = model._meta.pk if field_name == 'pk' else model._meta.get_field(field_name)
+            try:
+                value = field.to_python(value)
+            except ValidationError:
+                raise NotFound(self.invalid_cursor_message)
+            if value is None:
+                raise NotFound(self.invalid_cursor_message)
+            parsed.append(value)
+        return parsed
+
+    def encode_cursor(self, position, reverse):
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, self.encode_token(position, reverse))
+
+    def encode_token(self, position, reverse=False):
+        cursor = {'p': position}
+        if reverse:
+            cursor['r'] = 1
+        return base64.urlsafe_b64encode(json.dumps(cursor, separators=(',', ':')).encode('utf-8')).decode('ascii')
+
+    def _position(self, instance):
+        position = []
+        for field in self.ordering:
+            value = getattr(instance, field.lstrip('-'))
+            position.append(value.isoformat() if hasattr(value, 'isoformat') else value)
+        return position
+
+    def _reversed(self, ordering):
+        return tuple(field[1:] if field.startswith('-') else f'-{field}' for field in ordering)
+
+    def _after(self, ordering, position):
+        # (a, b) > (x, y)  <=>  a > x OR (a = x AND b > y), z kierunkiem zależnym od znaku pola
+        condition = Q()
+        for index in reversed(range(len(ordering))):
+            field = ordering[index].lstrip('-')
+            lookup = 'lt' if ordering[index].startswith('-') else 'gt'
+            step = Q(**{f'{field}__{lookup}': position[index]})
+            if index < len(ordering) - 1:
+                step |= Q(**{field: position[index]}) & condition
+            condition = step
+        return condition
+
+class OrderCursorPagination(KeysetPagination):
+    ordering = ('-created_at', '-order_id')
+
+class NotificationCursorPagination(KeysetPagination):
+    ordering = ('-timestamp', '-id')
+
+class ChatMessageCursorPagination(KeysetPagination):
+    """
+    Najnowsze wiadomości na pierwszej stronie, każda strona w kolejności chronologicznej;
+    rel="next" prowadzi do starszych wiadomości. Zamiast kursora można podać id wiadomości:
+    ?before=<id> zwraca wiadomości starsze od niej, ?after=<id> nowsze.
+    """
+    ordering = ('-timestamp', '-id')
+    anchor_query_params = {'before': False, 'after': True}
+    invalid_anchor_message = 'Nie znaleziono wiadomości'
+
+    def get_query_params(self):
+        return super().get_query_params() + list(self.anchor_query_params)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.queryset = queryset
+        results = super().paginate_queryset(queryset, request, view)
+        results.reverse()
+        return results
+
+    def decode_cursor(self, request):
+        for param, reverse in self.anchor_query_params.items():
+            if request.query_params.get(param):
+                try:
+                    position = self.queryset.filter(id=request.query_params[param]).values_list('timestamp', 'id').first()
+                except ValueError:
+                    position = None
+                if position is None:
+                    raise NotFound(self.invalid_anchor_message)
+                return list(position), reverse
+        return super().decode_cursor(request)
+
+class BitsetPagination(KeysetPagination):
+    """
+    Stronicowanie po id wyników wyliczonych w pamięci (bitset id); z bazy pobierana
+    jest tylko bieżąca strona. Obsługuje wyłącznie przechodzenie do przodu (rel="next").
+    """
+    ordering = ('id',)
+
+    def paginate_bitset(self, bits, queryset, request):
+        self.request = request
+        page_size = self.get_page_size(request)
+        position, _ = self.decode_cursor(request)
+        if position is not None and (not isinstance(position[0], int) or position[0] < 0):
+            raise NotFound(self.invalid_cursor_message)
+
+        ids = bitset_ids(bits, after=position[0] if position is not None else -1, limit=page_size + 1)
+        self.position = position
+        self.has_more = len(ids) > page_size
+        ids = ids[:page_size]
+        self.next_position = [ids[-1]] if self.has_more else None
+        self.previous_position = None
+        return list(queryset.filter(id__in=ids).order_by('id'))
+
+class OrderChangesPagination(KeysetPagination):
+    """
+    Kanał zmian zamówień od kursora (updated_at, order_id). Kursor nigdy nie wyprzedza
+    now() - ORDER_CHANGES_LAG, więc zmiany z transakcji zatwierdzonych z opóźnieniem
+    zostaną zwrócone przy kolejnym odpytaniu (co najmniej raz).
+    """
+    ordering = ('updated_at', 'order_id')
+    page_size = 100
+    paginate_by_default = True
+
+    def paginate_queryset(self, queryset, request, view=None):
+        results = super().paginate_queryset(queryset, request, view)
+        settled = timezone.now() - settings.ORDER_CHANGES_LAG
+        if self.has_more:
+            self.cursor_position = self._position(results[-1])
+        elif results and results[-1].updated_at <= settled:
+            self.cursor_position = self._position(results[-1])
+        elif not results and self.position is not None:
+            self.cursor_position = self.position
+        else:
+            self.cursor_position = [settled.isoformat(), 0]
+        return results
+
+    def get_paginated_response(self, data):
+        return Response({
+            'orders': data,
+            'cursor': self.encode_token(self.cursor_position),
+            'has_more': self.has_more,
+        })
@@ -0,0 +1,37 @@
+import logging
+import threading
+import time
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+_stop = threading.Event()
+
+def run_pending(jobs, next_run):
+    now = time.monotonic()
+    for path, interval in jobs.items():
+        if next_run.get(path, 0) > now:
+            continue
+        next_run[path] = now + interval
+        close_old_connections()
+        try:
+            import_string(path)()
+        except Exception:
+            logger.exception(f"Periodic job {path} failed")
+        finally:
+            close_old_connections()
+
+def run_forever(jobs=None, tick=1):
+    """Pętla zadań okresowych; uruchamiana w jednym, osobnym procesie (`manage.py run_periodic_jobs`)."""
+    jobs = jobs if jobs is not None else settings.PERIODIC_JOBS
+    logger.info(f"Running periodic jobs: {', '.join(jobs)}")
+    _stop.clear()
+    next_run = {}
+    while not _stop.is_set():
+        run_pending(jobs, next_run)
+        _stop.wait(tick)
+
+def stop(*args):
+    _stop.set()
@@ -0,0 +1,75 @@
+import re
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector, TrigramWordSimilarity
+from django.db import connection
+from django.db.models import F, OuterRef, Q, Subquery
+from .models import Product, Restaurant
+
+# Konfiguracja tworzona w migracji 0034: słownik simple + unaccent (PostgreSQL nie ma stemmera
+# dla języka polskiego), więc "zurek" znajduje "Żurek", a odmiany łapie dopasowanie prefiksowe.
+SEARCH_CONFIG = 'polish_unaccent'
+MAX_TERMS = 8
+
+def search_enabled():
+    return connection.vendor == 'postgresql'
+
+def search_terms(text):
+    return re.findall(r'\w+', text or '')[:MAX_TERMS]
+
+def build_query(text):
+    terms = search_terms(text)
+    if not terms:
+        return None
+    return SearchQuery(' & '.join(f'{term}:*' for term in terms), search_type='raw', config=SEARCH_CONFIG)
+
+#Index
+def update_restaurant_vectors(restaurant_ids):
+    if not search_enabled() or not restaurant_ids:
+        return
+    tag_names = Restaurant.tags.through.objects.filter(restaurant_id=OuterRef('pk')).values('restaurant_id').annotate(
+        names=StringAgg('tag__name', delimiter=' ')
+    ).values('names')
+    Restaurant.objects.filter(pk__in=restaurant_ids).update(search_vector=(
+        SearchVector('name', weight='A', config=SEARCH_CONFIG)
+        + SearchVector(Subquery(tag_names), weight='B', config=SEARCH_CONFIG)
+        + SearchVector('description', weight='C', config=SEARCH_CONFIG)
+    ))
+
+def update_product_vectors(product_ids):
+    if not search_enabled() or not product_ids:
+        return
+    Product.objects.filter(pk__in=product_ids).update(search_vector=(
+        SearchVector('name', weight='A', config=SEARCH_CONFIG)
+        + SearchVector('description', weight='B', config=SEARCH_CONFIG)
+    ))
+
+#Search
+def search_restaurants(text):
+    restaurants = Restaurant.objects.prefetch_related('tags', 'delivery_cities')
+    if not search_enabled():
+        condition = Q()
+        for term in search_terms(text):
+            condition &= Q(name__icontains=term) | Q(description__icontains=term) | Q(tags__name__icontains=term)
+        return restaurants.filter(condition).distinct().order_by('id')
+    return _ranked(restaurants, text)
+
+def search_products(text):
+    products = Product.objects.filter(is_available=True, archived=False).select_related('restaurant')
+    if not search_enabled():
+        condition = Q()
+        for term in search_terms(text):
+            condition &= Q(name__icontains=term) | Q(description__icontains=term)
+        return products.filter(condition).order_by('id')
+    return _ranked(products, text)
+
+def _ranked(queryset, text):
+    # Najpierw pełnotekstowo po indeksie GIN; gdy nic nie pasuje (literówka), trigramy po nazwie.
+    query = build_query(text)
+    matches = queryset.filter(search_vector=query).annotate(
+        rank=SearchRank(F('search_vector'), query)
+    ).order_by('-rank', 'id')
+    if matches.exists():
+        return matches
+    return queryset.filter(name__trigram_word_similar=text).annotate(
+        rank=TrigramWordSimilarity(text, 'name')
+    ).order_by('-rank', 'id')
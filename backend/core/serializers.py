@@ -62,7 +62,53 @@ class CitySerializer(serializers.ModelSerializer):
         model = City
         fields = ['id', 'name']
         
-class RestaurantSerializer(serializers.ModelSerializer):
+class SparseFieldsMixin:
+    """
+    Dla zapytań GET: ?fields=a,b zostawia tylko wskazane pola, a ?expand=x,y wybiera pola
+    zagnieżdżone (serializery) razem z ich prefetchami, także bez ?fields. Pole zagnieżdżone
+    trafia do odpowiedzi, gdy jest w ?fields albo ?expand; bez obu parametrów serializer zwraca
+    pełną reprezentację. `prefetch_fields` mapuje pola zagnieżdżone na prefetch_related, żeby
+    widok pobierał tylko potrzebne relacje.
+    Dotyczy wyłącznie serializera najwyższego poziomu (także jako elementu listy).
+    """
+    prefetch_fields = {}
+
+    @staticmethod
+    def requested_fields(request):
+        """Nazwy z ?fields i ?expand; None dla parametru, którego nie podano."""
+        if request is None or request.method != 'GET':
+            return None, None
+        fields, expand = request.query_params.get('fields'), request.query_params.get('expand')
+        return (
+            {name.strip() for name in fields.split(',') if name.strip()} if fields else None,
+            {name.strip() for name in expand.split(',') if name.strip()} if expand is not None else None,
+        )
+
+    @staticmethod
+    def is_requested(name, nested, fields, expand):
+        if nested and (fields is not None or expand is not None):
+            return name in (fields or set()) | (expand or set())
+        return fields is None or name in fields
+
+    @classmethod
+    def get_prefetches(cls, request):
+        fields, expand = cls.requested_fields(request)
+        return [
+            lookup for field, lookups in cls.prefetch_fields.items()
+            if cls.is_requested(field, True, fields, expand) for lookup in lookups
+        ]
+
+    def get_fields(self):
+        fields = super().get_fields()
+        is_top_level = self.parent is None or (isinstance(self.parent, serializers.ListSerializer) and self.parent.parent is None)
+        if is_top_level:
+            requested, expand = self.requested_fields(self.context.get('request'))
+            for name, field in list(fields.items()):
+                if not self.is_requested(name, isinstance(field, serializers.BaseSerializer), requested, expand):
+                    fields.pop(name)
+        return fields
+
+class RestaurantSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     #image_url = serializers.SerializerMethodField()
     delivery_cities = CitySerializer(many=True, read_only=True)
     tags = TagSerializer(many=True, read_only=True)
@@ -75,7 +121,12 @@ class RestaurantSerializer(serializers.ModelSerializer):
         fields = ['id', 'name', 'phone_number', 'description', 'image', 'tags', 'tag_ids','allows_online_payment', 'allows_cash_payment', 'allows_delivery', 'allows_pickup', 'minimum_order_amount', 'delivery_cities']
         #fields = ['name', 'address', 'phone_number', 'description']        
 
-class RestaurantWithAddressSerializer(serializers.ModelSerializer):
+    prefetch_fields = {
+        'tags': ['tags'],
+        'delivery_cities': ['delivery_cities'],
+    }
+
+class RestaurantWithAddressSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     address = AddressSerializer(source='address_set', many=True, read_only=True)
     
     tags = TagSerializer(many=True, read_only=True)
@@ -87,6 +138,39 @@ class RestaurantWithAddressSerializer(serializers.ModelSerializer):
         model = Restaurant
         fields = ['id', 'name', 'phone_number', 'description', 'image', 'tags', 'tag_ids','allows_online_payment', 'allows_cash_payment', 'allows_delivery', 'allows_pickup', 'minimum_order_amount', 'owner', 'address']
 
+    prefetch_fields = {
+        'tags': ['tags'],
+        'address': ['address_set__user'],
+    }
+
+class DeliveryZoneSerializer(serializers.ModelSerializer):
+    prefix = serializers.RegexField(r'^\d{1,5}$', write_only=True, required=False)
+    postal_code_from = serializers.CharField(max_length=6, required=False)
+    postal_code_to = serializers.CharField(max_length=6, required=False)
+
+    class Meta:
+        model = DeliveryZone
+        fields = ['id', 'prefix', 'postal_code_from', 'postal_code_to']
+
+    def to_representation(self, instance):
+        return {
+            'id': instance.id,
+            'postal_code_from': format_postal_code(instance.start),
+            'postal_code_to': format_postal_code(instance.end),
+        }
+
+    def validate(self, data):
+        if data.get('prefix'):
+            start, end = DeliveryZone.prefix_range(data['prefix'])
+        else:
+            start = normalize_postal_code(data.get('postal_code_from'))
+            end = normalize_postal_code(data.get('postal_code_to', data.get('postal_code_from')))
+            if start is None or end is None:
+                raise serializers.ValidationError("Podaj prefiks lub poprawne kody pocztowe (np. 31-000).")
+            if end < start:
+                raise serializers.ValidationError("Kod końcowy nie może być mniejszy niż początkowy.")
+        return {'start': start, 'end': end}
+
 class RestaurateurRegistrationSerializer(serializers.ModelSerializer):
     restaurant = RestaurantSerializer()
 
@@ -114,7 +198,7 @@ class RestaurateurRegistrationSerializer(serializers.ModelSerializer):
             restaurant.tags.set(tags)
         return user
 
-class RestaurantProfileSerializer(serializers.ModelSerializer):
+class RestaurantProfileSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     restaurant = RestaurantSerializer(read_only=True)  
 
     class Meta:
@@ -127,6 +211,12 @@ class ProductSerializer(serializers.ModelSerializer):
         model = Product
         fields = ['id', 'restaurant', 'name', 'description', 'price', 'is_available', 'image', 'archived']
 
+class ProductSearchSerializer(ProductSerializer):
+    restaurant_name = serializers.CharField(source='restaurant.name', read_only=True)
+
+    class Meta(ProductSerializer.Meta):
+        fields = ProductSerializer.Meta.fields + ['restaurant_name']
+
 #Cart
 class CartItemSerializer(serializers.ModelSerializer):
     #product = serializers.StringRelatedField()
@@ -145,6 +235,10 @@ class CartItemSerializer(serializers.ModelSerializer):
         #print('Validating data:', data)  
         return data
 
+class CartItemOperationSerializer(serializers.Serializer):
+    product = serializers.IntegerField()
+    quantity = serializers.IntegerField(min_value=1, default=1)
+
 class CartSerializer(serializers.ModelSerializer):
     items = CartItemSerializer(many=True, read_only=True)
     restaurant = serializers.SerializerMethodField()
@@ -154,7 +248,7 @@ class CartSerializer(serializers.ModelSerializer):
         fields = ['id', 'session_id', 'created_at', 'total_price', 'items','restaurant']
         
     def get_restaurant(self, obj):
-        first_item = obj.items.first()
+        first_item = next(iter(obj.items.all()), None)
         if first_item:
             return RestaurantSerializer(first_item.product.restaurant).data
         return None
@@ -179,15 +273,18 @@ class OrderViewSerializer(serializers.ModelSerializer):
     address = AddressSerializer(read_only=True)
     restaurant = RestaurantSerializer(read_only=True)  
     total_price = serializers.DecimalField(source='cart.total_price', max_digits=10, decimal_places=2, read_only=True)  
+    archived = serializers.BooleanField(source='is_archived', read_only=True)
 
     class Meta:
         model = Order
         fields = ['order_id', 'cart', 'items', 'restaurant', 'address', 'user', 'is_paid', 'payment_type', 'delivery_type', 'order_notes', 'status', 'history', 'created_at', 'updated_at', 'total_price', 'archived']
 
 class ChatMessageSerializer(serializers.ModelSerializer):
+    id = serializers.CharField(read_only=True)
+
     class Meta:
         model = ChatMessage
-        fields = ['user', 'message', 'timestamp']
+        fields = ['id', 'user', 'message', 'timestamp']
 
 class NotificationSerializer(serializers.ModelSerializer):
     class Meta:
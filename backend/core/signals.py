@@ -0,0 +1,176 @@
+from django.db.models.signals import post_save, post_delete, pre_delete, m2m_changed
+from django.dispatch import receiver
+from .cache import invalidate
+from .models import Address, City, DeliveryZone, Product, Restaurant, RestaurantCity, Tag
+from .search import search_enabled, update_product_vectors, update_restaurant_vectors
+from .tagindex import tag_index
+from .autocomplete import AUTOCOMPLETE_CACHE
+from .zones import DELIVERY_ZONES_CACHE
+
+RESTAURANTS_CACHE = 'restaurants'
+CITIES_CACHE = 'cities'
+
+#Restaurant
+@receiver(post_save, sender=Restaurant)
+@receiver(post_delete, sender=Restaurant)
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def restaurant_changed(sender, **kwargs):
+    invalidate(RESTAURANTS_CACHE)
+    invalidate(AUTOCOMPLETE_CACHE)
+
+@receiver(m2m_changed, sender=Restaurant.tags.through)
+def restaurant_tags_changed(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        invalidate(RESTAURANTS_CACHE)
+
+#City list
+@receiver(post_save, sender=Address)
+@receiver(post_delete, sender=Address)
+def restaurant_address_changed(sender, instance, **kwargs):
+    if instance.owner_role == 'restaurateur':
+        invalidate(CITIES_CACHE)
+        invalidate(AUTOCOMPLETE_CACHE)
+
+@receiver(post_save, sender=City)
+@receiver(post_delete, sender=City)
+def city_list_changed(sender, **kwargs):
+    invalidate(CITIES_CACHE)
+    invalidate(AUTOCOMPLETE_CACHE)
+
+#City index
+@receiver(post_save, sender=Address)
+@receiver(post_delete, sender=Address)
+def address_changed(sender, instance, **kwargs):
+    if instance.restaurant_id:
+        RestaurantCity.rebuild([instance.restaurant_id])
+        invalidate(RESTAURANTS_CACHE)
+
+@receiver(m2m_changed, sender=Restaurant.delivery_cities.through)
+def delivery_cities_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'pre_clear' and reverse:
+        instance._cleared_restaurant_ids = list(instance.restaurant_set.values_list('id', flat=True))
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+
+    if not reverse:
+        restaurant_ids = [instance.pk]
+    elif action == 'post_clear':
+        restaurant_ids = getattr(instance, '_cleared_restaurant_ids', [])
+    else:
+        restaurant_ids = pk_set or []
+    RestaurantCity.rebuild(restaurant_ids)
+    invalidate(RESTAURANTS_CACHE)
+
+@receiver(pre_delete, sender=City)
+def city_deleting(sender, instance, **kwargs):
+    instance._restaurant_ids = list(instance.restaurant_set.values_list('id', flat=True))
+
+@receiver(post_save, sender=City)
+@receiver(post_delete, sender=City)
+def city_changed(sender, instance, created=False, **kwargs):
+    if created:
+        return
+    restaurant_ids = getattr(instance, '_restaurant_ids', None)
+    if restaurant_ids is None:
+        restaurant_ids = list(instance.restaurant_set.values_list('id', flat=True))
+    RestaurantCity.rebuild(restaurant_ids)
+    invalidate(RESTAURANTS_CACHE)
+
+#Delivery zones
+@receiver(post_save, sender=DeliveryZone)
+@receiver(post_delete, sender=DeliveryZone)
+def delivery_zone_changed(sender, **kwargs):
+    invalidate(DELIVERY_ZONES_CACHE)
+    invalidate(RESTAURANTS_CACHE)
+
+#Menu
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def product_changed(sender, instance, **kwargs):
+    Restaurant.bump_menu_version(instance.restaurant_id)
+
+#Search index
+@receiver(post_save, sender=Restaurant)
+def restaurant_saved(sender, instance, **kwargs):
+    update_restaurant_vectors([instance.pk])
+
+@receiver(m2m_changed, sender=Restaurant.tags.through)
+def restaurant_tags_reindex(sender, instance, action, reverse, pk_set, **kwargs):
+    if not search_enabled():
+        return
+    if action == 'pre_clear' and reverse:
+        instance._tagged_restaurant_ids = list(instance.restaurants.values_list('id', flat=True))
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+
+    if not reverse:
+        restaurant_ids = [instance.pk]
+    elif action == 'post_clear':
+        restaurant_ids = getattr(instance, '_tagged_restaurant_ids', [])
+    else:
+        restaurant_ids = pk_set or []
+    update_restaurant_vectors(restaurant_ids)
+
+@receiver(pre_delete, sender=Tag)
+def tag_deleting(sender, instance, **kwargs):
+    if search_enabled():
+        instance._tagged_restaurant_ids = list(instance.restaurants.values_list('id', flat=True))
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def tag_reindex(sender, instance, created=False, **kwargs):
+    if created or not search_enabled():
+        return
+    restaurant_ids = getattr(instance, '_tagged_restaurant_ids', None)
+    if restaurant_ids is None:
+        restaurant_ids = list(instance.restaurants.values_list('id', flat=True))
+    update_restaurant_vectors(restaurant_ids)
+
+@receiver(post_save, sender=Product)
+def product_saved(sender, instance, **kwargs):
+    update_product_vectors([instance.pk])
+
+#Tag index
+@receiver(post_save, sender=Restaurant)
+def restaurant_indexed(sender, instance, created, **kwargs):
+    if created:
+        restaurant_id = instance.pk
+        tag_index.changed(lambda index: index.add_restaurant(restaurant_id))
+
+@receiver(post_delete, sender=Restaurant)
+def restaurant_unindexed(sender, instance, **kwargs):
+    restaurant_id = instance.pk
+    tag_index.changed(lambda index: index.remove_restaurant(restaurant_id))
+
+@receiver(post_save, sender=Tag)
+def tag_indexed(sender, instance, **kwargs):
+    tag_id, name = instance.pk, instance.name
+    tag_index.changed(lambda index: index.set_tag(tag_id, name))
+
+@receiver(post_delete, sender=Tag)
+def tag_unindexed(sender, instance, **kwargs):
+    tag_id = instance.pk
+    tag_index.changed(lambda index: index.remove_tag(tag_id))
+
+@receiver(m2m_changed, sender=Restaurant.tags.through)
+def restaurant_tags_indexed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'pre_clear':
+        if reverse:
+            instance._cleared_tag_pairs = [(restaurant_id, instance.pk) for restaurant_id in instance.restaurants.values_list('id', flat=True)]
+        else:
+            instance._cleared_tag_pairs = [(instance.pk, tag_id) for tag_id in instance.tags.values_list('id', flat=True)]
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+
+    if action == 'post_clear':
+        pairs = getattr(instance, '_cleared_tag_pairs', [])
+    elif reverse:
+        pairs = [(restaurant_id, instance.pk) for restaurant_id in pk_set or []]
+    else:
+        pairs = [(instance.pk, tag_id) for tag_id in pk_set or []]
+    tagged = action == 'post_add'
+    tag_index.changed(lambda index: index.tag_restaurants(pairs, tagged))
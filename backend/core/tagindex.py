@@ -0,0 +1,138 @@
+import threading
+from django.db import transaction
+from .cache import bump_version, shared_version
+from .models import Restaurant, Tag
+
+TAG_INDEX_CACHE = 'tag_index'
+
+def to_bitset(ids):
+    bits = 0
+    for id in ids:
+        bits |= 1 << id
+    return bits
+
+def bitset_ids(bits, after=-1, limit=None):
+    """Rosnące id z bitsetu większe od `after`, najwyżej `limit` sztuk."""
+    bits >>= after + 1
+    id = after + 1
+    ids = []
+    while bits and (limit is None or len(ids) < limit):
+        skip = (bits & -bits).bit_length() - 1
+        id += skip
+        ids.append(id)
+        bits >>= skip + 1
+        id += 1
+    return ids
+
+class TagIndex:
+    """
+    Indeks restauracji po tagach w pamięci procesu: jeden bitset id restauracji na tag.
+    Budowany przy pierwszym użyciu i ponownie, gdy inny proces zmieni wersję w cache;
+    zmiany z bieżącego procesu są nakładane przyrostowo przez sygnały (core/signals.py).
+    Bez wspólnego cache budowany z bazy przy każdym użyciu (core.cache.shared_version).
+    """
+    def __init__(self):
+        self._lock = threading.RLock()
+        self.version = None
+        self.restaurants = 0
+        self.tags = {}
+        self.names = {}
+
+    def ensure_current(self):
+        version = shared_version(TAG_INDEX_CACHE)
+        if version is None or version != self.version:
+            with self._lock:
+                if version is None or version != self.version:
+                    self.rebuild(version)
+
+    def rebuild(self, version):
+        # Wersja odczytana przed danymi: zmiana zatwierdzona w trakcie wymusi kolejną przebudowę
+        tags = {}
+        names = {}
+        for tag_id, name in Tag.objects.values_list('id', 'name'):
+            tags[tag_id] = 0
+            names[name] = tag_id
+        for restaurant_id, tag_id in Restaurant.tags.through.objects.values_list('restaurant_id', 'tag_id'):
+            tags[tag_id] |= 1 << restaurant_id
+        self.restaurants = to_bitset(Restaurant.objects.values_list('id', flat=True))
+        self.tags = tags
+        self.names = names
+        self.version = version
+
+    def select(self, tag_names, match='any', exclude=()):
+        self.ensure_current()
+        with self._lock:
+            tag_names = set(tag_names)
+            tag_bits = [self.tags[self.names[name]] for name in tag_names if name in self.names]
+            if not tag_names:
+                bits = self.restaurants
+            elif match == 'all':
+                bits = self.restaurants if len(tag_bits) == len(tag_names) else 0
+                for tag in tag_bits:
+                    bits &= tag
+            else:
+                bits = 0
+                for tag in tag_bits:
+                    bits |= tag
+            for name in exclude:
+                if name in self.names:
+                    bits &= ~self.tags[self.names[name]]
+            return bits
+
+    def tag_counts(self, bits):
+        """Liczba restauracji z `bits` posiadających każdy z tagów: {tag_id: (name, count)}."""
+        self.ensure_current()
+        with self._lock:
+            return {tag_id: (name, (bits & self.tags[tag_id]).bit_count()) for name, tag_id in self.names.items()}
+
+    def changed(self, change):
+        """
+        Poza transakcją nakłada zmianę od razu. W transakcji unieważnia indeks od razu
+        (odczyt w tej samej transakcji przebuduje go z niezatwierdzonymi danymi) i nakłada
+        zmianę po commicie. Zmiana jest nakładana tylko wtedy, gdy nikt inny nie zmienił
+        wersji w międzyczasie; w przeciwnym razie indeks zostanie przebudowany.
+        """
+        if not transaction.get_connection().in_atomic_block:
+            self._apply(change)
+            return
+        self._apply(None)
+        transaction.on_commit(lambda: self._apply(change))
+
+    def _apply(self, change):
+        with self._lock:
+            version = bump_version(TAG_INDEX_CACHE)
+            if change is not None and self.version is not None and version == self.version + 1:
+                change(self)
+                self.version = version
+            else:
+                self.version = None
+
+    #Zmiany
+    def add_restaurant(self, restaurant_id):
+        self.restaurants |= 1 << restaurant_id
+
+    def remove_restaurant(self, restaurant_id):
+        mask = ~(1 << restaurant_id)
+        self.restaurants &= mask
+        for tag_id in self.tags:
+            self.tags[tag_id] &= mask
+
+    def set_tag(self, tag_id, name):
+        self.names = {key: value for key, value in self.names.items() if value != tag_id}
+        self.names[name] = tag_id
+        self.tags.setdefault(tag_id, 0)
+
+    def remove_tag(self, tag_id):
+        self.names = {key: value for key, value in self.names.items() if value != tag_id}
+        self.tags.pop(tag_id, None)
+
+    def tag_restaurants(self, pairs, tagged):
+        for restaurant_id, tag_id in pairs:
+            if tag_id not in self.tags:
+                continue
+            if tagged:
+                self.tags[tag_id] |= 1 << restaurant_id
+            else:
+                self.tags[tag_id] &= ~(1 << restaurant_id)
+
+tag_index = TagIndex()
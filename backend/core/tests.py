@@ -1,17 +1,22 @@
 from unittest.mock import patch, call
 from decimal import Decimal
 import hashlib
+import math
 import time
 from django.utils import timezone
 from datetime import timedelta
-from django.test import TestCase
+from django.test import TestCase, TransactionTestCase, override_settings
+from channels.db import database_sync_to_async
 from django.urls import reverse
 from rest_framework import status
 from rest_framework.test import APIClient
 from django.http import JsonResponse
 from .models import *
 from .serializers import *
+from .carts import get_cart_backend
+from django.core.cache import cache
 import cloudinary
+from io import StringIO
 
 #User
 class UserLoginTest(TestCase):
@@ -558,6 +563,116 @@ class RestaurantListTest(TestCase):
         response = self.client.get(url)
         self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
         self.assertEqual(response.data['error'], 'Nie znaleziono restauracji')
+
+    def test_city_index_follows_changes(self):
+        self.assertEqual(
+            set(RestaurantCity.objects.values_list('restaurant_id', 'city', 'source')),
+            {
+                (self.restaurant1.id, 'sample city', 'address'),
+                (self.restaurant2.id, 'another city', 'address'),
+                (self.restaurant2.id, 'sample city', 'delivery'),
+            }
+        )
+        self.restaurant2.delivery_cities.remove(self.city1)
+        self.address1.city = 'New City'
+        self.address1.save()
+        self.assertEqual(
+            set(RestaurantCity.objects.values_list('restaurant_id', 'city')),
+            {(self.restaurant1.id, 'new city'), (self.restaurant2.id, 'another city')}
+        )
+
+    def _place_order(self, restaurant, session_id):
+        return Order.objects.create(
+            user=self.user1,
+            restaurant=restaurant,
+            address=self.address1,
+            cart=Cart.objects.create(session_id=session_id),
+            payment_type='card',
+            delivery_type='delivery'
+        )
+
+    def test_get_restaurants_ordered_by_popularity(self):
+        self._place_order(self.restaurant2, 'session1')
+        url = reverse('restaurant-list')
+        response = self.client.get(url, {'ordering': 'popular'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([r['name'] for r in response.data], ['Restaurant 2', 'Restaurant 1'])
+
+        response = self.client.get(url, {'ordering': 'rating'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_popularity_rollup_matches_increments(self):
+        from core.jobs import rollup_popularity
+        for i in range(3):
+            self._place_order(self.restaurant1, f'session{i}')
+        old_order = self._place_order(self.restaurant2, 'old')
+        Order.objects.filter(pk=old_order.pk).update(created_at=old_order.created_at - timedelta(days=1))
+        popularity = Restaurant.objects.get(pk=self.restaurant1.pk).popularity
+        self.assertGreater(popularity, 0)
+
+        self.assertEqual(rollup_popularity(), 1)
+        self.assertAlmostEqual(Restaurant.objects.get(pk=self.restaurant1.pk).popularity, popularity)
+        # zamówienie sprzed doby waży 2^(-1/7) zamówienia bieżącego (popularność w skali log2)
+        restaurant2 = Restaurant.objects.get(pk=self.restaurant2.pk)
+        self.assertAlmostEqual(restaurant2.popularity - (popularity - math.log2(3)), -1 / 7, places=3)
+
+    def test_popularity_does_not_overflow_in_the_far_future(self):
+        from datetime import datetime, timezone as dt_timezone
+        exponent = popularity_exponent(datetime(2100, 1, 1, tzinfo=dt_timezone.utc))
+        for _ in range(2):
+            Restaurant.objects.filter(pk=self.restaurant1.pk).update(popularity=added_popularity(exponent))
+        self.assertAlmostEqual(Restaurant.objects.get(pk=self.restaurant1.pk).popularity, exponent + 1)
+        self.assertAlmostEqual(add_popularity(add_popularity(0.0, exponent), exponent), exponent + 1)
+
+    def test_get_restaurants_sparse_fields(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        url = reverse('restaurant-list')
+        with CaptureQueriesContext(connection) as full:
+            response = self.client.get(url)
+        self.assertIn('address', response.data[0])
+        full_queries = len(full)
+
+        with CaptureQueriesContext(connection) as sparse:
+            response = self.client.get(url, {'fields': 'id,name,image,tags'})
+        self.assertEqual(set(response.data[0]), {'id', 'name', 'image', 'tags'})
+        self.assertLess(len(sparse), full_queries)
+
+        response = self.client.get(url, {'fields': 'id,name', 'expand': 'address'})
+        self.assertEqual(set(response.data[0]), {'id', 'name', 'address'})
+        self.assertEqual(response.data[0]['address'][0]['email'], 'owner1@example.com')
+
+        # Samo ?expand wybiera zagnieżdżone reprezentacje (i ich prefetch) przy wszystkich polach prostych
+        with CaptureQueriesContext(connection) as expanded:
+            response = self.client.get(url, {'expand': 'tags'})
+        self.assertLess(len(expanded), full_queries)
+        self.assertIn('tags', response.data[0])
+        self.assertIn('minimum_order_amount', response.data[0])
+        self.assertNotIn('address', response.data[0])
+        response = self.client.get(url, {'expand': ''})
+        self.assertNotIn('tags', response.data[0])
+        self.assertIn('name', response.data[0])
+
+    @override_settings(RESTAURANT_LIST_CACHE_TIMEOUT=10 * 60)
+    def test_get_restaurants_by_city_is_cached(self):
+        url = reverse('restaurant-list') + '?city=  sample   CITY '
+        response = self.client.get(url)
+        self.assertEqual(len(response.data), 2)
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertEqual(len(response.data), 2)
+
+        self.restaurant2.delivery_cities.remove(self.city1)
+        response = self.client.get(url)
+        self.assertEqual([restaurant['id'] for restaurant in response.data], [self.restaurant1.id])
+
+    @override_settings(RESTAURANT_LIST_CACHE_TIMEOUT=0)
+    def test_restaurants_not_cached_without_shared_cache(self):
+        url = reverse('restaurant-list') + '?city=Sample City'
+        self.client.get(url)
+        Restaurant.objects.filter(pk=self.restaurant2.pk).update(name='Renamed')
+        response = self.client.get(url)
+        self.assertIn('Renamed', [restaurant['name'] for restaurant in response.data])
         
 class RestaurantProfileTest(TestCase):
     def setUp(self):
@@ -607,6 +722,19 @@ class RestaurantProfileTest(TestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response.data['restaurant']['name'], 'Other Restaurant')
 
+    def test_get_restaurant_profile_sparse_fields(self):
+        url = reverse('restaurant_user')
+        response = self.client.get(url, {'fields': 'first_name,email'})
+        self.assertEqual(set(response.data), {'first_name', 'email'})
+
+        response = self.client.get(url, {'fields': 'email', 'expand': 'restaurant'})
+        self.assertEqual(set(response.data), {'email', 'restaurant'})
+        self.assertIn('delivery_cities', response.data['restaurant'])
+
+        response = self.client.get(url, {'expand': ''})
+        self.assertNotIn('restaurant', response.data)
+        self.assertIn('email', response.data)
+
 class RestaurantUpdateTest(TestCase):
     def setUp(self):
         self.client = APIClient()
@@ -721,6 +849,48 @@ class CityListTest(TestCase):
         response = self.client.get(url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response.data, ['Another City', 'Sample City'])
+
+    @override_settings(CITY_LIST_CACHE_TIMEOUT=60 * 60)
+    def test_get_city_list_cached(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        url = reverse('city-list')
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.data, ['Another City', 'Sample City'])
+        self.assertEqual(len(queries), 0)
+
+    @override_settings(SHARED_CACHE=True)
+    def test_get_city_list_not_modified(self):
+        url = reverse('city-list')
+        response = self.client.get(url)
+        etag = response['ETag']
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response.content, b'')
+
+    @override_settings(SHARED_CACHE=True)
+    def test_get_city_list_invalidated(self):
+        url = reverse('city-list')
+        etag = self.client.get(url)['ETag']
+        City.objects.create(name='New City')
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, ['Another City', 'New City', 'Sample City'])
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_get_city_list_without_etag_without_shared_cache(self):
+        url = reverse('city-list')
+        response = self.client.get(url)
+        self.assertNotIn('ETag', response)
+
+        City.objects.create(name='New City')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH='*')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data, ['Another City', 'New City', 'Sample City'])
  
 #DeliveryCity       
 class AddDeliveryCityTest(TestCase):
@@ -836,6 +1006,100 @@ class RemoveDeliveryCityTest(TestCase):
         self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
         self.assertEqual(response.data['detail'], "You do not have permission to modify this restaurant's delivery cities.")
 
+#DeliveryZone
+class DeliveryZoneTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        cache.clear()
+        self.user = AppUser.objects.create_user(email='owner@example.com', password='testpass', role='restaurateur')
+        self.other_user = AppUser.objects.create_user(email='other@example.com', password='testpass', role='restaurateur')
+        self.restaurant = Restaurant.objects.create(owner=self.user, name='Test Restaurant', phone_number='123456789')
+        self.other_restaurant = Restaurant.objects.create(owner=self.other_user, name='Other Restaurant', phone_number='987654321')
+        for user, restaurant in ((self.user, self.restaurant), (self.other_user, self.other_restaurant)):
+            Address.objects.create(
+                user=user, restaurant=restaurant, street='Main St', building_number=1, city='Kraków',
+                postal_code='31-000', phone_number='123456789', owner_role='restaurateur'
+            )
+        self.client.force_authenticate(user=self.user)
+        self.url = reverse('delivery-zone-list', args=[self.restaurant.id])
+
+    def test_create_zones(self):
+        response = self.client.post(self.url, {'prefix': '31'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        response = self.client.post(self.url, {'postal_code_from': '30-100', 'postal_code_to': '30-199'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        response = self.client.get(self.url)
+        self.assertEqual(
+            [(zone['postal_code_from'], zone['postal_code_to']) for zone in response.data],
+            [('30-100', '30-199'), ('31-000', '31-999')]
+        )
+
+    def test_create_zone_invalid_range(self):
+        response = self.client.post(self.url, {'postal_code_from': '31-999', 'postal_code_to': '31-000'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.post(self.url, {'postal_code_from': '31'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_create_zone_not_owner(self):
+        url = reverse('delivery-zone-list', args=[self.other_restaurant.id])
+        response = self.client.post(url, {'prefix': '31'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_delete_zone(self):
+        zone = DeliveryZone.objects.create(restaurant=self.restaurant, start=31000, end=31999)
+        url = reverse('delivery-zone-delete', args=[self.restaurant.id, zone.id])
+        response = self.client.delete(url)
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertFalse(DeliveryZone.objects.exists())
+
+    def test_restaurants_delivering_to_postal_code(self):
+        DeliveryZone.objects.create(restaurant=self.restaurant, start=31000, end=31499)
+        DeliveryZone.objects.create(restaurant=self.restaurant, start=31500, end=31999)
+        DeliveryZone.objects.create(restaurant=self.other_restaurant, start=31400, end=32999)
+        url = reverse('restaurant-list')
+
+        response = self.client.get(url, {'postal_code': '31-450'})
+        self.assertEqual([r['name'] for r in response.data], ['Test Restaurant', 'Other Restaurant'])
+        response = self.client.get(url, {'postal_code': '32500'})
+        self.assertEqual([r['name'] for r in response.data], ['Other Restaurant'])
+        response = self.client.get(url, {'postal_code': '30-000'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        response = self.client.get(url, {'postal_code': '3'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_restaurants_without_zones_match_postal_code_by_city(self):
+        DeliveryZone.objects.create(restaurant=self.restaurant, start=31000, end=31499)
+        owner = AppUser.objects.create_user(email='city@example.com', password='testpass', role='restaurateur')
+        city_restaurant = Restaurant.objects.create(owner=owner, name='City Restaurant', phone_number='111222333')
+        Address.objects.create(
+            user=owner, restaurant=city_restaurant, street='Main St', building_number=2, city='Warszawa',
+            postal_code='00-001', phone_number='111222333', owner_role='restaurateur'
+        )
+        city_restaurant.delivery_cities.add(City.objects.create(name='Kraków'))
+        url = reverse('restaurant-list')
+
+        # Other Restaurant nie ma stref, ale ma adres w Krakowie
+        response = self.client.get(url, {'postal_code': '31-450', 'city': 'Kraków'})
+        self.assertEqual([r['name'] for r in response.data], ['Test Restaurant', 'Other Restaurant', 'City Restaurant'])
+        response = self.client.get(url, {'postal_code': '31-600', 'city': 'Kraków'})
+        self.assertEqual([r['name'] for r in response.data], ['Other Restaurant', 'City Restaurant'])
+        response = self.client.get(url, {'postal_code': '31-450', 'city': 'Gdańsk'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_zone_index_reads_database_without_shared_cache(self):
+        from core.zones import zone_index
+        DeliveryZone.objects.create(restaurant=self.restaurant, start=31000, end=31499)
+        url = reverse('restaurant-list')
+        response = self.client.get(url, {'postal_code': '31-600'})
+        self.assertEqual([r['name'] for r in response.data], ['Other Restaurant'])
+
+        # Zmiana z pominięciem sygnałów - inny proces bez wspólnego cache nie dostałby nowej wersji
+        DeliveryZone.objects.filter(restaurant=self.restaurant).update(end=31999)
+        self.assertTrue(zone_index.delivers(self.restaurant.id, 31600))
+        response = self.client.get(url, {'postal_code': '31-700'})
+        self.assertEqual([r['name'] for r in response.data], ['Test Restaurant', 'Other Restaurant'])
+
 #Cloudinary
 class GenerateUploadSignatureTest(TestCase):
     def setUp(self):
@@ -1053,7 +1317,176 @@ class FilterRestaurantsByTagsTest(TestCase):
         response = self.client.get(url, {'tags': ['NonexistentTag']})
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(len(response.data), 0)
+
+    def test_filter_restaurants_match_all(self):
+        url = reverse('filter-restaurants-by-tags')
+        response = self.client.get(url, {'tags': ['Tag1', 'Tag2'], 'match': 'all'})
+        self.assertEqual([r['name'] for r in response.data], ['Restaurant 1'])
+
+        response = self.client.get(url, {'tags': ['Tag1', 'NonexistentTag'], 'match': 'all'})
+        self.assertEqual(response.data, [])
+
+    def test_filter_restaurants_exclude(self):
+        url = reverse('filter-restaurants-by-tags')
+        response = self.client.get(url, {'tags': ['Tag2'], 'exclude': ['Tag3']})
+        self.assertEqual([r['name'] for r in response.data], ['Restaurant 1'])
+
+        response = self.client.get(url, {'exclude': ['Tag1']})
+        self.assertEqual([r['name'] for r in response.data], ['Restaurant 2'])
+
+    def test_filter_restaurants_by_tags_and_city(self):
+        city = City.objects.create(name='Kraków')
+        self.restaurant2.delivery_cities.add(city)
+        url = reverse('filter-restaurants-by-tags')
+        response = self.client.get(url, {'tags': ['Tag2'], 'city': 'kraków'})
+        self.assertEqual([r['name'] for r in response.data], ['Restaurant 2'])
+
+    def test_tag_index_reads_database_without_shared_cache(self):
+        url = reverse('filter-restaurants-by-tags')
+        self.assertEqual([r['name'] for r in self.client.get(url, {'tags': ['Tag2']}).data], ['Restaurant 1', 'Restaurant 2'])
+        # Zmiana z innego procesu: bez sygnałów w tym procesie, a wersja w LocMem innego workera
+        Restaurant.tags.through.objects.filter(restaurant=self.restaurant1).delete()
+        self.assertEqual([r['name'] for r in self.client.get(url, {'tags': ['Tag2']}).data], ['Restaurant 2'])
+
+    def test_filter_restaurants_pagination(self):
+        url = reverse('filter-restaurants-by-tags')
+        response = self.client.get(url, {'tags': ['Tag2'], 'page_size': 1})
+        self.assertEqual([r['name'] for r in response.data], ['Restaurant 1'])
+        next_url = response['Link'].split(';')[0].strip('<>')
+
+        response = self.client.get(next_url)
+        self.assertEqual([r['name'] for r in response.data], ['Restaurant 2'])
+        self.assertNotIn('Link', response)
+
+    @patch('core.views.BitsetPagination.page_size', 1)
+    def test_filter_restaurants_unpaginated_by_default(self):
+        url = reverse('filter-restaurants-by-tags')
+        response = self.client.get(url, {'tags': ['Tag2']})
+        self.assertEqual(len(response.data), 2)
+        self.assertNotIn('Link', response)
+
+    def test_filter_restaurants_sparse_fields(self):
+        url = reverse('filter-restaurants-by-tags')
+        response = self.client.get(url, {'tags': ['Tag1'], 'fields': 'id,name'})
+        self.assertEqual(response.data, [{'id': self.restaurant1.id, 'name': 'Restaurant 1'}])
+
+    def test_filter_restaurants_invalid_match(self):
+        url = reverse('filter-restaurants-by-tags')
+        response = self.client.get(url, {'tags': ['Tag1'], 'match': 'some'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_tag_changes_applied_after_commit(self):
+        url = reverse('filter-restaurants-by-tags')
+        self.client.get(url, {'tags': ['Tag1']})
+        with self.captureOnCommitCallbacks(execute=True):
+            self.restaurant2.tags.add(self.tag1)
+            self.restaurant1.tags.remove(self.tag1)
+        response = self.client.get(url, {'tags': ['Tag1']})
+        self.assertEqual([r['name'] for r in response.data], ['Restaurant 2'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.tag1.restaurants.clear()
+        response = self.client.get(url, {'tags': ['Tag1']})
+        self.assertEqual(response.data, [])
         
+class RestaurantBrowseViewTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.tag_pizza = Tag.objects.create(name='Pizza')
+        self.tag_vegan = Tag.objects.create(name='Vegan')
+        self.restaurants = []
+        for i, (city, tags, allows_delivery) in enumerate([
+            ('Kraków', [self.tag_pizza, self.tag_vegan], True),
+            ('Kraków', [self.tag_pizza], False),
+            ('Warszawa', [self.tag_vegan], True),
+        ]):
+            owner = AppUser.objects.create_user(email=f'owner{i}@example.com', password='testpass', role='restaurateur')
+            restaurant = Restaurant.objects.create(owner=owner, name=f'Restaurant {i}', phone_number='123456789', allows_delivery=allows_delivery)
+            restaurant.tags.add(*tags)
+            Address.objects.create(
+                user=owner, restaurant=restaurant, street='Main St', building_number=1, city=city,
+                postal_code='12345', phone_number='123456789', owner_role='restaurateur'
+            )
+            self.restaurants.append(restaurant)
+        self.url = reverse('restaurant-browse')
+
+    def test_browse_city_with_facets(self):
+        response = self.client.get(self.url, {'city': 'Kraków'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['count'], 2)
+        self.assertEqual([r['name'] for r in response.data['restaurants']], ['Restaurant 0', 'Restaurant 1'])
+        self.assertEqual(response.data['facets']['tags'], [
+            {'id': self.tag_pizza.id, 'name': 'Pizza', 'count': 2},
+            {'id': self.tag_vegan.id, 'name': 'Vegan', 'count': 1},
+        ])
+        self.assertEqual(response.data['facets']['options'], {
+            'allows_delivery': 1, 'allows_pickup': 2, 'allows_online_payment': 2, 'allows_cash_payment': 2,
+        })
+
+    def test_browse_tags_with_facets(self):
+        response = self.client.get(self.url, {'tags': ['Vegan']})
+        self.assertEqual([r['name'] for r in response.data['restaurants']], ['Restaurant 0', 'Restaurant 2'])
+        self.assertEqual({t['name']: t['count'] for t in response.data['facets']['tags']}, {'Pizza': 1, 'Vegan': 2})
+        self.assertEqual(response.data['facets']['options']['allows_delivery'], 2)
+
+    @override_settings(SHARED_CACHE=True)
+    def test_browse_single_aggregate_query(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        self.client.get(self.url, {'tags': ['Pizza'], 'city': 'Kraków'})
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(self.url, {'tags': ['Pizza'], 'city': 'Kraków'})
+        # miasto, agregat opcji, strona restauracji i jej prefetch (tagi, miasta dostawy)
+        self.assertEqual(len(queries), 5)
+
+class AutocompleteViewTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = AppUser.objects.create_user(email='owner@example.com', password='testpass', role='restaurateur')
+        self.restaurant = Restaurant.objects.create(owner=self.user, name='Bar Mleczny Żak', phone_number='123456789')
+        City.objects.create(name='Łódź')
+        City.objects.create(name='Lublin')
+        City.objects.create(name='Kraków')
+        self.tag = Tag.objects.create(name='Pierogi')
+        self.url = reverse('autocomplete')
+
+    def test_autocomplete_folds_accents(self):
+        response = self.client.get(self.url, {'q': 'lo'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['cities'], ['Łódź'])
+
+        response = self.client.get(self.url, {'q': 'KRAKO', 'types': 'cities'})
+        self.assertEqual(response.data, {'cities': ['Kraków']})
+
+    def test_autocomplete_matches_word_starts(self):
+        response = self.client.get(self.url, {'q': 'zak', 'types': 'restaurants,tags'})
+        self.assertEqual(response.data['restaurants'], [{'id': self.restaurant.id, 'name': 'Bar Mleczny Żak'}])
+        self.assertEqual(response.data['tags'], [])
+
+    def test_autocomplete_limit(self):
+        response = self.client.get(self.url, {'q': 'l', 'types': 'cities', 'limit': 1})
+        self.assertEqual(response.data['cities'], ['Łódź'])
+        response = self.client.get(self.url, {'q': 'l', 'types': 'cities', 'limit': 5})
+        self.assertEqual(response.data['cities'], ['Łódź', 'Lublin'])
+
+    def test_autocomplete_reads_database_without_shared_cache(self):
+        self.assertEqual(self.client.get(self.url, {'q': 'pie'}).data['tags'], [{'id': self.tag.id, 'name': 'Pierogi'}])
+        # Zmiana z innego procesu: bez sygnałów w tym procesie
+        Tag.objects.filter(pk=self.tag.pk).update(name='Pizza')
+        self.assertEqual(self.client.get(self.url, {'q': 'pi'}).data['tags'], [{'id': self.tag.id, 'name': 'Pizza'}])
+
+    @override_settings(SHARED_CACHE=True)
+    def test_autocomplete_refreshed_on_change(self):
+        self.assertEqual(self.client.get(self.url, {'q': 'pie'}).data['tags'], [{'id': self.tag.id, 'name': 'Pierogi'}])
+        self.tag.name = 'Pizza'
+        self.tag.save()
+        response = self.client.get(self.url, {'q': 'pi'})
+        self.assertEqual(response.data['tags'], [{'id': self.tag.id, 'name': 'Pizza'}])
+
+    def test_autocomplete_invalid_types(self):
+        response = self.client.get(self.url, {'q': 'pi', 'types': 'products'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
 class RestaurantTagUpdateTest(TestCase):
     def setUp(self):
         self.client = APIClient()
@@ -1115,6 +1548,53 @@ class RestaurantTagUpdateTest(TestCase):
         self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
         self.assertEqual(response.data['error'], 'Restaurant not found')
 
+class SearchViewTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user1 = AppUser.objects.create_user(email='owner1@example.com', password='testpass', role='restaurateur')
+        self.user2 = AppUser.objects.create_user(email='owner2@example.com', password='testpass', role='restaurateur')
+        self.restaurant1 = Restaurant.objects.create(owner=self.user1, name='Pizzeria Roma', phone_number='123456789', description='Pizza z pieca opalanego drewnem')
+        self.restaurant2 = Restaurant.objects.create(owner=self.user2, name='Bar Mleczny', phone_number='987654321', description='Domowe obiady')
+        self.tag = Tag.objects.create(name='Pierogi')
+        self.restaurant2.tags.add(self.tag)
+        self.product1 = Product.objects.create(restaurant=self.restaurant1, name='Margherita', description='Pizza z mozzarellą', price=25.00)
+        self.product2 = Product.objects.create(restaurant=self.restaurant2, name='Pierogi ruskie', description='Z ziemniakami i serem', price=18.00)
+        self.product3 = Product.objects.create(restaurant=self.restaurant2, name='Pierogi z mięsem', price=20.00, archived=True, is_available=False)
+        self.url = reverse('search')
+
+    def test_search_restaurants_and_products(self):
+        response = self.client.get(self.url, {'q': 'pizza'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([r['name'] for r in response.data['restaurants']], ['Pizzeria Roma'])
+        self.assertEqual([p['name'] for p in response.data['products']], ['Margherita'])
+        self.assertEqual(response.data['products'][0]['restaurant_name'], 'Pizzeria Roma')
+        self.assertIsNone(response.data['next'])
+
+    def test_search_matches_tags_and_skips_archived_products(self):
+        response = self.client.get(self.url, {'q': 'pierogi'})
+        self.assertEqual([r['name'] for r in response.data['restaurants']], ['Bar Mleczny'])
+        self.assertEqual([p['name'] for p in response.data['products']], ['Pierogi ruskie'])
+
+    def test_search_requires_all_terms(self):
+        response = self.client.get(self.url, {'q': 'pierogi serem'})
+        self.assertEqual(response.data['restaurants'], [])
+        self.assertEqual([p['name'] for p in response.data['products']], ['Pierogi ruskie'])
+
+    def test_search_pagination(self):
+        for i in range(3):
+            Product.objects.create(restaurant=self.restaurant1, name=f'Pizza {i}', price=20.00)
+        response = self.client.get(self.url, {'q': 'pizza', 'page_size': 2})
+        self.assertEqual(len(response.data['products']), 2)
+        self.assertIn('page=2', response.data['next'])
+
+        response = self.client.get(self.url, {'q': 'pizza', 'page_size': 2, 'page': 2})
+        self.assertEqual(len(response.data['products']), 2)
+        self.assertIsNone(response.data['next'])
+
+    def test_search_query_too_short(self):
+        response = self.client.get(self.url, {'q': 'p'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
 #Product
 class ProductCreateTest(TestCase):
     def setUp(self):
@@ -1173,6 +1653,7 @@ class ProductCreateTest(TestCase):
 class ProductListTest(TestCase):
     def setUp(self):
         self.client = APIClient()
+        cache.clear()
         self.user = AppUser.objects.create_user(
             email='owner@example.com',
             password='testpass',
@@ -1222,10 +1703,45 @@ class ProductListTest(TestCase):
         response = self.client.get(url)
         self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
         self.assertEqual(response.data['detail'], 'Restauracja nie została znaleziona.')
+
+    @override_settings(MENU_CACHE_TIMEOUT=24 * 60 * 60, MENU_VERSION_CACHE_TIMEOUT=60)
+    def test_get_products_served_from_snapshot(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        url = reverse('product-list', args=[self.restaurant.id])
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(len(response.data), 2)
+        self.assertEqual(len(queries), 0)
+
+    def test_get_products_not_modified(self):
+        url = reverse('product-list', args=[self.restaurant.id])
+        etag = self.client.get(url)['ETag']
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_product_change_bumps_menu_version(self):
+        url = reverse('product-list', args=[self.restaurant.id])
+        etag = self.client.get(url)['ETag']
+        version = Restaurant.objects.get(pk=self.restaurant.pk).menu_version
+
+        self.product1.name = 'Renamed'
+        self.product1.save()
+        self.assertEqual(Restaurant.objects.get(pk=self.restaurant.pk).menu_version, version + 1)
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data[0]['name'], 'Renamed')
+
+        self.product2.archive()
+        response = self.client.get(url)
+        self.assertEqual(len(response.data), 1)
         
 class AllProductListTest(TestCase):
     def setUp(self):
         self.client = APIClient()
+        cache.clear()
         self.user = AppUser.objects.create_user(
             email='owner@example.com',
             password='testpass',
@@ -1477,15 +1993,75 @@ class CartListCreateTest(TestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(len(response.data[0]['items']), 0)  
 
-def test_remove_stale_carts(self):
+    def test_get_cart_query_count_does_not_grow_with_items(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        url = reverse('cart-detail', args=[self.session_id])
+        with CaptureQueriesContext(connection) as one_item:
+            self.client.get(url)
+        for i in range(5):
+            product = Product.objects.create(name=f'Extra {i}', price=Decimal('1.00'), restaurant=self.restaurant)
+            CartItem.objects.create(cart=self.cart, product=product, quantity=1)
+        with CaptureQueriesContext(connection) as many_items:
+            response = self.client.get(url)
+        self.assertEqual(len(response.data[0]['items']), 6)
+        self.assertEqual(len(one_item), len(many_items))
+
+class StaleCartReaperTest(TestCase):
+    def setUp(self):
+        self.user = AppUser.objects.create_user(
+            email='user@example.com',
+            password='testpass',
+            first_name='User',
+            last_name='Test',
+            role='client'
+        )
+        self.restaurant = Restaurant.objects.create(
+            owner=self.user,
+            name='Test Restaurant',
+            phone_number='123456789'
+        )
+        self.product = Product.objects.create(
+            name='Product 1',
+            price=Decimal('10.99'),
+            restaurant=self.restaurant
+        )
         stale_date = timezone.now() - timedelta(days=2)
-        stale_cart = Cart.objects.create(session_id='stalesession123', created_at=stale_date)
-        url = reverse('cart-detail', args=['stalesession123'])
-        response = self.client.get(url)
-        print(response.data)   
+        self.fresh_cart = Cart.objects.create(session_id='freshsession')
+        self.stale_carts = [Cart.objects.create(session_id=f'stalesession{i}') for i in range(3)]
+        for cart in self.stale_carts:
+            CartItem.objects.create(cart=cart, product=self.product, quantity=1)
+        self.ordered_cart = Cart.objects.create(session_id=None, order_id=1)
+        Cart.objects.filter(id__in=[c.id for c in self.stale_carts] + [self.ordered_cart.id]).update(created_at=stale_date)
+
+    def test_reap_stale_carts(self):
+        from .jobs import reap_stale_carts
+        deleted = reap_stale_carts(batch_size=2)
+        self.assertEqual(deleted, 3)
+        self.assertFalse(Cart.objects.filter(session_id__startswith='stalesession').exists())
+        self.assertFalse(CartItem.objects.filter(cart_id__in=[c.id for c in self.stale_carts]).exists())
+        self.assertTrue(Cart.objects.filter(id=self.fresh_cart.id).exists())
+        self.assertTrue(Cart.objects.filter(id=self.ordered_cart.id).exists())
+
+    def test_reap_stale_carts_command(self):
+        from django.core.management import call_command
+        call_command('reap_stale_carts', stdout=StringIO())
+        self.assertEqual(Cart.objects.count(), 2)
+
+    def test_scheduler_runs_due_jobs_once_per_interval(self):
+        from .scheduler import run_pending
+        next_run = {}
+        run_pending({'core.jobs.reap_stale_carts': 60}, next_run)
+        self.assertEqual(Cart.objects.count(), 2)
+        Cart.objects.filter(id=self.fresh_cart.id).update(created_at=timezone.now() - timedelta(days=2))
+        run_pending({'core.jobs.reap_stale_carts': 60}, next_run)
+        self.assertTrue(Cart.objects.filter(id=self.fresh_cart.id).exists())
+
+    def test_get_cart_does_not_reap_other_carts(self):
+        url = reverse('cart-detail', args=['freshsession'])
+        response = APIClient().get(url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data), 0)
-        self.assertFalse(Cart.objects.filter(session_id='stalesession123').exists())
+        self.assertEqual(Cart.objects.filter(session_id__startswith='stalesession').count(), 3)
 
 class CartItemListCreateViewTest(TestCase):
     def setUp(self):
@@ -1539,6 +2115,154 @@ class CartItemListCreateViewTest(TestCase):
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
         self.assertIn('Product not found', str(response.data))
         
+class CartTotalPriceTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = AppUser.objects.create_user(
+            email='user@example.com',
+            password='testpass',
+            first_name='User',
+            last_name='Test',
+            role='client'
+        )
+        self.restaurant = Restaurant.objects.create(
+            owner=self.user,
+            name='Test Restaurant',
+            phone_number='123456789'
+        )
+        self.products = [
+            Product.objects.create(name=f'Product {i}', price=Decimal('9.99'), restaurant=self.restaurant)
+            for i in range(12)
+        ]
+        self.session_id = 'testsession123'
+        self.cart = Cart.objects.create(session_id=self.session_id)
+
+    def add_item(self, product, quantity=1):
+        url = reverse('cartitem-list-create', args=[self.session_id])
+        return self.client.post(url, {'product': product.id, 'quantity': quantity}, format='json')
+
+    def test_total_follows_item_changes(self):
+        self.add_item(self.products[0], 2)
+        self.add_item(self.products[1], 1)
+        self.cart.refresh_from_db()
+        self.assertEqual(self.cart.total_price, Decimal('29.97'))
+
+        item = CartItem.objects.get(cart=self.cart, product=self.products[0])
+        url = reverse('cartitem-detail', args=[self.session_id, item.id])
+        self.client.patch(url, {'quantity': 1}, format='json')
+        self.cart.refresh_from_db()
+        self.assertEqual(self.cart.total_price, Decimal('19.98'))
+
+        self.client.delete(url)
+        self.cart.refresh_from_db()
+        self.assertEqual(self.cart.total_price, Decimal('9.99'))
+
+    def test_price_change_reaches_open_carts_like_redis_carts(self):
+        from .carts import InMemoryRedis, RedisCartBackend
+        redis_backend = RedisCartBackend(client=InMemoryRedis())
+        self.add_item(self.products[0], 1)
+        redis_backend.add_items('redis-session', {self.products[0].id: self.products[0]}, {self.products[0].id: 1})
+
+        product = Product.objects.get(pk=self.products[0].pk)
+        product.price = Decimal('12.50')
+        product.save()
+        item = CartItem.objects.get(cart=self.cart, product=product)
+        self.client.patch(reverse('cartitem-detail', args=[self.session_id, item.id]), {'quantity': 2}, format='json')
+        redis_backend.update_item('redis-session', product.id, 2)
+
+        self.cart.refresh_from_db()
+        self.assertEqual(self.cart.total_price, Decimal('25.00'))
+        self.assertEqual(redis_backend.get_cart('redis-session').total_price, self.cart.total_price)
+
+    def test_add_item_query_count_does_not_grow_with_cart_size(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        self.add_item(self.products[0])
+        with CaptureQueriesContext(connection) as small_cart:
+            self.add_item(self.products[1])
+        for product in self.products[2:11]:
+            self.add_item(product)
+        with CaptureQueriesContext(connection) as large_cart:
+            self.add_item(self.products[11])
+        self.assertEqual(len(small_cart), len(large_cart))
+
+    def test_check_cart_totals_command_repairs_drift(self):
+        from django.core.management import call_command
+        self.add_item(self.products[0], 3)
+        Cart.objects.filter(id=self.cart.id).update(total_price=Decimal('1.00'))
+
+        out = StringIO()
+        call_command('check_cart_totals', stdout=out)
+        self.assertIn(f'Cart {self.cart.id}', out.getvalue())
+        self.cart.refresh_from_db()
+        self.assertEqual(self.cart.total_price, Decimal('1.00'))
+
+        call_command('check_cart_totals', '--fix', stdout=StringIO())
+        self.cart.refresh_from_db()
+        self.assertEqual(self.cart.total_price, Decimal('29.97'))
+
+class CartItemBulkCreateViewTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = AppUser.objects.create_user(
+            email='user@example.com',
+            password='testpass',
+            first_name='User',
+            last_name='Test',
+            role='client'
+        )
+        self.restaurant = Restaurant.objects.create(
+            owner=self.user,
+            name='Test Restaurant',
+            phone_number='123456789'
+        )
+        self.products = [
+            Product.objects.create(name=f'Product {i}', price=Decimal('5.00'), restaurant=self.restaurant)
+            for i in range(15)
+        ]
+        self.session_id = 'testsession123'
+        self.url = reverse('cartitem-bulk-create', args=[self.session_id])
+
+    def test_bulk_add_items(self):
+        cart = Cart.objects.create(session_id=self.session_id)
+        CartItem.objects.create(cart=cart, product=self.products[0], quantity=1)
+        data = {'items': [{'product': product.id, 'quantity': 2} for product in self.products]}
+        response = self.client.post(self.url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(response.data['items']), 15)
+        self.assertEqual(response.data['total_price'], '155.00')
+        self.assertEqual(CartItem.objects.get(cart=cart, product=self.products[0]).quantity, 3)
+
+    def test_bulk_add_items_as_list_creates_cart(self):
+        data = [{'product': self.products[0].id}, {'product': self.products[0].id, 'quantity': 2}]
+        response = self.client.post(self.url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['session_id'], self.session_id)
+        self.assertEqual(response.data['items'][0]['quantity'], 3)
+
+    def test_bulk_add_items_with_invalid_product(self):
+        data = {'items': [{'product': self.products[0].id, 'quantity': 1}, {'product': 9999, 'quantity': 1}]}
+        response = self.client.post(self.url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['products'], [9999])
+        self.assertFalse(CartItem.objects.exists())
+
+    def test_bulk_add_items_with_invalid_quantity(self):
+        data = {'items': [{'product': self.products[0].id, 'quantity': 0}]}
+        response = self.client.post(self.url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_bulk_add_query_count_does_not_grow_with_items(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        Cart.objects.create(session_id=self.session_id)
+        with CaptureQueriesContext(connection) as few_items:
+            self.client.post(self.url, {'items': [{'product': p.id} for p in self.products[:2]]}, format='json')
+        CartItem.objects.all().delete()
+        with CaptureQueriesContext(connection) as many_items:
+            self.client.post(self.url, {'items': [{'product': p.id} for p in self.products]}, format='json')
+        self.assertEqual(len(few_items), len(many_items))
+
 class CartItemRetrieveUpdateDestroyViewTest(TestCase):
     def setUp(self):
         self.client = APIClient()
@@ -1701,10 +2425,145 @@ class CartRestaurantInfoViewTest(TestCase):
         self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
         self.assertIn('Koszyk nie istnieje.', str(response.data))
         
+@override_settings(CART_BACKEND='core.carts.RedisCartBackend', CART_REDIS_URL='memory://')
+class RedisCartBackendTest(TestCase):
+    def setUp(self):
+        get_cart_backend.cache_clear()
+        self.client = APIClient()
+        self.user = AppUser.objects.create_user(
+            email='user@example.com',
+            password='testpass',
+            first_name='User',
+            last_name='Test',
+            role='client'
+        )
+        self.city = City.objects.create(name='Test City')
+        self.address = Address.objects.create(
+            user=self.user,
+            street='Test Street',
+            building_number=1,
+            apartment_number=1,
+            postal_code='00-000',
+            city=self.city.name,
+            phone_number='123456789'
+        )
+        self.restaurant = Restaurant.objects.create(
+            owner=self.user,
+            name='Test Restaurant',
+            phone_number='123456789'
+        )
+        self.restaurant.delivery_cities.add(self.city)
+        self.other_owner = AppUser.objects.create_user(
+            email='owner@example.com',
+            password='testpass',
+            first_name='Owner',
+            last_name='Test',
+            role='restaurateur'
+        )
+        self.other_restaurant = Restaurant.objects.create(
+            owner=self.other_owner,
+            name='Other Restaurant',
+            phone_number='987654321'
+        )
+        self.product = Product.objects.create(name='Product 1', price=Decimal('9.99'), restaurant=self.restaurant)
+        self.other_product = Product.objects.create(name='Product 2', price=Decimal('5.00'), restaurant=self.other_restaurant)
+        self.session_id = 'testsession123'
+
+    def add_item(self, product, quantity=1):
+        url = reverse('cartitem-list-create', args=[self.session_id])
+        return self.client.post(url, {'product': product.id, 'quantity': quantity}, format='json')
+
+    def test_add_items_does_not_write_to_database(self):
+        self.assertEqual(self.add_item(self.product, 2).status_code, status.HTTP_201_CREATED)
+        response = self.add_item(self.product)
+        self.assertEqual(response.data['quantity'], 3)
+        self.assertFalse(Cart.objects.exists())
+        self.assertFalse(CartItem.objects.exists())
+
+        response = self.client.get(reverse('cart-detail', args=[self.session_id]))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data[0]['total_price'], '29.97')
+        self.assertEqual(response.data[0]['restaurant']['name'], 'Test Restaurant')
+
+    def test_update_and_delete_item(self):
+        item_id = self.add_item(self.product).data['id']
+        url = reverse('cartitem-detail', args=[self.session_id, item_id])
+        response = self.client.put(url, {'quantity': 4}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['quantity'], 4)
+
+        self.assertEqual(self.client.delete(url).status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_unavailable_and_other_restaurant_items_are_removed(self):
+        self.add_item(self.product)
+        self.add_item(self.other_product)
+        url = reverse('clear-cart-items', args=[self.session_id, self.restaurant.id])
+        self.assertEqual(self.client.delete(url).status_code, status.HTTP_200_OK)
+
+        self.product.is_available = False
+        self.product.save()
+        response = self.client.get(reverse('cartitem-list-create', args=[self.session_id]))
+        self.assertEqual(response.data, [])
+
+    def test_in_memory_client_expires_keys(self):
+        from .carts import InMemoryRedis
+        client = InMemoryRedis()
+        self.assertFalse(client.expire('cart:missing', 60))
+        client.hset('cart:session', 'item', 1)
+        self.assertTrue(client.expire('cart:session', 0))
+        self.assertEqual(client.hgetall('cart:session'), {})
+
+    def test_checkout_writes_cart_to_database(self):
+        self.add_item(self.product, 3)
+        self.client.force_authenticate(user=self.user)
+        data = {
+            'session_id': self.session_id,
+            'address': self.address.id,
+            'delivery_type': 'delivery',
+            'restaurant': self.restaurant.id,
+            'user': self.user.id,
+            'payment_type': 'card'
+        }
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('order-list-create'), data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+        order = Order.objects.get(order_id=response.data['order_id'])
+        self.assertEqual(order.cart.total_price, Decimal('29.97'))
+        self.assertEqual(order.cart.items.get().quantity, 3)
+        self.assertEqual(self.client.get(reverse('cart-detail', args=[self.session_id])).data, [])
+
+    def test_checkout_with_frontend_payload(self):
+        # Order.jsx wysyła cart: null (koszyk w Redis nie ma id) razem z session_id
+        self.add_item(self.product, 1)
+        self.client.force_authenticate(user=self.user)
+        Restaurant.objects.filter(pk=self.restaurant.pk).update(minimum_order_amount=Decimal('20.00'))
+        data = {
+            'cart': None,
+            'session_id': self.session_id,
+            'address': self.address.id,
+            'delivery_type': 'delivery',
+            'restaurant': self.restaurant.id,
+            'user': self.user.id,
+            'payment_type': 'card'
+        }
+        response = self.client.post(reverse('order-list-create'), data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Cart.objects.exists())
+        self.assertEqual(self.client.get(reverse('cart-detail', args=[self.session_id])).data[0]['total_price'], '9.99')
+
+        self.add_item(self.product, 2)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('order-list-create'), data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Cart.objects.get().order_id, response.data['order_id'])
+
 #Order
 class OrderListCreateViewTest(TestCase):
     def setUp(self):
         self.client = APIClient()
+        cache.clear()
         self.user = AppUser.objects.create_user(
             email='user@example.com',
             password='testpass',
@@ -1816,6 +2675,26 @@ class OrderListCreateViewTest(TestCase):
         response = self.client.post(url, data, format='json')
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
         self.assertIn('nie dostarcza do miasta', str(response.data))
+
+    def test_create_order_delivery_checked_against_postal_code_zones(self):
+        zone = DeliveryZone.objects.create(restaurant=self.restaurant, start=31000, end=31999)
+        url = reverse('order-list-create')
+        data = {
+            'cart': self.cart.id,
+            'address': self.address.id,
+            'delivery_type': 'delivery',
+            'restaurant': self.restaurant.id,
+            'user': self.user.id,
+            'payment_type': 'card'
+        }
+        response = self.client.post(url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('nie dostarcza pod kod pocztowy 00-000', str(response.data))
+
+        zone.start = 0
+        zone.save()
+        response = self.client.post(url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
         
 class OrderDetailViewTest(TestCase):
     def setUp(self):
@@ -1918,6 +2797,87 @@ class OrderDetailViewTest(TestCase):
         response = self.client.patch(url, data, format='json')
         self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
         self.assertIn('Nie można modyfikować zarchiwizowanego zamówienia.', str(response.data))
+
+    def test_update_order_with_invalid_transition(self):
+        url = reverse('order-detail', args=[self.order.order_id])
+        for new_status in ['delivered', 'ready_for_pickup', 'suspended', 'unknown']:
+            response = self.client.patch(url, {'status': new_status}, format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, 'pending')
+        self.assertEqual(self.order.history.count(), 1)
+
+    def test_update_order_with_stale_status(self):
+        url = reverse('order-detail', args=[self.order.order_id])
+        response = self.client.patch(url, {'status': 'shipped', 'expected_status': 'confirmed'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, 'pending')
+
+    def test_status_transitions(self):
+        self.order.update_status('confirmed')
+        self.order.update_status('suspended', is_admin=True)
+        self.assertFalse(self.order.can_transition('resumed'))
+        self.order.update_status('resumed', is_admin=True)
+        self.order.update_status('shipped')
+        self.order.update_status('delivered')
+        self.assertEqual(
+            list(self.order.history.order_by('id').values_list('status', flat=True)),
+            ['pending', 'confirmed', 'suspended', 'resumed', 'shipped', 'delivered']
+        )
+        with self.assertRaises(InvalidStatusTransition):
+            self.order.update_status('cancelled')
+
+    def test_transition_statements(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        order = Order.objects.get(order_id=self.order.order_id)
+        with CaptureQueriesContext(connection) as queries:
+            order.update_status('confirmed')
+        statements = [query['sql'].split()[0] for query in queries.captured_queries if not query['sql'].startswith(('SAVEPOINT', 'RELEASE'))]
+        # Warunkowy UPDATE, historia, powiadomienie i zdarzenia outboxu (powiadomienie + czat)
+        self.assertEqual(statements, ['UPDATE', 'INSERT', 'INSERT', 'INSERT'])
+
+    def test_concurrent_transition_fails(self):
+        stale_order = Order.objects.get(order_id=self.order.order_id)
+        self.order.update_status('cancelled')
+        with self.assertRaises(StatusConflict):
+            stale_order.update_status('confirmed')
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, 'cancelled')
+
+    def test_admin_status_change_goes_through_transitions(self):
+        from django.contrib import admin
+        from django.forms.models import model_to_dict
+        from django.test import RequestFactory
+        from core.admin import OrderAdmin
+        order_admin = OrderAdmin(Order, admin.site)
+        request = RequestFactory().post('/')
+        request.user = self.user
+
+        def admin_form(order, new_status):
+            form_class = order_admin.get_form(request, order)
+            return form_class(data=dict(model_to_dict(order), status=new_status), instance=order)
+
+        order = Order.objects.get(order_id=self.order.order_id)
+        form = admin_form(order, 'delivered')
+        self.assertFalse(form.is_valid())
+        self.assertIn('Niedozwolona zmiana statusu z pending na delivered.', form.errors['status'])
+
+        order = Order.objects.get(order_id=self.order.order_id)
+        form = admin_form(order, 'confirmed')
+        self.assertTrue(form.is_valid())
+        order_admin.save_model(request, form.save(commit=False), form, True)
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, 'confirmed')
+        self.assertEqual(self.order.history.latest('id').description, 'Status zamówienia został zmieniony przez administratora')
+        self.assertTrue(Notification.objects.filter(order=self.order, message__startswith='Administrator zmienił').exists())
+
+        stale_order = Order.objects.get(order_id=self.order.order_id)
+        self.order.update_status('shipped')
+        form = admin_form(stale_order, 'suspended')
+        self.assertFalse(form.is_valid())
+        self.assertIn(f'Status zamówienia nr.{self.order.order_id} został w międzyczasie zmieniony.', form.errors['status'])
         
 class UserOrderListViewTest(TestCase):
     def setUp(self):
@@ -1976,6 +2936,21 @@ class UserOrderListViewTest(TestCase):
         response = self.client.get(url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(len(response.data), 0)
+
+    def test_query_count_does_not_grow_with_orders(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        url = reverse('user-order-list')
+        with CaptureQueriesContext(connection) as one_order:
+            self.client.get(url)
+        for i in range(5):
+            cart = Cart.objects.create(session_id=f'session{i}')
+            CartItem.objects.create(cart=cart, product=self.product, quantity=1)
+            Order.objects.create(user=self.user, restaurant=self.restaurant, address=self.address, cart=cart, payment_type='card', delivery_type='delivery')
+        with CaptureQueriesContext(connection) as many_orders:
+            response = self.client.get(url)
+        self.assertEqual(len(response.data), 6)
+        self.assertEqual(len(one_order), len(many_orders))
         
 class RestaurantOrdersViewTest(TestCase):
     def setUp(self):
@@ -2034,7 +3009,145 @@ class RestaurantOrdersViewTest(TestCase):
         response = self.client.get(url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(len(response.data), 0)
+
+    def test_query_count_does_not_grow_with_orders(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        url = reverse('restaurant-orders', args=[self.restaurant.id])
+        with CaptureQueriesContext(connection) as one_order:
+            self.client.get(url)
+        for i in range(5):
+            cart = Cart.objects.create(session_id=f'session{i}')
+            CartItem.objects.create(cart=cart, product=self.product, quantity=1)
+            Order.objects.create(user=self.user, restaurant=self.restaurant, address=self.address, cart=cart, payment_type='card', delivery_type='delivery')
+        with CaptureQueriesContext(connection) as many_orders:
+            response = self.client.get(url)
+        self.assertEqual(len(response.data), 6)
+        self.assertEqual(len(one_order), len(many_orders))
+
+    def test_keyset_pagination(self):
+        import re
+        created_at = timezone.now()
+        for i in range(4):
+            cart = Cart.objects.create(session_id=f'session{i}')
+            Order.objects.create(user=self.user, restaurant=self.restaurant, address=self.address, cart=cart, payment_type='card', delivery_type='delivery')
+        Order.objects.update(created_at=created_at)
+        expected = list(Order.objects.order_by('-created_at', '-order_id').values_list('order_id', flat=True))
+
+        url = reverse('restaurant-orders', args=[self.restaurant.id]) + '?page_size=2'
+        seen = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            seen.extend(order['order_id'] for order in response.data)
+            last_response = response
+            next_link = re.search(r'<([^>]+)>; rel="next"', response.get('Link', ''))
+            url = next_link.group(1) if next_link else None
+        self.assertEqual(seen, expected)
+
+        prev_url = re.search(r'<([^>]+)>; rel="prev"', last_response['Link']).group(1)
+        response = self.client.get(prev_url)
+        self.assertEqual([order['order_id'] for order in response.data], expected[2:4])
+
+    @patch('core.views.OrderCursorPagination.page_size', 2)
+    def test_full_list_without_pagination_params(self):
+        for i in range(3):
+            cart = Cart.objects.create(session_id=f'session{i}')
+            Order.objects.create(user=self.user, restaurant=self.restaurant, address=self.address, cart=cart, payment_type='card', delivery_type='delivery')
+        expected = list(Order.objects.order_by('-created_at', '-order_id').values_list('order_id', flat=True))
+        response = self.client.get(reverse('restaurant-orders', args=[self.restaurant.id]))
+        self.assertEqual([order['order_id'] for order in response.data], expected)
+        self.assertGreater(len(expected), 2)
+        self.assertNotIn('Link', response)
+
+    def test_invalid_cursor(self):
+        url = reverse('restaurant-orders', args=[self.restaurant.id])
+        response = self.client.get(url, {'cursor': 'invalid'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+        import base64
+        import json
+        for position in (['garbage', 1], [timezone.now().isoformat(), 'x'], [None, 1]):
+            cursor = base64.urlsafe_b64encode(json.dumps({'p': position}).encode()).decode()
+            response = self.client.get(url, {'cursor': cursor})
+            self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
         
+class RestaurantOrderChangesViewTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.owner = AppUser.objects.create_user(
+            email='owner@example.com',
+            password='testpass',
+            first_name='Owner',
+            last_name='Test',
+            role='restaurateur'
+        )
+        self.user = AppUser.objects.create_user(
+            email='user@example.com',
+            password='testpass',
+            first_name='User',
+            last_name='Test',
+            role='client'
+        )
+        self.client.force_authenticate(user=self.owner)
+        self.address = Address.objects.create(
+            user=self.user,
+            street='Test Street',
+            building_number=1,
+            postal_code='00-000',
+            city='Test City',
+            phone_number='123456789'
+        )
+        self.restaurant = Restaurant.objects.create(
+            owner=self.owner,
+            name='Test Restaurant',
+            phone_number='123456789'
+        )
+        self.orders = [
+            Order.objects.create(
+                user=self.user,
+                restaurant=self.restaurant,
+                address=self.address,
+                cart=Cart.objects.create(session_id=f'session{i}'),
+                payment_type='card',
+                delivery_type='delivery'
+            )
+            for i in range(3)
+        ]
+        Order.objects.update(updated_at=timezone.now() - timedelta(minutes=5))
+        self.url = reverse('restaurant-order-changes', args=[self.restaurant.id])
+
+    def test_changes_since_cursor(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['orders']), 3)
+        self.assertFalse(response.data['has_more'])
+        cursor = response.data['cursor']
+
+        response = self.client.get(self.url, {'cursor': cursor})
+        self.assertEqual(response.data['orders'], [])
+        self.assertEqual(response.data['cursor'], cursor)
+
+        self.orders[1].update_status('confirmed')
+        response = self.client.get(self.url, {'cursor': cursor})
+        self.assertEqual([order['order_id'] for order in response.data['orders']], [self.orders[1].order_id])
+        self.assertEqual(response.data['orders'][0]['status'], 'confirmed')
+
+        response = self.client.get(self.url, {'cursor': response.data['cursor']})
+        self.assertEqual([order['order_id'] for order in response.data['orders']], [self.orders[1].order_id])
+
+    def test_changes_are_paged(self):
+        response = self.client.get(self.url, {'page_size': 2})
+        self.assertTrue(response.data['has_more'])
+        response = self.client.get(self.url, {'page_size': 2, 'cursor': response.data['cursor']})
+        self.assertEqual([order['order_id'] for order in response.data['orders']], [self.orders[2].order_id])
+        self.assertFalse(response.data['has_more'])
+
+    def test_changes_for_other_restaurant(self):
+        self.client.force_authenticate(user=self.user)
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
 class UserOrderDetailViewTest(TestCase):
     def setUp(self):
         self.client = APIClient()
@@ -2100,6 +3213,78 @@ class UserOrderDetailViewTest(TestCase):
         self.assertIn('No Order matches the given query.', str(response.data))  
         
 #ArchivedOrder
+class OrderArchiverTest(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.user = AppUser.objects.create_user(
+            email='user@example.com',
+            password='testpass',
+            first_name='User',
+            last_name='Test',
+            role='client'
+        )
+        self.client.force_authenticate(user=self.user)
+        self.address = Address.objects.create(
+            user=self.user,
+            street='Test Street',
+            building_number=1,
+            postal_code='00-000',
+            city='Test City',
+            phone_number='123456789'
+        )
+        self.restaurant = Restaurant.objects.create(
+            owner=self.user,
+            name='Test Restaurant',
+            phone_number='123456789'
+        )
+        self.orders = {}
+        for i, order_status in enumerate(['delivered', 'picked_up', 'cancelled', 'pending']):
+            cart = Cart.objects.create(session_id=f'session{i}')
+            self.orders[order_status] = Order.objects.create(
+                user=self.user,
+                restaurant=self.restaurant,
+                address=self.address,
+                cart=cart,
+                payment_type='card',
+                delivery_type='delivery',
+                status=order_status
+            )
+        self.fresh_order = Order.objects.create(
+            user=self.user,
+            restaurant=self.restaurant,
+            address=self.address,
+            cart=Cart.objects.create(session_id='freshsession'),
+            payment_type='card',
+            delivery_type='delivery',
+            status='delivered'
+        )
+        Order.objects.exclude(order_id=self.fresh_order.order_id).update(updated_at=timezone.now() - timedelta(days=2))
+
+    def test_read_paths_hide_finished_orders_without_writing(self):
+        response = self.client.get(reverse('user-order-list'))
+        self.assertEqual(
+            sorted(order['order_id'] for order in response.data),
+            sorted([self.orders['pending'].order_id, self.fresh_order.order_id])
+        )
+        response = self.client.get(reverse('archived-restaurant-orders', args=[self.restaurant.id]))
+        self.assertEqual(len(response.data), 3)
+        self.assertFalse(Order.objects.filter(archived=True).exists())
+
+    def test_archive_orders(self):
+        from .jobs import archive_orders
+        self.assertEqual(archive_orders(), 3)
+        self.assertEqual(
+            set(Order.objects.filter(archived=True).values_list('status', flat=True)),
+            {'delivered', 'picked_up', 'cancelled'}
+        )
+        self.assertFalse(Order.objects.get(order_id=self.fresh_order.order_id).archived)
+        self.assertEqual(archive_orders(), 0)
+
+    def test_archive_orders_command(self):
+        from django.core.management import call_command
+        call_command('archive_orders', stdout=StringIO())
+        self.assertEqual(Order.objects.filter(archived=True).count(), 3)
+
 class ArchivedUserOrderListViewTest(TestCase):
     def setUp(self):
         self.client = APIClient()
@@ -2152,6 +3337,14 @@ class ArchivedUserOrderListViewTest(TestCase):
         self.assertEqual(len(response.data), 1)
         self.assertEqual(response.data[0]['order_id'], self.order.order_id)
 
+    def test_logically_archived_order_is_flagged_archived(self):
+        Order.objects.filter(pk=self.order.pk).update(
+            archived=False, status='delivered', updated_at=timezone.now() - settings.ORDER_ARCHIVE_AFTER - timedelta(minutes=1)
+        )
+        response = self.client.get(reverse('archived-user-orders'))
+        self.assertEqual(len(response.data), 1)
+        self.assertTrue(response.data[0]['archived'])
+
     def test_retrieve_archived_user_orders_with_no_orders(self):
         self.order.delete()
         url = reverse('archived-user-orders')
@@ -2382,13 +3575,400 @@ class ChatMessageListViewTest(TestCase):
         self.assertEqual(len(response.data), 1)
         self.assertEqual(response.data[0]['message'], self.message.message)
 
+    def test_message_ids_grow_with_time_and_are_sent_as_strings(self):
+        from django.core.exceptions import ImproperlyConfigured
+        from .models import MessageIdGenerator
+        later = ChatMessage.objects.create(room=self.room_name, user=self.user, message='Later')
+        self.assertGreater(self.message.id, 2 ** 53)
+        self.assertGreater(later.id, self.message.id)
+        response = self.client.get(reverse('chat-messages', args=[self.room_name]))
+        self.assertEqual([message['id'] for message in response.data], [str(self.message.id), str(later.id)])
+        with self.assertRaises(ImproperlyConfigured):
+            MessageIdGenerator(1024)
+
     def test_retrieve_chat_messages_with_no_messages(self):
         ChatMessage.objects.all().delete()
         url = reverse('chat-messages', args=[self.room_name])
         response = self.client.get(url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(len(response.data), 0)
+
+    def test_first_page_holds_newest_messages_in_order(self):
+        import re
+        for i in range(4):
+            ChatMessage.objects.create(room=self.room_name, user=self.user, message=f'Message {i}')
+        url = reverse('chat-messages', args=[self.room_name])
+        response = self.client.get(url, {'page_size': 2})
+        self.assertEqual([message['message'] for message in response.data], ['Message 2', 'Message 3'])
+
+        next_url = re.search(r'<([^>]+)>; rel="next"', response['Link']).group(1)
+        response = self.client.get(next_url)
+        self.assertEqual([message['message'] for message in response.data], ['Message 0', 'Message 1'])
+
+    def create_order(self):
+        owner = AppUser.objects.create_user(email='owner@example.com', password='testpass', first_name='Owner', last_name='Test', role='restaurateur')
+        address = Address.objects.create(user=self.user, street='Test Street', building_number=1, postal_code='00-000', city='Test City', phone_number='123456789')
+        return Order.objects.create(
+            user=self.user,
+            restaurant=Restaurant.objects.create(owner=owner, name='Test Restaurant', phone_number='123456789'),
+            address=address,
+            cart=Cart.objects.create(session_id='testsession123'),
+            payment_type='card',
+            delivery_type='delivery'
+        )
+
+    def test_order_room_is_looked_up_by_order(self):
+        order = self.create_order()
+        ChatMessage.objects.create(room='other', order=order, user=self.user, message='By order')
+        ChatMessage.objects.create(room=str(order.order_id), user=self.user, message='Room only')
+        response = self.client.get(reverse('chat-messages', args=[order.order_id]))
+        self.assertEqual([message['message'] for message in response.data], ['By order'])
+
+    def test_messages_before_and_after_id(self):
+        order = self.create_order()
+        messages = [ChatMessage.objects.create(room=str(order.order_id), order=order, user=self.user, message=f'Message {i}') for i in range(5)]
+        url = reverse('chat-messages', args=[order.order_id])
+
+        response = self.client.get(url, {'before': messages[3].id, 'page_size': 2})
+        self.assertEqual([message['message'] for message in response.data], ['Message 1', 'Message 2'])
+        response = self.client.get(url, {'after': messages[1].id, 'page_size': 2})
+        self.assertEqual([message['message'] for message in response.data], ['Message 2', 'Message 3'])
+        response = self.client.get(url, {'after': messages[4].id})
+        self.assertEqual(response.data, [])
+
+        response = self.client.get(url, {'before': self.message.id})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        response = self.client.get(url, {'before': 'abc'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
         
+class ChatConsumerTest(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = AppUser.objects.create_user(
+            email='user@example.com',
+            password='testpass',
+            first_name='User',
+            last_name='Test',
+            role='client'
+        )
+        self.owner = AppUser.objects.create_user(
+            email='owner@example.com',
+            password='testpass',
+            first_name='Owner',
+            last_name='Test',
+            role='restaurateur'
+        )
+        self.stranger = AppUser.objects.create_user(
+            email='stranger@example.com',
+            password='testpass',
+            first_name='Stranger',
+            last_name='Test',
+            role='client'
+        )
+        self.address = Address.objects.create(
+            user=self.user,
+            street='Test Street',
+            building_number=1,
+            postal_code='00-000',
+            city='Test City',
+            phone_number='123456789'
+        )
+        self.restaurant = Restaurant.objects.create(
+            owner=self.owner,
+            name='Test Restaurant',
+            phone_number='123456789'
+        )
+        self.order = Order.objects.create(
+            user=self.user,
+            restaurant=self.restaurant,
+            address=self.address,
+            cart=Cart.objects.create(session_id='testsession123'),
+            payment_type='card',
+            delivery_type='delivery'
+        )
+
+    def communicator(self, user, query='&events=1'):
+        from channels.testing import WebsocketCommunicator
+        from rest_framework_simplejwt.tokens import AccessToken
+        from .routing import websocket_urlpatterns
+        from channels.routing import URLRouter
+        token = AccessToken.for_user(user)
+        return WebsocketCommunicator(URLRouter(websocket_urlpatterns), f'/ws/chat/{self.order.order_id}/?token={token}{query}')
+
+    async def join(self, communicator):
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        presence = await communicator.receive_json_from()
+        self.assertEqual(presence['type'], 'presence')
+        return presence
+
+    def replay(self, last_id, count):
+        from asgiref.sync import async_to_sync
+
+        async def chat():
+            communicator = self.communicator(self.owner, f'&events=1&last_id={last_id}')
+            await self.join(communicator)
+            received = [await communicator.receive_json_from() for _ in range(count)]
+            nothing_more = await communicator.receive_nothing()
+            await communicator.disconnect()
+            return received, nothing_more
+
+        return async_to_sync(chat)()
+
+    def send_messages(self, messages):
+        from asgiref.sync import async_to_sync
+
+        async def chat():
+            communicator = self.communicator(self.user)
+            await self.join(communicator)
+            received = []
+            for message in messages:
+                await communicator.send_json_to({'message': message})
+                received.append(await communicator.receive_json_from())
+            await communicator.disconnect()
+            return received
+
+        return async_to_sync(chat)()
+
+    def test_reconnect_replays_messages_after_last_id(self):
+        sent = self.send_messages(['One', 'Two', 'Three'])
+        self.assertEqual(sorted(ChatMessage.objects.values_list('id', flat=True)), [int(message['id']) for message in sent])
+
+        received, nothing_more = self.replay(sent[0]['id'], 2)
+        self.assertEqual([message['message'] for message in received], ['Two', 'Three'])
+        self.assertTrue(nothing_more)
+
+        # Bez pierścienia w cache z bazy
+        cache.clear()
+        received, nothing_more = self.replay(sent[1]['id'], 1)
+        self.assertEqual([message['message'] for message in received], ['Three'])
+        self.assertTrue(nothing_more)
+
+    def test_replay_reads_database_without_shared_cache(self):
+        sent = self.send_messages(['One'])
+        # Wiadomość z innego procesu: jest w bazie, ale nie w lokalnym pierścieniu
+        ChatMessage.objects.create(room=str(self.order.order_id), order=self.order, user=self.owner, message='Other worker')
+        received, nothing_more = self.replay(sent[0]['id'], 1)
+        self.assertEqual([message['message'] for message in received], ['Other worker'])
+        self.assertTrue(nothing_more)
+
+    @override_settings(CHAT_REPLAY_SIZE=2, CHAT_REPLAY_LIMIT=2)
+    def test_replay_beyond_ring_and_limit_is_truncated(self):
+        sent = self.send_messages(['One', 'Two', 'Three', 'Four'])
+        received, _ = self.replay(sent[0]['id'], 3)
+        self.assertEqual(received[0], {'type': 'replay_truncated'})
+        self.assertEqual([message['message'] for message in received[1:]], ['Two', 'Three'])
+
+    def test_participant_message_is_saved_with_single_lookup_at_connect(self):
+        from asgiref.sync import async_to_sync
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        async def chat():
+            communicator = self.communicator(self.user)
+            await self.join(communicator)
+            for message in ('Hello', 'Again'):
+                await communicator.send_json_to({'message': message})
+                response = await communicator.receive_json_from()
+            await communicator.disconnect()
+            return response
+
+        with CaptureQueriesContext(connection) as queries:
+            response = async_to_sync(chat)()
+        self.assertEqual(response['message'], 'Again')
+        self.assertEqual(response['user'], self.user.id)
+        # Użytkownik i zamówienie z uczestnikami przy połączeniu; wiadomości zapisane jednym bulk_create
+        self.assertEqual(len([query for query in queries.captured_queries if query['sql'].startswith('SELECT')]), 2)
+        self.assertEqual(len([query for query in queries.captured_queries if query['sql'].startswith('INSERT INTO "core_chatmessage"')]), 1)
+        self.assertTrue(Notification.objects.filter(user=self.owner, order=self.order).exclude(message__startswith='Nowe zamówienie').exists())
+        self.assertEqual(ChatMessage.objects.filter(order=self.order).count(), 2)
+
+    @override_settings(CHAT_BUFFER_BATCH_SIZE=2)
+    def test_buffer_writes_messages_and_notifications_in_batches(self):
+        from asgiref.sync import async_to_sync
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from .chat import chat_buffer
+
+        async def write():
+            for i in range(3):
+                await chat_buffer.put(
+                    ChatMessage(room=str(self.order.order_id), user=self.user, message=f'Message {i}', order=self.order),
+                    Notification(user=self.owner, order=self.order, message=f'Message {i}'),
+                )
+            await chat_buffer.flush()
+
+        OutboxMessage.objects.all().delete()
+        with CaptureQueriesContext(connection) as queries:
+            async_to_sync(write)()
+        self.assertEqual(len([query for query in queries.captured_queries if query['sql'].startswith('INSERT INTO "core_chatmessage"')]), 2)
+        self.assertEqual(ChatMessage.objects.count(), 3)
+        self.assertEqual(Notification.objects.filter(user=self.owner, message__startswith='Message').count(), 3)
+        self.assertEqual(OutboxMessage.objects.filter(group=f'notifications_{self.owner.id}').count(), 3)
+
+    @override_settings(CHAT_BUFFER_MAX_ATTEMPTS=1)
+    def test_buffer_keeps_good_rows_when_one_row_fails(self):
+        from asgiref.sync import async_to_sync
+        from .chat import chat_buffer
+
+        async def write():
+            for i, order_id in enumerate([self.order.order_id, 999999, self.order.order_id]):
+                await chat_buffer.put(ChatMessage(room=str(order_id), user=self.user, message=f'Message {i}', order_id=order_id), None)
+            await chat_buffer.flush()
+
+        with self.assertLogs('core.chat', level='ERROR'):
+            async_to_sync(write)()
+        self.assertEqual(sorted(ChatMessage.objects.values_list('message', flat=True)), ['Message 0', 'Message 2'])
+
+    @override_settings(CHAT_BUFFER_BATCH_SIZE=2)
+    def test_buffer_writes_each_message_once_on_shutdown(self):
+        import asyncio
+        from asgiref.sync import async_to_sync
+        from .chat import chat_buffer
+
+        async def shutdown():
+            for i in range(3):
+                await chat_buffer.put(ChatMessage(room=str(self.order.order_id), user=self.user, message=f'Message {i}', order=self.order), None)
+            for _ in range(3):
+                await asyncio.sleep(0)
+            chat_buffer.worker.cancel()
+            try:
+                await chat_buffer.worker
+            except asyncio.CancelledError:
+                pass
+
+        async_to_sync(shutdown)()
+        self.assertEqual(sorted(ChatMessage.objects.values_list('message', flat=True)), ['Message 0', 'Message 1', 'Message 2'])
+
+    @override_settings(CHAT_BUFFER_FLUSH_INTERVAL=0.5)
+    def test_put_resolves_after_write_and_lifespan_drains_queue(self):
+        from asgiref.sync import async_to_sync
+        from channels.testing import ApplicationCommunicator
+        from .chat import chat_buffer, lifespan
+
+        async def shutdown():
+            written = await chat_buffer.put(ChatMessage(room=str(self.order.order_id), user=self.user, message='Mine', order=self.order), None)
+            await written
+            saved = await database_sync_to_async(ChatMessage.objects.filter(message='Mine').exists)()
+            await chat_buffer.put(ChatMessage(room=str(self.order.order_id), user=self.user, message='Pending', order=self.order), None)
+
+            server = ApplicationCommunicator(lifespan, {'type': 'lifespan'})
+            await server.send_input({'type': 'lifespan.startup'})
+            self.assertEqual(await server.receive_output(), {'type': 'lifespan.startup.complete'})
+            await server.send_input({'type': 'lifespan.shutdown'})
+            self.assertEqual(await server.receive_output(), {'type': 'lifespan.shutdown.complete'})
+            return saved
+
+        self.assertTrue(async_to_sync(shutdown)())
+        self.assertEqual(sorted(ChatMessage.objects.values_list('message', flat=True)), ['Mine', 'Pending'])
+
+    def test_expired_presence_is_not_broadcast_as_offline(self):
+        from asgiref.sync import async_to_sync
+        from .chat import presence_key
+
+        async def chat():
+            owner = self.communicator(self.owner)
+            await self.join(owner)
+            user = self.communicator(self.user)
+            await self.join(user)
+            self.assertEqual(await owner.receive_json_from(), {'type': 'presence', 'user': self.user.id, 'online': True})
+            # Klucz wygasł (brak pingów); użytkownik może mieć jeszcze inne połączenia
+            await database_sync_to_async(cache.delete)(presence_key(str(self.order.order_id), self.user.id))
+            await user.disconnect()
+            nothing_more = await owner.receive_nothing()
+            await owner.disconnect()
+            return nothing_more
+
+        self.assertTrue(async_to_sync(chat)())
+
+    def test_clients_without_events_get_only_messages(self):
+        from asgiref.sync import async_to_sync
+
+        async def chat():
+            owner = self.communicator(self.owner, '')
+            connected, _ = await owner.connect()
+            self.assertTrue(connected)
+            user = self.communicator(self.user)
+            await self.join(user)
+            await user.send_json_to({'type': 'typing'})
+            await user.send_json_to({'message': 'Hello'})
+            received = await owner.receive_json_from()
+            nothing_more = await owner.receive_nothing()
+            await user.disconnect()
+            await owner.disconnect()
+            return received, nothing_more
+
+        received, nothing_more = async_to_sync(chat)()
+        self.assertEqual(received['message'], 'Hello')
+        self.assertNotIn('type', received)
+        self.assertTrue(nothing_more)
+
+    def test_non_participant_is_rejected(self):
+        from asgiref.sync import async_to_sync
+
+        async def chat():
+            communicator = self.communicator(self.stranger)
+            connected, _ = await communicator.connect()
+            await communicator.disconnect()
+            return connected
+
+        self.assertFalse(async_to_sync(chat)())
+
+    def test_archived_order_change_is_pushed_to_connection(self):
+        from asgiref.sync import async_to_sync
+        from .jobs import dispatch_outbox
+
+        async def chat():
+            communicator = self.communicator(self.user)
+            await self.join(communicator)
+            await database_sync_to_async(Order.objects.filter(pk=self.order.pk).update)(archived=True)
+            await database_sync_to_async(self.order.notify_chat)()
+            await database_sync_to_async(dispatch_outbox)()
+            await communicator.send_json_to({'message': 'Hello'})
+            response = await communicator.receive_json_from()
+            await communicator.disconnect()
+            return response
+
+        self.assertIn('error', async_to_sync(chat)())
+        self.assertFalse(ChatMessage.objects.exists())
+
+    def test_presence_typing_and_read_receipts_skip_database(self):
+        from asgiref.sync import async_to_sync
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        async def chat():
+            owner = self.communicator(self.owner)
+            self.assertEqual(await self.join(owner), {'type': 'presence', 'user': self.user.id, 'online': False})
+            user = self.communicator(self.user)
+            self.assertEqual(await self.join(user), {'type': 'presence', 'user': self.owner.id, 'online': True})
+            events = [await owner.receive_json_from()]
+
+            await user.send_json_to({'type': 'typing'})
+            events.append(await owner.receive_json_from())
+            await owner.send_json_to({'type': 'read', 'last_id': 7})
+            events.append(await user.receive_json_from())
+            await user.send_json_to({'type': 'ping'})
+            self.assertTrue(await user.receive_nothing())
+            self.assertTrue(await owner.receive_nothing())
+
+            await user.disconnect()
+            events.append(await owner.receive_json_from())
+            await owner.disconnect()
+            return events
+
+        with CaptureQueriesContext(connection) as queries:
+            events = async_to_sync(chat)()
+        self.assertEqual(events, [
+            {'type': 'presence', 'user': self.user.id, 'online': True},
+            {'type': 'typing', 'user': self.user.id},
+            {'type': 'read', 'user': self.owner.id, 'last_id': '7'},
+            {'type': 'presence', 'user': self.user.id, 'online': False},
+        ])
+        # Tylko odczyty przy połączeniu (użytkownik i zamówienie) dla każdego z dwóch połączeń
+        self.assertEqual([query['sql'].split()[0] for query in queries.captured_queries], ['SELECT'] * 4)
+        self.assertFalse(Notification.objects.exclude(message__startswith='Nowe zamówienie').exists())
+
 #Notification
 class UnreadNotificationsListViewTest(TestCase):
     def setUp(self):
@@ -2580,4 +4160,93 @@ class MarkNotificationsAsReadByOrderViewTest(TestCase):
         self.client.force_authenticate(user=other_user)
         url = reverse('mark-notifications-as-read-by-order', args=[self.order.order_id])
         response = self.client.patch(url)
-        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
\ No newline at end of file
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+#Outbox
+class OutboxDispatchTest(TestCase):
+    def setUp(self):
+        self.user = AppUser.objects.create_user(
+            email='user@example.com',
+            password='testpass',
+            first_name='User',
+            last_name='Test',
+            role='client'
+        )
+        self.owner = AppUser.objects.create_user(
+            email='owner@example.com',
+            password='testpass',
+            first_name='Owner',
+            last_name='Test',
+            role='restaurateur'
+        )
+        self.address = Address.objects.create(
+            user=self.user,
+            street='Test Street',
+            building_number=1,
+            postal_code='00-000',
+            city='Test City',
+            phone_number='123456789'
+        )
+        self.restaurant = Restaurant.objects.create(
+            owner=self.owner,
+            name='Test Restaurant',
+            phone_number='123456789'
+        )
+        self.order = Order.objects.create(
+            user=self.user,
+            restaurant=self.restaurant,
+            address=self.address,
+            cart=Cart.objects.create(session_id='testsession123'),
+            payment_type='card',
+            delivery_type='delivery'
+        )
+
+    def test_order_changes_are_written_to_outbox(self):
+        self.order.update_status('confirmed', is_admin=True)
+        self.assertEqual(
+            list(OutboxMessage.objects.order_by('id').values_list('group', flat=True)),
+            [f'notifications_{self.owner.id}', f'notifications_{self.user.id}', f'notifications_{self.owner.id}', f'chat_{self.order.order_id}']
+        )
+        self.assertEqual(OutboxMessage.objects.order_by('id').last().payload, {'type': 'chat_order_changed'})
+        payload = OutboxMessage.objects.filter(group__startswith='notifications_').order_by('id').last().payload
+        self.assertEqual(payload['type'], 'send_notification')
+        self.assertEqual(payload['order'], self.order.order_id)
+
+    def test_only_participant_and_archive_changes_reach_chat(self):
+        chat_events = OutboxMessage.objects.filter(group=f'chat_{self.order.order_id}')
+        order = Order.objects.get(pk=self.order.pk)
+        order.order_notes = 'Bez cebuli'
+        order.save()
+        order.is_paid = True
+        order.save(update_fields=['is_paid'])
+        self.assertFalse(chat_events.exists())
+
+        order.archived = True
+        order.save()
+        self.assertEqual(chat_events.count(), 1)
+
+    def test_dispatch_sends_and_removes_messages(self):
+        from asgiref.sync import async_to_sync
+        from channels.layers import get_channel_layer
+        from .jobs import dispatch_outbox
+        channel_layer = get_channel_layer()
+        channel_name = async_to_sync(channel_layer.new_channel)()
+        async_to_sync(channel_layer.group_add)(f'notifications_{self.owner.id}', channel_name)
+
+        self.assertEqual(dispatch_outbox(), 1)
+        self.assertFalse(OutboxMessage.objects.exists())
+        event = async_to_sync(channel_layer.receive)(channel_name)
+        self.assertEqual(event['message'], f"Nowe zamówienie nr.{self.order.order_id}.")
+
+    def test_failed_messages_are_retried_later(self):
+        from .jobs import dispatch_outbox
+        with patch('channels.layers.InMemoryChannelLayer.group_send', side_effect=ConnectionError('redis down')):
+            self.assertEqual(dispatch_outbox(), 0)
+        message = OutboxMessage.objects.get()
+        self.assertEqual(message.attempts, 1)
+        self.assertIn('redis down', message.last_error)
+        self.assertGreater(message.available_at, timezone.now())
+
+        self.assertEqual(dispatch_outbox(), 0)
+        OutboxMessage.objects.update(available_at=timezone.now())
+        self.assertEqual(dispatch_outbox(), 1)
@@ -10,7 +10,7 @@ from rest_framework.decorators import api_view
 from rest_framework.generics import ListAPIView, UpdateAPIView, CreateAPIView, DestroyAPIView, RetrieveAPIView, ListCreateAPIView, RetrieveUpdateAPIView, RetrieveUpdateDestroyAPIView, GenericAPIView
 from django.contrib.auth import authenticate
 from rest_framework_simplejwt.tokens import RefreshToken
-from django.db.models import Count
+from django.db.models import Count, Q
 from .serializers import *
 from .models import *
 from django.http import JsonResponse
@@ -24,6 +24,21 @@ import time
 import hashlib
 import stripe
 from django.http import HttpResponseRedirect
+from django.db import transaction
+from collections import defaultdict
+from .carts import get_cart_backend
+from .cache import versioned_key
+from .signals import RESTAURANTS_CACHE, CITIES_CACHE
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
+from django.utils.cache import get_conditional_response
+from .search import search_products, search_restaurants
+from django.core.cache import cache
+from rest_framework.utils.urls import replace_query_param
+from .pagination import OrderCursorPagination, NotificationCursorPagination, ChatMessageCursorPagination, OrderChangesPagination, BitsetPagination
+from .tagindex import tag_index, to_bitset, bitset_ids
+from .autocomplete import autocomplete_index, fold
+from .zones import zone_index
 
 #User
 class LoginView(APIView):
@@ -212,32 +227,58 @@ class RestaurantRegistrationView(CreateAPIView):
 class RestaurantListView(ListAPIView):
     serializer_class = RestaurantWithAddressSerializer
 
+    orderings = {
+        'popular': ('-popularity', 'id'),
+    }
+
     def get_queryset(self):
         city = self.request.query_params.get('city', None)
+        postal_code = normalize_postal_code(self.request.query_params.get('postal_code'))
+        ordering = self.orderings.get(self.request.query_params.get('ordering'), ('id',))
+        restaurants = Restaurant.objects.prefetch_related(*self.get_serializer_class().get_prefetches(self.request)).order_by(*ordering)
+        if postal_code is not None:
+            # Restauracje ze strefami tylko, gdy dowożą pod kod; bez stref jak przy zamówieniu - po mieście
+            restaurants = restaurants.exclude(id__in=zone_index.not_delivering(postal_code))
         if city:
-            return Restaurant.objects.filter(
-                address__city__iexact=city, address__isnull=False
-            ).distinct() | Restaurant.objects.filter(
-                delivery_cities__name__iexact=city
-            ).distinct()
-        return Restaurant.objects.filter(address__isnull=False).distinct()
+            return restaurants.filter(
+                id__in=RestaurantCity.objects.filter(city=normalize_city(city)).values('restaurant_id')
+            )
+        return restaurants.filter(
+            id__in=RestaurantCity.objects.filter(source='address').values('restaurant_id')
+        )
 
     def list(self, request, *args, **kwargs):
-        queryset = self.get_queryset()
-        if not queryset.exists():
-            city = self.request.query_params.get('city', None)
+        city = self.request.query_params.get('city', None)
+        ordering = self.request.query_params.get('ordering')
+        if ordering and ordering not in self.orderings:
+            return Response({"error": f"Nieznane sortowanie: {ordering}"}, status=status.HTTP_400_BAD_REQUEST)
+        postal_code = self.request.query_params.get('postal_code')
+        if postal_code and normalize_postal_code(postal_code) is None:
+            return Response({"error": f"Niepoprawny kod pocztowy: {postal_code}"}, status=status.HTTP_400_BAD_REQUEST)
+        sparse_fields, expand = self.get_serializer_class().requested_fields(request)
+        key = versioned_key(
+            RESTAURANTS_CACHE, 'list', normalize_city(city) if city else '', ordering or '',
+            ','.join(sorted(sparse_fields)) if sparse_fields is not None else '',
+            f"expand={','.join(sorted(expand))}" if expand is not None else '',
+            normalize_postal_code(postal_code) if postal_code else '',
+        )
+        data = cache.get(key)
+        if data is None:
+            data = self.get_serializer(self.get_queryset(), many=True).data
+            cache.set(key, data, settings.RESTAURANT_LIST_CACHE_TIMEOUT)
+
+        if not data:
             if city:
                 return Response({"error": f"Brak restauracji w mieście: {city}"}, status=status.HTTP_404_NOT_FOUND)
             return Response({"error": "Nie znaleziono restauracji"}, status=status.HTTP_404_NOT_FOUND)
-        serializer = self.get_serializer(queryset, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        return Response(data, status=status.HTTP_200_OK)
 
 
 class RestaurantProfileView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        serializer = RestaurantProfileSerializer(request.user)
+        serializer = RestaurantProfileSerializer(request.user, context={'request': request})
         return Response(serializer.data)
 
 class RestaurantUpdateView(UpdateAPIView):
@@ -266,15 +307,26 @@ class RestaurantUpdateView(UpdateAPIView):
 
         return Response(serializer.data)
     
+def city_list_etag(request, *args, **kwargs):
+    # Bez wspólnego cache wersja jest lokalna dla workera - ETag mógłby zwracać 304 dla zmienionej listy
+    if not settings.SHARED_CACHE:
+        return None
+    return f'W/"{versioned_key(CITIES_CACHE)}"'
+
 class CityListView(ListAPIView):
+    @method_decorator(condition(etag_func=city_list_etag))
     def get(self, request, *args, **kwargs):
-        address_cities = Address.objects.filter(owner_role='restaurateur').values('city').annotate(count=Count('city')).order_by('city')
-        address_city_names = {city['city'] for city in address_cities}
+        key = versioned_key(CITIES_CACHE, 'list')
+        all_city_names = cache.get(key)
+        if all_city_names is None:
+            address_cities = Address.objects.filter(owner_role='restaurateur').values('city').annotate(count=Count('city')).order_by('city')
+            address_city_names = {city['city'] for city in address_cities}
 
-        delivery_cities = City.objects.all().values('name').annotate(count=Count('name')).order_by('name')
-        delivery_city_names = {city['name'] for city in delivery_cities}
+            delivery_cities = City.objects.all().values('name').annotate(count=Count('name')).order_by('name')
+            delivery_city_names = {city['name'] for city in delivery_cities}
 
-        all_city_names = sorted(address_city_names.union(delivery_city_names))
+            all_city_names = sorted(address_city_names.union(delivery_city_names))
+            cache.set(key, all_city_names, settings.CITY_LIST_CACHE_TIMEOUT)
 
         return Response(all_city_names, status=status.HTTP_200_OK)
     
@@ -330,6 +382,39 @@ class RemoveDeliveryCityView(DestroyAPIView):
         
         return Response({"message": "City removed successfully"}, status=status.HTTP_200_OK)
     
+#DeliveryZone
+class DeliveryZoneListCreateView(ListCreateAPIView):
+    serializer_class = DeliveryZoneSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_restaurant(self):
+        try:
+            return Restaurant.objects.get(id=self.kwargs.get('restaurant_id'))
+        except Restaurant.DoesNotExist:
+            raise NotFound("Restaurant not found")
+
+    def get_queryset(self):
+        return DeliveryZone.objects.filter(restaurant=self.get_restaurant()).order_by('start')
+
+    def perform_create(self, serializer):
+        restaurant = self.get_restaurant()
+        if restaurant.owner != self.request.user:
+            raise PermissionDenied("You do not have permission to modify this restaurant's delivery zones.")
+        serializer.save(restaurant=restaurant)
+
+class DeliveryZoneDeleteView(DestroyAPIView):
+    serializer_class = DeliveryZoneSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_object(self):
+        try:
+            zone = DeliveryZone.objects.select_related('restaurant').get(id=self.kwargs.get('pk'), restaurant_id=self.kwargs.get('restaurant_id'))
+        except DeliveryZone.DoesNotExist:
+            raise NotFound("Delivery zone not found")
+        if zone.restaurant.owner != self.request.user:
+            raise PermissionDenied("You do not have permission to modify this restaurant's delivery zones.")
+        return zone
+
 #Cloudinary
 def generateUploadSignature(request):
     public_id = request.GET.get('public_id', get_random_string(10))  
@@ -422,17 +507,126 @@ class RestaurantTagListView(APIView):
         return Response(serializer.data, status=status.HTTP_200_OK)
     
 class FilterRestaurantsByTagsView(APIView):
+    """
+    GET: Restauracje z dowolnym (match=any) lub wszystkimi (match=all) tagami z `tags`,
+    bez tagów z `exclude`, opcjonalnie zawężone do miasta `city`.
+    """
+    pagination_class = BitsetPagination
+
     def get(self, request):
         tag_names = request.query_params.getlist('tags')
+        excluded = request.query_params.getlist('exclude')
+        match = request.query_params.get('match', 'any')
+        city = request.query_params.get('city')
 
-        if not tag_names:
+        if not tag_names and not excluded:
             return Response({"error": "No tags provided"}, status=status.HTTP_400_BAD_REQUEST)
+        if match not in ('any', 'all'):
+            return Response({"error": "Invalid match, expected 'any' or 'all'"}, status=status.HTTP_400_BAD_REQUEST)
+
+        bits = tag_index.select(tag_names, match=match, exclude=excluded)
+        if city and bits:
+            bits &= to_bitset(RestaurantCity.objects.filter(city=normalize_city(city)).values_list('restaurant_id', flat=True))
+
+        restaurants = Restaurant.objects.prefetch_related(*RestaurantSerializer.get_prefetches(request))
+        paginator = self.pagination_class()
+        # Bez cursor/page_size pełna lista jak dotychczas (frontend nie obsługuje nagłówka Link)
+        if not paginator.is_requested(request):
+            serializer = RestaurantSerializer(restaurants.filter(id__in=bitset_ids(bits)).order_by('id'), many=True, context={'request': request})
+            return Response(serializer.data)
+        restaurants = paginator.paginate_bitset(bits, restaurants, request)
+        serializer = RestaurantSerializer(restaurants, many=True, context={'request': request})
+        return paginator.get_paginated_response(serializer.data)
+    
+class SearchView(APIView):
+    """
+    GET: Wyszukuje restauracje (nazwa, opis, tagi) i produkty (nazwa, opis), posortowane wg trafności.
+    """
+    page_size = 20
+    max_page_size = 50
+
+    def get(self, request):
+        text = request.query_params.get('q', '').strip()
+        if len(text) < 2:
+            return Response({"error": "Query must be at least 2 characters long"}, status=status.HTTP_400_BAD_REQUEST)
 
-        restaurants = Restaurant.objects.filter(tags__name__in=tag_names).distinct()
+        try:
+            page = max(int(request.query_params.get('page', 1)), 1)
+            page_size = min(max(int(request.query_params.get('page_size', self.page_size)), 1), self.max_page_size)
+        except ValueError:
+            return Response({"error": "Invalid page"}, status=status.HTTP_400_BAD_REQUEST)
+
+        offset = (page - 1) * page_size
+        restaurants = list(search_restaurants(text)[offset:offset + page_size + 1])
+        products = list(search_products(text)[offset:offset + page_size + 1])
+        has_more = len(restaurants) > page_size or len(products) > page_size
+
+        return Response({
+            "restaurants": RestaurantSerializer(restaurants[:page_size], many=True).data,
+            "products": ProductSearchSerializer(products[:page_size], many=True).data,
+            "next": replace_query_param(request.build_absolute_uri(), 'page', page + 1) if has_more else None,
+        }, status=status.HTTP_200_OK)
+
+class RestaurantBrowseView(APIView):
+    """
+    GET: Restauracje dla wybranego miasta (`city`) i tagów (`tags`, `match`) wraz z liczbami
+    dla każdego tagu i opcji dostawy/płatności w obrębie tego wyboru.
+    """
+    pagination_class = BitsetPagination
+    option_fields = ['allows_delivery', 'allows_pickup', 'allows_online_payment', 'allows_cash_payment']
+
+    def get(self, request):
+        tag_names = request.query_params.getlist('tags')
+        match = request.query_params.get('match', 'all')
+        city = request.query_params.get('city')
+        if match not in ('any', 'all'):
+            return Response({"error": "Invalid match, expected 'any' or 'all'"}, status=status.HTTP_400_BAD_REQUEST)
+
+        served = RestaurantCity.objects.filter(city=normalize_city(city)) if city else RestaurantCity.objects.filter(source='address')
+        served_ids = served.values_list('restaurant_id', flat=True)
+        bits = tag_index.select(tag_names, match=match) & to_bitset(served_ids)
+        # Bez tagów wybór da się wyrazić podzapytaniem, więc nie przekazujemy listy id do bazy
+        restaurants = Restaurant.objects.filter(id__in=bitset_ids(bits) if tag_names else served_ids)
+
+        options = restaurants.aggregate(**{
+            field: Count('id', filter=Q(**{field: True})) for field in self.option_fields
+        })
+        tags = sorted(
+            ({"id": tag_id, "name": name, "count": count} for tag_id, (name, count) in tag_index.tag_counts(bits).items()),
+            key=lambda tag: tag['name'],
+        )
+
+        paginator = self.pagination_class()
+        page = paginator.paginate_bitset(bits, Restaurant.objects.prefetch_related(*RestaurantSerializer.get_prefetches(request)), request)
+        return paginator.get_paginated_response({
+            "count": bits.bit_count(),
+            "restaurants": RestaurantSerializer(page, many=True, context={'request': request}).data,
+            "facets": {"tags": tags, "options": options},
+        })
+
+class AutocompleteView(APIView):
+    """
+    GET: Podpowiedzi dla prefiksu `q` (bez rozróżniania wielkości liter i polskich znaków)
+    spośród miast, tagów i nazw restauracji; `types` zawęża rodzaje, `limit` to liczba wyników na rodzaj.
+    """
+    default_limit = 5
+    max_limit = 20
+
+    def get(self, request):
+        text = request.query_params.get('q', '')
+        types = request.query_params.get('types')
+        kinds = types.split(',') if types else list(autocomplete_index.kinds)
+        if set(kinds) - set(autocomplete_index.kinds):
+            return Response({"error": f"Invalid types, expected any of: {', '.join(autocomplete_index.kinds)}"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            limit = min(max(int(request.query_params.get('limit', self.default_limit)), 1), self.max_limit)
+        except ValueError:
+            return Response({"error": "Invalid limit"}, status=status.HTTP_400_BAD_REQUEST)
+
+        if not fold(text):
+            return Response({kind: [] for kind in kinds}, status=status.HTTP_200_OK)
+        return Response(autocomplete_index.search(text, kinds, limit), status=status.HTTP_200_OK)
 
-        serializer = RestaurantSerializer(restaurants, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
-    
 class RestaurantTagUpdateView(APIView):
     permission_classes = [IsAuthenticated]
     
@@ -483,33 +677,47 @@ class ProductCreateView(CreateAPIView):
         product_id = response.data['id']
         return Response({'id': product_id, 'message': 'Produkt dodany pomyślnie!'}, status=response.status_code)
         
-class ProductListView(ListAPIView):
-    serializer_class = ProductSerializer
-    #permission_classes = [IsAuthenticated]
+class MenuSnapshotMixin:
+    """
+    Menu restauracji serwowane z migawki w cache, kluczowanej wersją menu (Restaurant.menu_version),
+    z silnym ETagiem. Niezmienione menu nie wymaga zapytania do bazy ani serializacji.
+    """
+    menu_variant = None
 
-    def get_queryset(self):
+    def list(self, request, *args, **kwargs):
         restaurant_id = self.kwargs.get('restaurant_id')
-
         try:
-            restaurant = Restaurant.objects.get(id=restaurant_id)
+            version = Restaurant.get_menu_version(restaurant_id)
         except Restaurant.DoesNotExist:
             raise NotFound('Restauracja nie została znaleziona.')
 
-        return Product.objects.filter(restaurant=restaurant, is_available=True)
+        etag = f'"menu-{restaurant_id}-{version}-{self.menu_variant}-{request.accepted_renderer.format}"'
+        not_modified = get_conditional_response(request, etag=etag)
+        if not_modified is not None:
+            return not_modified
+
+        key = f'menu:{restaurant_id}:{version}:{self.menu_variant}'
+        data = cache.get(key)
+        if data is None:
+            data = self.get_serializer(self.get_queryset(), many=True).data
+            cache.set(key, data, settings.MENU_CACHE_TIMEOUT)
+        return Response(data, headers={'ETag': etag})
+
+class ProductListView(MenuSnapshotMixin, ListAPIView):
+    serializer_class = ProductSerializer
+    menu_variant = 'available'
+    #permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        return Product.objects.filter(restaurant_id=self.kwargs.get('restaurant_id'), is_available=True).order_by('id')
     
-class AllProductListView(ListAPIView):
+class AllProductListView(MenuSnapshotMixin, ListAPIView):
     serializer_class = ProductSerializer
+    menu_variant = 'all'
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
-        restaurant_id = self.kwargs.get('restaurant_id')
-
-        try:
-            restaurant = Restaurant.objects.get(id=restaurant_id)
-        except Restaurant.DoesNotExist:
-            raise NotFound('Restauracja nie została znaleziona.')
-
-        return Product.objects.filter(restaurant=restaurant, archived=False)
+        return Product.objects.filter(restaurant_id=self.kwargs.get('restaurant_id'), archived=False).order_by('id')
 
 
 class ProductDeleteView(DestroyAPIView):
@@ -559,104 +767,90 @@ class CartListCreateView(ListCreateAPIView):
     queryset = Cart.objects.all()
     serializer_class = CartSerializer
 
-    def get_queryset(self):
-        session_id = self.kwargs['session_id']
-        cart = Cart.objects.filter(session_id=session_id).first()
-        if cart:
-            CartItem.objects.filter(cart=cart, product__is_available=False).delete()
-        
-        stale_carts = Cart.objects.filter(created_at__lt=timezone.now() - timedelta(hours=24), order_id__isnull=True)
-        for stale_cart in stale_carts:
-            CartItem.objects.filter(cart=stale_cart).delete()
-            stale_cart.delete()
-            #stale_cart.update_timestamp() 
-            
-        return Cart.objects.filter(session_id=session_id)
+    def list(self, request, session_id, *args, **kwargs):
+        cart = get_cart_backend().get_cart(session_id)
+        return Response(self.get_serializer([cart] if cart else [], many=True).data)
 
-    def perform_create(self, serializer):
-        session_id = self.kwargs['session_id']
-        serializer.save(session_id=session_id)
+    def create(self, request, session_id, *args, **kwargs):
+        cart = get_cart_backend().create_cart(session_id)
+        return Response(self.get_serializer(cart).data, status=status.HTTP_201_CREATED)
 
 class CartItemListCreateView(ListCreateAPIView):
     queryset = CartItem.objects.all()
     serializer_class = CartItemSerializer
 
-    def get_queryset(self):
-        session_id = self.kwargs['session_id']
-        #cart = Cart.objects.get(session_id=session_id)
-        
-        stale_carts = Cart.objects.filter(created_at__lt=timezone.now() - timedelta(hours=24), order_id__isnull=True)
-        print(f"Stale carts to delete: {stale_carts}")
-        for stale_cart in stale_carts:
-            CartItem.objects.filter(cart=stale_cart).delete()
-            stale_cart.delete()
-            #stale_cart.update_timestamp()  
-        
-        cart = Cart.objects.get(session_id=session_id)
-        return CartItem.objects.filter(cart=cart)
-    
-    #def perform_create(self, serializer):
-    #    session_id = self.kwargs['session_id']
-    #    cart, created = Cart.objects.get_or_create(session_id=session_id)
-    #    serializer.save(cart=cart)
+    def list(self, request, session_id, *args, **kwargs):
+        cart = get_cart_backend().get_cart(session_id)
+        if cart is None:
+            raise NotFound('Cart not found')
+        return Response(self.get_serializer(cart.items.all(), many=True).data)
 
-    def perform_create(self, serializer):
-        session_id = self.kwargs['session_id']
-        product_id = self.request.data.get('product')
-        quantity = self.request.data.get('quantity', 1)
+    def create(self, request, session_id, *args, **kwargs):
+        operation = CartItemOperationSerializer(data=request.data)
+        operation.is_valid(raise_exception=True)
+        product_id = operation.validated_data['product']
+        quantity = operation.validated_data['quantity']
 
-        print(f"Creating cart item: session_id={session_id}, product_id={product_id}, quantity={quantity}")
-        
-        try:
-            product = Product.objects.get(id=product_id)
-        except Product.DoesNotExist:
-            print(f"Product with ID {product_id} not found")
+        product = Product.objects.filter(id=product_id).first()
+        if product is None:
             raise serializers.ValidationError("Product not found")
-        
-        cart, created = Cart.objects.get_or_create(session_id=session_id)
-        cart.update_timestamp() 
-        cart_item, created = CartItem.objects.get_or_create(cart=cart, product=product)
-        if not created:
-            cart_item.quantity += quantity
-        else:
-            cart_item.quantity = quantity
-        cart_item.save()
-        cart.update_total_price()
-        return Response(CartItemSerializer(cart_item).data, status=status.HTTP_201_CREATED)
+
+        cart = get_cart_backend().add_items(session_id, {product_id: product}, {product_id: quantity})
+        cart_item = next(item for item in cart.items.all() if item.product_id == product_id)
+        return Response(self.get_serializer(cart_item).data, status=status.HTTP_201_CREATED)
+
+class CartItemBulkCreateView(GenericAPIView):
+    serializer_class = CartItemOperationSerializer
+
+    def post(self, request, session_id, *args, **kwargs):
+        operations = request.data if isinstance(request.data, list) else request.data.get('items')
+        if not operations:
+            return Response({"error": "No items provided"}, status=status.HTTP_400_BAD_REQUEST)
+
+        serializer = self.get_serializer(data=operations, many=True)
+        serializer.is_valid(raise_exception=True)
+
+        quantities = defaultdict(int)
+        for operation in serializer.validated_data:
+            quantities[operation['product']] += operation['quantity']
+
+        products = Product.objects.in_bulk(list(quantities))
+        missing = sorted(set(quantities) - set(products))
+        if missing:
+            return Response({"error": "Product not found", "products": missing}, status=status.HTTP_400_BAD_REQUEST)
+
+        cart = get_cart_backend().add_items(session_id, products, dict(quantities))
+        return Response(CartSerializer(cart).data, status=status.HTTP_201_CREATED)
 
 class CartItemRetrieveUpdateDestroyView(RetrieveUpdateDestroyAPIView):
     queryset = CartItem.objects.all()
     serializer_class = CartItemSerializer
 
-    def get_queryset(self):
-        session_id = self.kwargs['session_id']
-        cart = Cart.objects.get(session_id=session_id)
-        return CartItem.objects.filter(cart=cart)
-    
+    def get_object(self):
+        cart_item = get_cart_backend().get_item(self.kwargs['session_id'], self.kwargs['pk'])
+        if cart_item is None:
+            raise NotFound('Cart item not found')
+        return cart_item
+
     def update(self, request, *args, **kwargs):
-        partial = kwargs.pop('partial', False)
         instance = self.get_object()
-        print('Received data:', request.data) 
-        serializer = self.get_serializer(instance, data=request.data, partial=partial)
-        if not serializer.is_valid():
-            print('Validation errors:', serializer.errors) 
+        serializer = self.get_serializer(data=request.data, partial=True)
         serializer.is_valid(raise_exception=True)
-        self.perform_update(serializer)
-
-        cart = instance.cart
-        cart.update_total_price() 
+        quantity = serializer.validated_data.get('quantity', instance.quantity)
+        cart_item = get_cart_backend().update_item(self.kwargs['session_id'], instance.id, quantity)
+        return Response(self.get_serializer(cart_item).data)
 
-        return Response(serializer.data)
+    def destroy(self, request, *args, **kwargs):
+        if not get_cart_backend().remove_item(self.kwargs['session_id'], self.kwargs['pk']):
+            raise NotFound('Cart item not found')
+        return Response(status=status.HTTP_204_NO_CONTENT)
     
 class ClearCartItemsFromOtherRestaurantsView(DestroyAPIView):
     def delete(self, request, session_id, restaurant_id, *args, **kwargs):
-        try:
-            cart = Cart.objects.get(session_id=session_id)
-        except Cart.DoesNotExist:
+        deleted = get_cart_backend().remove_other_restaurants(session_id, restaurant_id)
+        if deleted is None:
             return Response({"error": "Cart not found"}, status=status.HTTP_404_NOT_FOUND)
 
-        CartItem.objects.filter(cart=cart).exclude(product__restaurant_id=restaurant_id).delete()
-
         return Response({"message": "Produkty z innych restauracji zostały usunięte z koszyka."}, status=status.HTTP_200_OK)
 
 import logging
@@ -707,7 +901,7 @@ class OrderListCreateView(ListCreateAPIView):
             except Address.DoesNotExist:
                 raise serializers.ValidationError({"error": "Address not found"})
          
-        cart_id = self.request.data.get('cart')
+        cart_id = serializer.initial_data.get('cart')
         if cart_id:
             try:
                 cart = Cart.objects.get(id=cart_id)
@@ -715,8 +909,13 @@ class OrderListCreateView(ListCreateAPIView):
                 restaurant = CartItem.objects.filter(cart=cart).first().product.restaurant
                 if total_price < restaurant.minimum_order_amount:
                     raise serializers.ValidationError({"error": f"Minimalna kwota zamówienia dla {restaurant.name} to {restaurant.minimum_order_amount} PLN"})
-                if delivery_type == 'delivery' and address.city not in restaurant.delivery_cities.values_list('name', flat=True):
-                    raise serializers.ValidationError({"error": f"Restauracja {restaurant.name} nie dostarcza do miasta {address.city}"})
+                if delivery_type == 'delivery':
+                    if zone_index.has_zones(restaurant.id):
+                        postal_code = normalize_postal_code(address.postal_code)
+                        if postal_code is None or not zone_index.delivers(restaurant.id, postal_code):
+                            raise serializers.ValidationError({"error": f"Restauracja {restaurant.name} nie dostarcza pod kod pocztowy {address.postal_code}"})
+                    elif address.city not in restaurant.delivery_cities.values_list('name', flat=True):
+                        raise serializers.ValidationError({"error": f"Restauracja {restaurant.name} nie dostarcza do miasta {address.city}"})
             except Cart.DoesNotExist:
                 raise serializers.ValidationError({"error": "Cart not found"})
             
@@ -724,14 +923,24 @@ class OrderListCreateView(ListCreateAPIView):
         if cart_id:
             cart.order_id = order.order_id
             cart.session_id = None
-            cart.save()
+            cart.save(update_fields=['order_id', 'session_id'])
     
+    @transaction.atomic
     def create(self, request, *args, **kwargs):
-        serializer = self.get_serializer(data=request.data)
+        data = request.data
+        session_id = data.get('session_id')
+        if session_id and not data.get('cart'):
+            cart = get_cart_backend().checkout(session_id)
+            if cart is None:
+                return Response({"error": "Cart not found"}, status=status.HTTP_400_BAD_REQUEST)
+            data = data.copy()
+            data['cart'] = cart.id
+        serializer = self.get_serializer(data=data)
         serializer.is_valid(raise_exception=True)
         try:
             self.perform_create(serializer)
         except serializers.ValidationError as e:
+            transaction.set_rollback(True)
             return Response(e.detail, status=status.HTTP_400_BAD_REQUEST)
         headers = self.get_success_headers(serializer.data)
         return Response(
@@ -759,8 +968,7 @@ class OrderDetailView(RetrieveUpdateAPIView):
 
     def update(self, request, *args, **kwargs):
         order = self.get_object()
-        order.archive_if_needed()
-        if order.archived:
+        if order.is_archived:
             return Response({'error': 'Nie można modyfikować zarchiwizowanego zamówienia.'}, status=status.HTTP_403_FORBIDDEN)
         
         if order.status == 'suspended':
@@ -774,8 +982,13 @@ class OrderDetailView(RetrieveUpdateAPIView):
             #logger.warning(f"User {request.user.restaurant.id} does not have permission to update order {order.order_id}")
             return Response({'error': 'Nie masz uprawnień do modyfikacji tego zamówienia.'}, status=status.HTTP_403_FORBIDDEN)
 
-        if 'status' in data:
-            order.update_status(data['status'], data.get('description', ""))
+        if 'status' in data and data['status'] != order.status:
+            try:
+                order.update_status(data['status'], data.get('description', ""), expected_status=data.get('expected_status'))
+            except InvalidStatusTransition as e:
+                return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+            except StatusConflict as e:
+                return Response({'error': str(e)}, status=status.HTTP_409_CONFLICT)
             #notification = Notification.objects.create(
             #    user=order.user,
             #    order=order,
@@ -792,11 +1005,13 @@ class OrderDetailView(RetrieveUpdateAPIView):
             #    }
             #)
 
-        serializer = self.get_serializer(order, data=data, partial=True)
-        serializer.is_valid(raise_exception=True)
-        self.perform_update(serializer)
+        data = {key: value for key, value in data.items() if key not in ('status', 'description', 'expected_status')}
+        if data:
+            serializer = self.get_serializer(order, data=data, partial=True)
+            serializer.is_valid(raise_exception=True)
+            self.perform_update(serializer)
 
-        return Response(serializer.data)
+        return Response(self.get_serializer(order).data)
 
 class UserOrderListView(ListAPIView):
     
@@ -805,10 +1020,7 @@ class UserOrderListView(ListAPIView):
 
     def get_queryset(self):
         user = self.request.user
-        orders = Order.objects.filter(user=user, archived=False).order_by('-created_at')
-        for order in orders:
-            order.archive_if_needed()
-        return orders
+        return Order.objects.filter(user=user).active().order_by('-created_at').with_details()
 
 class UserOrderDetailView(RetrieveAPIView):
     
@@ -817,39 +1029,51 @@ class UserOrderDetailView(RetrieveAPIView):
 
     def get_queryset(self):
         user = self.request.user
-        orders = Order.objects.filter(user=user)
-        for order in orders:
-            order.archive_if_needed()
-        return orders
+        return Order.objects.filter(user=user).with_details()
 
 class RestaurantOrdersView(ListAPIView):
     #serializer_class = OrderSerializer
     serializer_class = OrderViewSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = OrderCursorPagination
 
     def get_queryset(self):
         restaurant_id = self.kwargs['restaurant_id']
-        orders = Order.objects.filter(restaurant_id=restaurant_id, archived=False)
-        for order in orders:
-            order.archive_if_needed()
-        return orders
+        return Order.objects.filter(restaurant_id=restaurant_id).active().with_details()
+    
+class RestaurantOrderChangesView(ListAPIView):
+    serializer_class = OrderViewSerializer
+    permission_classes = [IsAuthenticated]
+    pagination_class = OrderChangesPagination
+
+    def get_queryset(self):
+        restaurant_id = self.kwargs['restaurant_id']
+        if not hasattr(self.request.user, 'restaurant') or self.request.user.restaurant.id != restaurant_id:
+            raise PermissionDenied('Nie masz uprawnień do przeglądania zamówień tej restauracji.')
+
+        orders = Order.objects.filter(restaurant_id=restaurant_id)
+        if not self.request.query_params.get('cursor'):
+            orders = orders.active()
+        return orders.with_details()
     
 #ArchivedOrder
 class ArchivedUserOrderListView(ListAPIView):
     serializer_class = OrderViewSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = OrderCursorPagination
 
     def get_queryset(self):
         user = self.request.user
-        return Order.objects.filter(user=user, archived=True).order_by('-created_at')
+        return Order.objects.filter(user=user).archived().with_details()
 
 class ArchivedRestaurantOrdersView(ListAPIView):
     serializer_class = OrderViewSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = OrderCursorPagination
 
     def get_queryset(self):
         restaurant_id = self.kwargs['restaurant_id']
-        return Order.objects.filter(restaurant_id=restaurant_id, archived=True).order_by('-created_at')
+        return Order.objects.filter(restaurant_id=restaurant_id).archived().with_details()
 
 #Payment
 stripe.api_key = settings.STRIPE_SECRET_KEY
@@ -898,30 +1122,21 @@ class SuccessPaymentView(APIView):
 
         try:
             order = Order.objects.get(order_id=order_id)
-            order.is_paid = True
-            order.save()
-
-            OrderHistory.objects.create(
-                order=order,
-                status=order.status,
-                description="zapłacone"
-            )
-            
-            notification = Notification.objects.create(
-                user=order.restaurant.owner,
-                order=order,
-                message=f"Zamówienie nr.{order.order_id} zostało opłacone.",
-            )
-
-            channel_layer = get_channel_layer()
-            async_to_sync(channel_layer.group_send)(
-                f'notifications_{order.restaurant.owner.id}',
-                {
-                    'type': 'send_notification',
-                    'message': notification.message,
-                    'timestamp': notification.timestamp.isoformat()
-                }
-            )
+            with transaction.atomic():
+                order.is_paid = True
+                order.save()
+
+                OrderHistory.objects.create(
+                    order=order,
+                    status=order.status,
+                    description="zapłacone"
+                )
+                
+                Notification.send(
+                    user=order.restaurant.owner,
+                    order=order,
+                    message=f"Zamówienie nr.{order.order_id} zostało opłacone.",
+                )
 
             return HttpResponseRedirect(f'http://localhost:3000/user/orders/{order_id}?payment=success')
         except Order.DoesNotExist:
@@ -931,15 +1146,20 @@ class SuccessPaymentView(APIView):
 class ChatMessageListView(ListAPIView):
     serializer_class = ChatMessageSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = ChatMessageCursorPagination
 
     def get_queryset(self):
         room_name = self.kwargs['room_name']
-        return ChatMessage.objects.filter(room=room_name).order_by('timestamp')
+        # Pokoje czatu to id zamówień (indeks order, timestamp, id); inne nazwy po polu room
+        if room_name.isdecimal():
+            return ChatMessage.objects.filter(order_id=room_name)
+        return ChatMessage.objects.filter(room=room_name)
     
 #Notification
 class UnreadNotificationsListView(ListAPIView):
     serializer_class = NotificationSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = NotificationCursorPagination
 
     def get_queryset(self):
         return Notification.objects.filter(user=self.request.user, is_read=False)
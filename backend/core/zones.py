@@ -0,0 +1,85 @@
+import threading
+from bisect import bisect_right
+from collections import defaultdict
+from .cache import shared_version
+from .models import DeliveryZone
+
+DELIVERY_ZONES_CACHE = 'delivery_zones'
+
+def merge_ranges(ranges):
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return [tuple(interval) for interval in merged]
+
+class DeliveryZoneIndex:
+    """
+    Strefy dostawy skompilowane do indeksu przedziałów w pamięci procesu:
+    - dla każdej restauracji posortowane, rozłączne przedziały kodów (czy R dowozi pod kod X),
+    - globalnie podział osi kodów na segmenty o stałym zbiorze restauracji (kto dowozi pod kod X).
+    Oba zapytania to jedno wyszukiwanie binarne. Przebudowa po zmianie wersji w cache (sygnały);
+    bez wspólnego cache przy każdym użyciu.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.version = None
+        self.index = ({}, [], [])
+
+    def ensure_current(self):
+        version = shared_version(DELIVERY_ZONES_CACHE)
+        if version is None or version != self.version:
+            with self._lock:
+                if version is None or version != self.version:
+                    self.rebuild(version)
+
+    def rebuild(self, version):
+        ranges = defaultdict(list)
+        for restaurant_id, start, end in DeliveryZone.objects.values_list('restaurant_id', 'start', 'end'):
+            ranges[restaurant_id].append((start, end))
+        restaurants = {restaurant_id: merge_ranges(zones) for restaurant_id, zones in ranges.items()}
+
+        events = defaultdict(list)
+        for restaurant_id, zones in restaurants.items():
+            for start, end in zones:
+                events[start].append((restaurant_id, True))
+                events[end + 1].append((restaurant_id, False))
+        boundaries, segments, covering = [], [], set()
+        for point in sorted(events):
+            for restaurant_id, entering in events[point]:
+                if entering:
+                    covering.add(restaurant_id)
+                else:
+                    covering.discard(restaurant_id)
+            boundaries.append(point)
+            segments.append(frozenset(covering))
+
+        self.index = ({restaurant_id: ([start for start, _ in zones], zones) for restaurant_id, zones in restaurants.items()}, boundaries, segments)
+        self.version = version
+
+    def has_zones(self, restaurant_id):
+        self.ensure_current()
+        return restaurant_id in self.index[0]
+
+    def not_delivering(self, postal_code):
+        """Restauracje ze strefami, które nie dowożą pod kod; restauracji bez stref nie obejmuje."""
+        self.ensure_current()
+        zoned, boundaries, segments = self.index
+        position = bisect_right(boundaries, postal_code) - 1
+        return set(zoned) - (segments[position] if position >= 0 else frozenset())
+
+    def delivers(self, restaurant_id, postal_code):
+        self.ensure_current()
+        starts, zones = self.index[0].get(restaurant_id, ([], []))
+        position = bisect_right(starts, postal_code) - 1
+        return position >= 0 and postal_code <= zones[position][1]
+
+    def restaurants_for(self, postal_code):
+        self.ensure_current()
+        _, boundaries, segments = self.index
+        position = bisect_right(boundaries, postal_code) - 1
+        return segments[position] if position >= 0 else frozenset()
+
+zone_index = DeliveryZoneIndex()
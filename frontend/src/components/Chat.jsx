@@ -49,12 +49,20 @@ const Chat = ({ roomName, archived = false , mainUserId, restaurant = false}) =>
 
   useEffect(() => {
     let ws;
+    let pingInterval;
 
     const setupWebSocket = async () => {
       try {
         ws = await connectWebSocket(`ws://localhost:8000/ws/chat/${roomName}/`);
         setSocket(ws); 
 
+        // Ping podtrzymuje obecność w pokoju (wygasa po CHAT_PRESENCE_TIMEOUT = 60 s)
+        pingInterval = setInterval(() => {
+          if (ws.readyState === WebSocket.OPEN) {
+            ws.send(JSON.stringify({ type: 'ping' }));
+          }
+        }, 30000);
+
         ws.onmessage = (event) => {
           const data = JSON.parse(event.data);
           console.log('Received message from WebSocket:', data); 
@@ -83,6 +91,7 @@ const Chat = ({ roomName, archived = false , mainUserId, restaurant = false}) =>
     setupWebSocket();
 
     return () => {
+      clearInterval(pingInterval);
       if (ws) {
         ws.close();
       }
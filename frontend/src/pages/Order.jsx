@@ -16,7 +16,7 @@ const Order = () => {
   const navigate = useNavigate();
   const [selectedAddress, setSelectedAddress] = useState(null);
   const [addresses, setAddresses] = useState([]);
-  const { cartId, cartItems, setCartItems, refreshCart } = useContext(CartContext);
+  const { cartId, cartItems, setCartItems, refreshCart, restaurant } = useContext(CartContext);
   const [paymentType, setPaymentType] = useState('');
   const [deliveryType, setDeliveryType] = useState('');
   const [orderNotes, setOrderNotes] = useState('');
@@ -81,12 +81,16 @@ const Order = () => {
           console.log("isRestaurantSettingsLoaded:", isRestaurantSettingsLoaded);
           console.log("isAddressesLoaded:", isAddressesLoaded);
         }
+      } else if (restaurant) {
+        // Koszyk w Redis (CART_BACKEND) nie ma id; restauracja przychodzi razem z koszykiem
+        setRestaurantSettings(restaurant);
+        setIsRestaurantSettingsLoaded(true);
       } else {
         //console.error("Invalid cartId:", parsedCartId);
       }
     };
     fetchRestaurantSettings();
-  }, [cartId, token]);
+  }, [cartId, restaurant, token]);
 
   useEffect(() => {
       console.log(restaurantSettings);
@@ -152,6 +156,7 @@ const Order = () => {
     const orderData = {
       address: selectedAddress ? selectedAddress.id : null,
       cart: cartId,
+      session_id: sessionStorage.getItem('session_id'),
       //items: orderItems,
       user: user,
       restaurant: cartItems[0].product.restaurant,